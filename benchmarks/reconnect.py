@@ -0,0 +1,83 @@
+"""
+Link drops and reconnects of a DAQReceiver against the local simulator.
+
+    python -m benchmarks.reconnect
+
+drops the simulator's connection five times while the receiver streams
+into a ProcessingEngine, and prints how long each reconnect took and
+whether the history stayed in step with wall-clock time.
+"""
+
+import time
+
+from PyQt5.QtCore import Qt
+
+from utils.acquisition_profile import AcquisitionProfile
+from utils.daq_receiver import DAQReceiver
+from utils.processing import ProcessingEngine
+from utils.simulator import NovecentoSimulator
+
+
+def measure_reconnect(drops=5, interval=2.5, profile=None):
+    """
+    Drop the simulator's connection `drops` times, `interval` s apart,
+    while a DAQReceiver streams into a ProcessingEngine. Returns a list of
+    (s until the link was back, s until the next block, samples marked
+    as gap) per drop, plus the engine's history length and the samples
+    the simulator produced until the last block arrived.
+    """
+    profile = profile if profile is not None else AcquisitionProfile()
+    sim = NovecentoSimulator(profile).start()
+    daq = DAQReceiver(profile, host=sim.host, port=sim.port)
+    engine = ProcessingEngine(16, profile.aux_rate, profile.history_samples)
+    events = []
+    direct = Qt.DirectConnection
+    daq.data_received.connect(
+        lambda block: events.append(("block", time.monotonic(), 0)), direct
+    )
+    daq.stream_gap.connect(
+        lambda lost, skipped: events.append(("gap", time.monotonic(), lost)), direct
+    )
+    daq.reconnected.connect(
+        lambda seconds: events.append(("back", time.monotonic(), seconds)), direct
+    )
+    daq.data_received.connect(engine.submit, direct)
+    daq.stream_gap.connect(engine.mark_gap, direct)
+    try:
+        daq.start()
+        while sim.stream_start is None:
+            time.sleep(0.01)
+        started = sim.stream_start
+        drop_times = []
+        for _ in range(drops):
+            time.sleep(interval)
+            drop_times.append(time.monotonic())
+            sim.drop_client()
+        time.sleep(interval)
+    finally:
+        daq.stop()
+        daq.wait()
+        sim.stop()
+    engine.process_pending()
+    last_block = max(e[1] for e in events if e[0] == "block")
+    expected = (last_block - started) * profile.aux_rate
+
+    results = []
+    for dropped in drop_times:
+        after = [e for e in events if e[1] >= dropped]
+        back = next(e for e in after if e[0] == "back")
+        block = next(e for e in after if e[0] == "block")
+        gap = next((e[2] for e in after if e[0] == "gap"), 0)
+        results.append((back[1] - dropped, block[1] - dropped, gap))
+    return results, engine.history.total, expected
+
+
+if __name__ == "__main__":
+    results, total, expected = measure_reconnect()
+    print("drop -> link back (ms)   drop -> next block (ms)   gap (samples)")
+    for back, block, gap in results:
+        print(f"{back * 1e3:>22.1f} {block * 1e3:>25.0f} {gap:>15d}")
+    print(
+        f"history: {total} samples, {expected:.0f} expected from wall-clock "
+        f"time ({(total - expected) / 500 * 1e3:+.0f} ms)"
+    )
@@ -0,0 +1,397 @@
+"""
+Offset removal, MVC collection and a protocol session without a display.
+
+    python headless.py --simulate --protocol protocols/ramp_hold_session.json
+    python headless.py --replay session.nvrec --protocol protocols/... -o score.json
+    python headless.py --device --profile rig.json --protocol ... --record run.nvrec
+
+Blocks go through the same DecodePlan, ProcessingEngine and Recorder as
+the GUI. The steps follow the stream's sample count rather than the
+clock, so simulated and replayed sessions run as fast as they decode
+(--speed 1 paces them in real time) and give the same result every time.
+"""
+
+import argparse
+import json
+import queue
+import sys
+import time
+
+import numpy as np
+
+from utils.acquisition_profile import AcquisitionProfile
+from utils.decode_plan import DecodePlan
+from utils.gc_control import GC_MODES, GcPolicy, describe_pauses
+from utils.processing import ProcessingEngine
+from utils.protocol import TrialScorer, load_protocol
+from utils.recording import BLOCK, GAP, Recorder, RecordingReader
+from utils.simulator import settings_reply, simulated_frames
+
+
+def simulated_subject(timeline, offset_seconds, mvc_seconds, mvc_volts=1.0, seed=0):
+    """
+    AUX force function (see simulated_frames) of a subject that rests
+    during offset removal, pushes `mvc_volts` during MVC collection and
+    then tracks the timeline's target on every channel. The noise comes
+    from a generator seeded with `seed`, so a simulated session gives the
+    same report every time.
+    """
+    start = offset_seconds + mvc_seconds
+    rng = np.random.default_rng(seed)
+
+    def force(t):
+        aux = rng.normal(0.0, 0.002, (16, len(t)))
+        level = np.where((t >= offset_seconds) & (t < start), 100.0, 0.0)
+        if timeline is not None:
+            p = t - start
+            tracking = (p >= 0) & (p <= timeline.duration)
+            level[tracking] = timeline.target[timeline.index(p[tracking])]
+        aux += level / 100.0 * mvc_volts
+        return aux
+
+    return force
+
+
+class SimulatedSource:
+    """Simulator blocks generated on demand, without a connection."""
+
+    def __init__(self, profile, force_fn):
+        self.profile = profile
+        self.force_fn = force_fn
+        self.settings = settings_reply(profile.probe_types)
+
+    def __iter__(self):
+        config = self.profile.layout(self.settings)
+        columns = self.profile.columns
+        frame = 0
+        while True:
+            block = simulated_frames(config, frame, columns, self.force_fn)
+            yield BLOCK, np.frombuffer(block, dtype="<i2")
+            frame += columns
+
+    def close(self):
+        pass
+
+
+class ReplaySource:
+    """The blocks and gaps of a recording, in recorded order."""
+
+    def __init__(self, path):
+        self.reader = RecordingReader(path)
+        self.profile = self.reader.profile
+        self.settings = self.reader.settings
+
+    def __iter__(self):
+        gaps = iter(self.reader.gaps)
+        gap = next(gaps, None)
+        for k in range(len(self.reader)):
+            while gap is not None and gap[0] <= k:
+                yield GAP, gap[1]
+                gap = next(gaps, None)
+            yield BLOCK, self.reader.block(k)
+        while gap is not None:
+            yield GAP, gap[1]
+            gap = next(gaps, None)
+
+    def close(self):
+        self.reader.close()
+
+
+class DeviceSource:
+    """
+    Raw blocks and stream gaps of a DAQReceiver, handed over from its
+    thread through a queue. Ends when the receiver disconnects.
+    """
+
+    def __init__(self, profile, host=None, port=None):
+        from PyQt5.QtCore import Qt
+
+        from utils.daq_receiver import DAQReceiver
+
+        self.profile = profile
+        self.daq = DAQReceiver(profile, host=host, port=port)
+        self.events = queue.Queue()
+        direct = Qt.DirectConnection
+        self.daq.block_received.connect(
+            lambda block: self.events.put((BLOCK, block)), direct
+        )
+        self.daq.stream_gap.connect(
+            lambda lost, skipped: self.events.put((GAP, lost)), direct
+        )
+        self.daq.error.connect(
+            lambda message: self.events.put(("error", message)), direct
+        )
+        self.daq.disconnected.connect(lambda: self.events.put((None, None)), direct)
+
+    @property
+    def settings(self):
+        return self.daq.settings
+
+    def __iter__(self):
+        self.daq.start()
+        while True:
+            kind, item = self.events.get()
+            if kind is None:
+                return
+            if kind == "error":
+                raise OSError(item)
+            yield kind, item
+
+    def close(self):
+        self.daq.stop()
+        self.daq.wait()
+
+
+class HeadlessSession:
+    """
+    Runs the GUI's steps on a source of raw blocks: offsets are the mean
+    of the first `offset_seconds`, MVCs the peak of the next `mvc_seconds`
+    (both measured by the ProcessingEngine when the block that ends the
+    step has been processed), then the timeline is scored with a
+    TrialScorer from the sample after the MVC step. Blocks and gaps are
+    recorded to `record` when given. The collector follows a GcPolicy in
+    `gc_mode` (the profile's by default) for the protocol, collecting when
+    a trial ends.
+    """
+
+    def __init__(
+        self,
+        profile,
+        channels,
+        timeline=None,
+        offset_seconds=1.0,
+        mvc_seconds=2.0,
+        record=None,
+        tolerance=5.0,
+        gc_mode=None,
+    ):
+        self.profile = profile
+        self.channels = list(channels)
+        self.timeline = timeline
+        self.rate = profile.aux_rate
+        self.engine = ProcessingEngine(
+            16,
+            self.rate,
+            profile.history_samples,
+            profile.sample_dtype,
+            profile.sample_scale,
+        )
+        self.offset_samples = round(offset_seconds * self.rate)
+        self.mvc_samples = round(mvc_seconds * self.rate)
+        self.protocol_start = self.offset_samples + self.mvc_samples
+        # Without a protocol the session lasts as long as the source
+        self.end = None
+        self.scorer = None
+        if timeline is not None:
+            self.end = self.protocol_start + int(np.ceil(timeline.duration * self.rate))
+            self.scorer = TrialScorer(timeline, len(self.channels), tolerance)
+        self.record = record
+        self.recorder = None
+        self.plan = None
+        self.offsets = None
+        self.mvc_values = None
+        # AUX samples of the stream so far, and those lost in gaps
+        self.samples = 0
+        self.gap_samples = 0
+        self.gc_policy = GcPolicy(profile.gc_mode if gc_mode is None else gc_mode)
+        self.last_trial = -1
+
+    def run(self, source, speed=0.0, max_seconds=None):
+        """
+        Process `source` until the session ends, the source runs out,
+        `max_seconds` of stream have passed or Ctrl+C; returns report().
+        With `speed` > 0 the stream is paced at that multiple of real time.
+        """
+        end = self.end
+        if max_seconds is not None:
+            limit = round(max_seconds * self.rate)
+            end = limit if end is None else min(end, limit)
+        self.gc_policy.start()
+        started = time.perf_counter()
+        try:
+            for kind, item in source:
+                if kind == BLOCK:
+                    self.process_block(item, source.settings)
+                else:
+                    self.process_gap(item)
+                if end is not None and self.samples >= end:
+                    break
+                if speed > 0:
+                    due = started + self.samples / self.rate / speed
+                    delay = due - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            source.close()
+            if self.recorder is not None:
+                self.recorder.close()
+            self.gc_policy.end_protocol()
+        self.elapsed = time.perf_counter() - started
+        report = self.report()
+        self.gc_policy.stop()
+        return report
+
+    def process_block(self, block, settings):
+        if self.plan is None:
+            self.plan = DecodePlan(self.profile.layout(settings))
+            if self.record is not None:
+                self.recorder = Recorder(self.record, self.profile, settings).start()
+        if self.recorder is not None:
+            # Faster than real time the recorder would fall behind its
+            # queue and record the overflow as gaps, so wait for it
+            self.recorder.write_block(block, wait=True)
+        if self.profile.sample_dtype == "int16":
+            aux = self.plan.decode_raw(block, out=self.plan.empty_raw_output())
+        else:
+            aux = self.plan.decode(block, out=self.plan.empty_output())
+        first = self.samples
+        self.engine.submit(aux)
+        self.engine.process_pending()
+        self.samples += aux.shape[1]
+        self.advance()
+        if self.scorer is not None and self.samples > self.protocol_start:
+            skip = max(self.protocol_start - first, 0)
+            values = self.engine.normalizer(
+                aux[self.channels, skip:], channels=self.channels
+            )
+            t = first + skip - self.protocol_start + np.arange(values.shape[1])
+            self.scorer.add(t / self.rate, values)
+            trial = self.timeline.trial[self.timeline.index(t[-1] / self.rate)]
+            if trial < 0 <= self.last_trial:
+                self.gc_policy.rest()
+            self.last_trial = trial
+
+    def process_gap(self, samples):
+        # Held samples are kept in the history but not scored
+        if self.recorder is not None:
+            self.recorder.write_gap(samples)
+        self.engine.mark_gap(samples)
+        self.engine.process_pending()
+        self.samples += samples
+        self.gap_samples += samples
+        self.advance()
+
+    def advance(self):
+        """Take offsets and MVCs once their steps are complete."""
+        if self.offsets is None and self.samples >= self.offset_samples:
+            self.offsets = {i: 0.0 for i in self.channels}
+            if self.offset_samples:
+                future = self.engine.measure_offsets(self.channels, self.offset_samples)
+                self.engine.process_pending()
+                self.offsets = future.result()
+        if self.mvc_values is None and self.samples >= self.protocol_start:
+            self.mvc_values = {}
+            if self.mvc_samples:
+                future = self.engine.measure_mvc(self.channels, self.mvc_samples)
+                self.engine.process_pending()
+                self.mvc_values = future.result()
+                self.engine.set_mvc(self.mvc_values)
+            if self.timeline is not None:
+                self.gc_policy.begin_protocol()
+
+    def report(self):
+        seconds = self.samples / self.rate
+        return {
+            "channels": self.channels,
+            "offsets": self.offsets,
+            "mvc": self.mvc_values,
+            "trials": self.scorer.results() if self.scorer is not None else [],
+            "stream_seconds": seconds,
+            "gap_seconds": self.gap_samples / self.rate,
+            "elapsed": self.elapsed,
+            "speedup": seconds / self.elapsed if self.elapsed else None,
+            "recording": self.record if self.recorder is not None else None,
+            "gc": dict(mode=self.gc_policy.mode, **self.gc_policy.monitor.stats()),
+        }
+
+
+def print_report(report):
+    print(f"offsets: {report['offsets']}")
+    print(f"MVC: {report['mvc']}")
+    if report["trials"]:
+        print(f"{'trial':>5} {'name':>8} {'level':>6} {'RMSE':>8} {'within':>7}")
+        for k, trial in enumerate(report["trials"]):
+            if trial["rmse"] is None:
+                print(f"{k + 1:>5} {trial['name']:>8} {trial['level']:>6.1f} {'-':>8}")
+                continue
+            rmse = np.mean(trial["rmse"])
+            within = np.mean(trial["within"])
+            print(
+                f"{k + 1:>5} {trial['name']:>8} {trial['level']:>6.1f} "
+                f"{rmse:>8.2f} {within:>7.0%}"
+            )
+    speedup = report["speedup"]
+    print(
+        f"{report['stream_seconds']:.1f} s of stream ({report['gap_seconds']:.1f} s "
+        f"in gaps) in {report['elapsed']:.2f} s"
+        + (f", {speedup:.0f}x real time" if speedup else "")
+    )
+    print(f"{describe_pauses(report['gc'])} ({report['gc']['mode']})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--simulate", action="store_true", help="simulated subject")
+    source.add_argument("--replay", metavar="NVREC", help="recording to replay")
+    source.add_argument("--device", action="store_true", help="the Novecento")
+    parser.add_argument("--profile", help="acquisition profile (JSON)")
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--protocol", help="protocol definition (JSON)")
+    parser.add_argument("--seed", type=int, help="protocol seed")
+    parser.add_argument("--channels", type=int, nargs="+", default=[0])
+    parser.add_argument("--offset-seconds", type=float, default=1.0)
+    parser.add_argument("--mvc-seconds", type=float, default=2.0)
+    parser.add_argument("--tolerance", type=float, default=5.0, help="%%MVC")
+    parser.add_argument("--gc", choices=GC_MODES, help="default: the profile's")
+    parser.add_argument("--record", metavar="NVREC", help="record the blocks")
+    parser.add_argument(
+        "--speed", type=float, default=0.0, help="x real time (0: unpaced)"
+    )
+    parser.add_argument("--max-seconds", type=float, help="stop after this much")
+    parser.add_argument("-o", "--output", help="write the report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.simulate and args.protocol is None and args.max_seconds is None:
+        parser.error("--simulate needs --protocol or --max-seconds")
+    profile = AcquisitionProfile()
+    if args.profile:
+        profile = AcquisitionProfile.from_file(args.profile)
+    timeline = load_protocol(args.protocol, args.seed) if args.protocol else None
+    if args.replay:
+        source = ReplaySource(args.replay)
+        profile = source.profile
+    elif args.simulate:
+        force = simulated_subject(timeline, args.offset_seconds, args.mvc_seconds)
+        source = SimulatedSource(profile, force)
+    else:
+        source = DeviceSource(profile, args.host, args.port)
+    print(profile.summary(source.settings))
+
+    session = HeadlessSession(
+        profile,
+        args.channels,
+        timeline,
+        args.offset_seconds,
+        args.mvc_seconds,
+        args.record,
+        args.tolerance,
+        args.gc,
+    )
+    try:
+        report = session.run(source, args.speed, args.max_seconds)
+    except OSError as e:
+        print(f"Acquisition failed: {e}", file=sys.stderr)
+        return 1
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,28 @@
 import sys
 from PyQt5.QtWidgets import QApplication
+from utils.acquisition_profile import AcquisitionProfile
 from utils.daq_receiver import DAQReceiver
 from utils.mvc_window import MVCWindow
-from utils.protocol_window import ProtocolWindow
 
 
 def main():
     app = QApplication(sys.argv)
 
+    # Optional acquisition profile file as first argument
+    args = sys.argv[1:]
+    profile = AcquisitionProfile.from_file(args[0]) if args else AcquisitionProfile()
+    print(profile.summary())
+
     # Instantiate DAQ receiver (not started yet)
-    daq = DAQReceiver()
+    daq = DAQReceiver(profile, emg=profile.decode_emg)
 
     mvc_win = MVCWindow(daq)
 
     # When MVCWindow finishes it emits selected channels and offsets.
     def on_finished(selected_channels, offsets):
+        # The protocol window is only imported and built when needed
+        from utils.protocol_window import ProtocolWindow
+
         # Query mvc_values from mvc_win (already set at collection)
         mvc_values = mvc_win.mvc_values if hasattr(mvc_win, "mvc_values") else {}
         prot = ProtocolWindow(daq, selected_channels, mvc_values, offsets)
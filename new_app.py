@@ -1,5 +1,7 @@
+import logging
 import sys
 import socket
+import time
 import numpy as np
 import threading
 from PyQt5.QtWidgets import (
@@ -12,96 +14,37 @@ from PyQt5.QtWidgets import (
     QLineEdit,
     QPushButton,
     QScrollArea,
+    QFileDialog,
 )
 from PyQt5.QtCore import Qt, QTimer
 import pyqtgraph as pg
 
+from utils.acquisition_profile import AcquisitionProfile, CRC8
+from utils.auto_range import AxisRange
+from utils.decode_plan import StreamDecoder
+from utils.feedback import FeedbackCursor
+from utils.processing import ProcessingEngine
+from utils.protocol import Protocol, TrialScorer, load_protocol
+from utils.render_mode import (
+    curve_options,
+    make_pen,
+    make_plot_widget,
+    resolve_render_mode,
+)
+from utils.ring_buffer import TrailBuffer
+
 
 # ============================================================================
 # NOVECENTO CONFIGURATION AND HELPER FUNCTIONS
 # ============================================================================
 
 
-def CRC8(Vector, Len):
-    crc = 0
-    j = 0
-    while Len > 0:
-        Extract = Vector[j]
-        for i in range(8, 0, -1):
-            Sum = crc % 2 ^ Extract % 2
-            crc //= 2
-            if Sum > 0:
-                a = format(crc, "08b")
-                b = format(140, "08b")
-                str_list = [0] * 8
-                for k in range(8):
-                    str_list[k] = int(a[k] != b[k])
-                crc = int("".join(map(str, str_list)), 2)
-            Extract //= 2
-        Len -= 1
-        j += 1
-    return crc
-
-
 # Novecento Configuration
-PlotTime = 1
-Update_time = 50  # Faster update for real-time plotting
+Update_time = 16  # Display refresh (ms) for the feedback cursor
 offset = 2
 
-IN_Active = [0] * 10
-Mode = [0] * 10
-Gain = [0] * 10
-HRES = [0] * 10
-HPF = [0] * 10
-Fsamp = [0] * 10
-NumChan = [0] * 10
-Ptr_IN = [0] * 11
-Size_IN = [0] * 11
-
-ChVsType = [0, 14, 22, 38, 46, 70, 102, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-
-# Configure active inputs (matching your original script)
-IN_Active[0] = 1
-Mode[0] = 0
-Gain[0] = 0
-HRES[0] = 0
-HPF[0] = 1
-Fsamp[0] = 1
-
-IN_Active[1] = 1
-Mode[1] = 0
-Gain[1] = 0
-HRES[1] = 0
-HPF[1] = 1
-Fsamp[1] = 1
-
-IN_Active[2] = 1
-Mode[2] = 0
-Gain[2] = 0
-HRES[2] = 0
-HPF[2] = 1
-Fsamp[2] = 1
-
-# Rest are inactive
-for i in range(3, 10):
-    IN_Active[i] = 0
-    Mode[i] = 0
-    Gain[i] = 0
-    HRES[i] = 0
-    HPF[i] = 1
-    Fsamp[i] = 1 if i < 8 else 0
-
-AuxFsamp = [0, 16, 32, 48]
-FsampVal = [500, 2000, 4000, 8000]
-SizeAux = [16, 64, 128, 256]
-FSelAux = 0
-AnOutINSource = 2
-AnOutChan = 1
-AnOutGain = int("00100000", 2)
-
-TCPPort = 23456
-GainFactor = 0.0002861
-AuxGainFactor = 5 / 2**16 / 0.5
+# Device settings live in the shared acquisition profile
+PROFILE = AcquisitionProfile()
 
 
 # ============================================================================
@@ -150,7 +93,7 @@ class EntryBox(QWidget):
 
     def on_value_changed(self):
         if self.parent_window:
-            self.parent_window.update_plot()
+            self.parent_window.update_point(self.index, self.get_values())
 
     def get_values(self):
         try:
@@ -181,13 +124,30 @@ class MainWindow(QMainWindow):
         self.tcp_socket = None
         self.data_thread = None
         self.terminate_thread = threading.Event()
-        self.Data = None
-        self.Temp = None
+        self.stream_decoder = None
+        self.feedback = FeedbackCursor(
+            16, PROFILE.aux_rate, smoothing=PROFILE.feedback_smoothing
+        )
+        self._debug_counter = 0
+        self.daq_config = {}
         self.PacketSize1Block = 0
         self.blockData = 0
-        self.aux_baseline = None  # For offset removal
-        self.realtime_data_buffer = []  # Store real-time data points
-        self.realtime_time_buffer = []  # Store corresponding times
+        # Trail of real-time samples and their times (last 20 s)
+        self.realtime_trail = TrailBuffer(20 * PROFILE.aux_rate, 16)
+        # Baseline removal (mean of the first 50 samples), the feedback
+        # cursor and the trail run on the processing engine's thread; the
+        # GUI only draws its published frames.
+        self.engine = ProcessingEngine(
+            16,
+            PROFILE.aux_rate,
+            PROFILE.aux_rate,
+            baseline_samples=50,
+            feedback=self.feedback,
+            trail=self.realtime_trail,
+            trail_clock=self.trail_time,
+        )
+        self.frame_seq = 0
+        self.missed = 0
         self.experiment_start_time = 0  # Track when experiment starts
 
         # Left panel setup
@@ -233,6 +193,15 @@ class MainWindow(QMainWindow):
         add_btn.clicked.connect(self.add_entry_box)
         btn_layout.addWidget(add_btn)
 
+        load_btn = QPushButton("Load Protocol")
+        load_btn.clicked.connect(self.load_protocol_file)
+        btn_layout.addWidget(load_btn)
+
+        # Trial of a loaded protocol file, and its scores once finished
+        self.trial_label = QLabel("")
+        self.trial_label.setWordWrap(True)
+        btn_layout.addWidget(self.trial_label)
+
         self.start_btn = QPushButton("Start")
         self.start_btn.clicked.connect(self.start_animation)
         self.start_btn.setEnabled(False)
@@ -247,7 +216,8 @@ class MainWindow(QMainWindow):
         main_layout.addWidget(left_panel)
 
         # Plot setup
-        self.plot_widget = pg.PlotWidget()
+        self.render_mode = resolve_render_mode(PROFILE.render_mode)
+        self.plot_widget = make_plot_widget(self.render_mode)
         self.plot_widget.setBackground("#2b2b2b")
         self.plot_widget.setLabel(
             "left", "% MVC", **{"color": "#FFFFFF", "font-size": "12pt"}
@@ -256,6 +226,10 @@ class MainWindow(QMainWindow):
             "bottom", "Time (s)", **{"color": "#FFFFFF", "font-size": "12pt"}
         )
         self.plot_widget.showGrid(x=True, y=True, alpha=0.3)
+        # The view is set from the protocol and the cursor values instead of
+        # autorange, which rescans every curve
+        self.plot_widget.disableAutoRange()
+        self.y_axis = AxisRange()
         main_layout.addWidget(self.plot_widget)
 
         # Initialize plot curves
@@ -270,6 +244,13 @@ class MainWindow(QMainWindow):
         self.time_window = 10
         self.is_animating = False
         self.points = []
+        self.point_values = {}  # entry box index -> (time, %MVC)
+        # Set when a protocol file is loaded: the animation follows its
+        # trials and the cursor is scored against it
+        self.timeline = None
+        self.scorer = None
+        self.protocol = Protocol().compile()
+        self.create_curves()
 
         # Data update timer
         self.data_timer = QTimer()
@@ -284,7 +265,6 @@ class MainWindow(QMainWindow):
             self.entries_layout.addWidget(entry_box)
             entry_box.time_entry.setText(str(vals[0]))
             entry_box.mvc_entry.setText(str(vals[1]))
-        self.update_plot()
 
     # ========================================================================
     # NOVECENTO CONNECTION METHODS
@@ -294,7 +274,7 @@ class MainWindow(QMainWindow):
         try:
             # Connect to socket
             self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.tcp_socket.connect(("169.254.1.10", TCPPort))
+            self.tcp_socket.connect((PROFILE.host, PROFILE.port))
             print("Connected to the Socket")
 
             # Request firmware version
@@ -319,50 +299,22 @@ class MainWindow(QMainWindow):
                 print("Error CRC")
             print("Probes configuration:", settings[1:11])
 
-            # Build configuration string
-            ConfString = [0] * 15
-            ConfString[0] = (
-                int("10000000", 2) + AuxFsamp[FSelAux] + IN_Active[9] * 2 + IN_Active[8]
-            )
-            ConfString[1] = 0
-            for i in range(8):
-                ConfString[1] += IN_Active[i] * (2**i)
-            ConfString[2] = AnOutGain + AnOutINSource
-            ConfString[3] = AnOutChan
-            for i in range(10):
-                ConfString[4 + i] = (
-                    Mode[i] * 64 + Gain[i] * 16 + HPF[i] * 8 + HRES[i] * 4 + Fsamp[i]
-                )
-            ConfString[14] = CRC8(ConfString, 14)
-
-            # Send configuration
-            self.tcp_socket.sendall(bytearray(ConfString))
-
-            # Re-request settings after configuration (not used but matches original)
-            cmd = [1, CRC8([1], 1)]
-            self.tcp_socket.sendall(bytearray(cmd))
-            settings = self.tcp_socket.recv(20)
-
-            # Calculate packet size
-            NumActInputs = 0
-            Ptr_IN[0] = 0
-            for i in range(10):
-                NumChan[i] = ChVsType[settings[i + 1]]
-                if NumChan[i] == 0:
-                    IN_Active[i] = 0
-                if IN_Active[i] == 1:
-                    Size_IN[i] = (HRES[i] + 1) * FsampVal[Fsamp[i]] // 500 * NumChan[i]
-                    NumActInputs = NumActInputs + 1
-                Ptr_IN[i + 1] = Ptr_IN[i] + Size_IN[i]
-
-            self.PacketSize1Block = Ptr_IN[10] + SizeAux[FSelAux] + 128
-            self.blockData = self.PacketSize1Block * 500 * PlotTime * 2
+            # Packet layout is computed once per probe configuration
+            self.daq_config = PROFILE.layout(settings)
+            self.PacketSize1Block = self.daq_config["PacketSize1Block"]
+            self.blockData = self.daq_config["blockData"]
+            self.stream_decoder = StreamDecoder(self.daq_config, on_gap=self.on_gap)
 
             self.tcp_socket.setsockopt(
                 socket.SOL_SOCKET, socket.SO_RCVBUF, self.blockData * 2
             )
 
-            # Start data receiving thread
+            # Send configuration last: the device streams from here on, so
+            # no further request replies may be read from this socket
+            self.tcp_socket.sendall(PROFILE.conf_string())
+
+            # Start data receiving and processing threads
+            self.engine.start()
             self.terminate_thread.clear()
             self.data_thread = threading.Thread(target=self.receive_data)
             self.data_thread.start()
@@ -386,101 +338,78 @@ class MainWindow(QMainWindow):
             )
 
     def receive_data(self):
-        """Background thread to receive data from Novecento"""
-        buffer = b""
+        """Background thread to receive and decode data from Novecento"""
         while not self.terminate_thread.is_set():
             try:
-                chunk = self.tcp_socket.recv(self.blockData)
-                buffer += chunk
-                while len(buffer) >= self.blockData:
-                    packet = buffer[: self.blockData]
-                    buffer = buffer[self.blockData :]
-                    self.Temp = np.frombuffer(packet, dtype="<i2")
-                    if len(self.Temp) == self.PacketSize1Block * 500:
-                        self.Data = self.Temp.reshape(
-                            self.PacketSize1Block, 500, order="F"
-                        )
+                data = self.tcp_socket.recv(self.blockData)
+                if not data:
+                    break
+                arrival = time.monotonic()
+                # Frames are decoded as soon as a 20 ms chunk has arrived,
+                # exactly once, and handed to the processing engine
+                for aux_data in self.stream_decoder.feed(data):
+                    self.engine.submit(aux_data, arrival)
             except (OSError, ValueError) as e:
                 if not self.terminate_thread.is_set():
                     print(f"Error receiving data: {e}")
                 break
 
-    def update_realtime_data(self):
-        """Extract and display real-time aux channel data"""
-        if self.Data is None:
-            return
+    def on_gap(self, gap):
+        """Called on the receive thread when the stream lost frames or bytes"""
+        print(
+            f"Stream gap: {gap.lost_samples} sample(s) lost, "
+            f"{gap.skipped_bytes} byte(s) skipped to re-align"
+        )
 
-        try:
-            # Extract AUX channels
-            Temp = self.Data[Ptr_IN[10] : -128, :].reshape(
-                1, 16 * FsampVal[FSelAux] * PlotTime, order="F"
-            )
-            Sig_AUX = Temp.reshape(16, FsampVal[FSelAux] * PlotTime, order="F").astype(
-                np.int32
-            )
+    def trail_time(self):
+        """Trail time of the newest sample (None while not animating)"""
+        return self.current_time if self.is_animating else None
 
-            # Apply gain and convert to meaningful units
-            aux_data = Sig_AUX * AuxGainFactor
-
-            # Remove baseline offset (use first sample as baseline if not set)
-            if self.aux_baseline is None:
-                self.aux_baseline = np.mean(aux_data[:, :50], axis=1, keepdims=True)
-                print(f"Baseline set: {self.aux_baseline.flatten()[:4]}...")  # Debug
-
-            aux_data_zeroed = aux_data - self.aux_baseline
-
-            # Get current mean value for each channel
-            current_values = np.mean(aux_data_zeroed, axis=1)
-
-            # Debug print occasionally
-            if not hasattr(self, "_debug_counter"):
-                self._debug_counter = 0
-            self._debug_counter += 1
-            if self._debug_counter % 20 == 0:  # Print every 20 updates
-                print(f"Current values: {current_values[:4]}... (first 4 channels)")
-
-            # Calculate elapsed time
-            if self.is_animating:
-                elapsed_time = self.current_time
-
-                # Store the data points for trail
-                self.realtime_data_buffer.append(current_values)
-                self.realtime_time_buffer.append(elapsed_time)
-
-                # Keep buffer manageable (last 10000 points)
-                if len(self.realtime_data_buffer) > 10000:
-                    self.realtime_data_buffer.pop(0)
-                    self.realtime_time_buffer.pop(0)
-
-                # Update both trails and current points
-                if len(self.realtime_data_buffer) > 0:
-                    data_array = np.array(self.realtime_data_buffer)
-                    time_array = np.array(self.realtime_time_buffer)
-
-                    for i in range(min(16, len(self.realtime_curves))):
-                        if i < data_array.shape[1]:
-                            # Update trail line
-                            self.realtime_curves[i].setData(
-                                time_array, data_array[:, i]
-                            )
-                            # Update current point
-                            self.realtime_points[i].setData(
-                                [elapsed_time], [current_values[i]]
-                            )
-            else:
-                # When not animating, show the current point at time 0
-                if len(self.realtime_points) > 0:
-                    for i in range(min(16, len(self.realtime_points))):
-                        if i < len(current_values):
-                            self.realtime_points[i].setData([0], [current_values[i]])
-                            if self._debug_counter % 20 == 0 and i == 0:
-                                print(f"Setting point {i} at [0, {current_values[i]}]")
+    def update_realtime_data(self):
+        """Draw the engine's latest frame and move the feedback cursor"""
+        if self.engine.missed != self.missed:
+            self.missed = self.engine.missed
+            self.status_label.setText(
+                f"Status: Connected ({self.missed} chunk(s) missed)"
+            )
+        self.engine.trail_points = self.plot_widget.width()
 
-        except Exception as e:
-            print(f"Error processing real-time data: {e}")
-            import traceback
+        frame = self.engine.latest()
+        if frame is None or frame.cursor.last_time is None:
+            return
+        new_frame = frame.seq != self.frame_seq
+        self.frame_seq = frame.seq
+        self.update_feedback_points(frame, update_trail=new_frame)
+
+    def update_feedback_points(self, frame, update_trail):
+        """Move the cursor to the feedback value extrapolated to now"""
+        current_values = frame.cursor.value_at(time.monotonic())
+
+        # Logged occasionally, at debug level
+        self._debug_counter += 1
+        if self._debug_counter % 200 == 0:
+            logging.getLogger(__name__).debug(
+                "Current values: %s... (first 4 channels)", current_values[:4]
+            )
 
-            traceback.print_exc()
+        if self.is_animating:
+            if self.scorer is not None and self.start_delay <= 0:
+                # Scored as shown: the cursor at the animation time
+                self.scorer.add([self.current_time], current_values[:, None])
+            if update_trail and frame.trail is not None:
+                # Trails thinned to screen width by the engine
+                time_array, data_array = frame.trail
+                for i in range(min(16, len(self.realtime_curves))):
+                    self.realtime_curves[i].setData(time_array, data_array[i])
+            for i in range(min(16, len(self.realtime_points))):
+                self.realtime_points[i].setData(
+                    [self.current_time], [current_values[i]]
+                )
+        else:
+            # When not animating, show the current point at time 0
+            for i in range(min(16, len(self.realtime_points))):
+                self.realtime_points[i].setData([0], [current_values[i]])
+            self.fit_y(current_values)
 
     # ========================================================================
     # GUI CONTROL METHODS
@@ -490,93 +419,130 @@ class MainWindow(QMainWindow):
         entry_box = EntryBox(len(self.entry_boxes), self)
         self.entry_boxes.append(entry_box)
         self.entries_layout.addWidget(entry_box)
+
+    def create_curves(self):
+        """Create the target curve and the 16 aux trails/points once"""
+        self.target_curve = self.plot_widget.plot(
+            [],
+            [],
+            pen=make_pen((0, 150, 255), 5, self.render_mode),
+            name="Target",
+        )
+
+        # Real-time data curves and scatter points (16 aux channels)
+        colors = [
+            (255, 100, 100),
+            (100, 255, 100),
+            (255, 255, 100),
+            (255, 100, 255),
+            (100, 255, 255),
+            (255, 200, 100),
+            (200, 100, 255),
+            (100, 255, 200),
+            (255, 150, 150),
+            (150, 255, 150),
+            (255, 255, 150),
+            (255, 150, 255),
+            (150, 255, 255),
+            (255, 200, 150),
+            (200, 150, 255),
+            (150, 255, 200),
+        ]
+
+        self.realtime_curves = []
+        self.realtime_points = []
+
+        for i in range(16):
+            # Create line for trail
+            curve = self.plot_widget.plot(
+                [],
+                [],
+                pen=make_pen(colors[i], 2, self.render_mode),
+                name=f"AUX {i+1}",
+                **curve_options(self.render_mode),
+            )
+            # Create scatter point for current position
+            point = self.plot_widget.plot(
+                [],
+                [],
+                pen=None,
+                symbol="o",
+                symbolSize=10,
+                symbolBrush=pg.mkBrush(color=colors[i]),
+                symbolPen=None,
+            )
+            self.realtime_curves.append(curve)
+            self.realtime_points.append(point)
+
+    def update_point(self, index, values):
+        """Store one edited entry box value and refresh the target"""
+        if values is None:
+            self.point_values.pop(index, None)
+        else:
+            self.point_values[index] = values
         self.update_plot()
 
     def update_plot(self):
-        """Update the target trajectory plot"""
-        points = []
-        for entry_box in self.entry_boxes:
-            values = entry_box.get_values()
-            if values:
-                points.append(values)
-
-        points.sort(key=lambda x: x[0])
-        self.points = points
-
-        # Only clear and rebuild if we don't have curves yet, or if we're not connected
-        need_rebuild = (len(self.realtime_curves) == 0) or (self.tcp_socket is None)
-
-        if need_rebuild:
-            self.plot_widget.clear()
-            self.target_curve = None
-            self.realtime_curves = []
-            self.realtime_points = []
-
-        if points:
-            times = [p[0] for p in points]
-            mvcs = [p[1] for p in points]
-
-            # Plot target trajectory (or update it)
-            if need_rebuild:
-                self.target_curve = self.plot_widget.plot(
-                    times,
-                    mvcs,
-                    pen=pg.mkPen(color=(0, 150, 255), width=5),
-                    name="Target",
-                )
-            elif self.target_curve is not None:
-                self.target_curve.setData(times, mvcs)
-
-            # Initialize real-time data curves and scatter points (16 aux channels)
-            if need_rebuild:
-                colors = [
-                    (255, 100, 100),
-                    (100, 255, 100),
-                    (255, 255, 100),
-                    (255, 100, 255),
-                    (100, 255, 255),
-                    (255, 200, 100),
-                    (200, 100, 255),
-                    (100, 255, 200),
-                    (255, 150, 150),
-                    (150, 255, 150),
-                    (255, 255, 150),
-                    (255, 150, 255),
-                    (150, 255, 255),
-                    (255, 200, 150),
-                    (200, 150, 255),
-                    (150, 255, 200),
-                ]
-
-                self.realtime_curves = []
-                self.realtime_points = []
-
-                for i in range(16):
-                    # Create line for trail
-                    curve = self.plot_widget.plot(
-                        [],
-                        [],
-                        pen=pg.mkPen(color=colors[i], width=2),
-                        name=f"AUX {i+1}",
-                    )
-                    # Create scatter point for current position
-                    point = self.plot_widget.plot(
-                        [],
-                        [],
-                        pen=None,
-                        symbol="o",
-                        symbolSize=10,
-                        symbolBrush=pg.mkBrush(color=colors[i]),
-                        symbolPen=None,
-                    )
-                    self.realtime_curves.append(curve)
-                    self.realtime_points.append(point)
-
-            if not self.is_animating:
-                self.plot_widget.enableAutoRange()
+        """Recompile the target trajectory and redraw it"""
+        # Edited points replace a loaded protocol file
+        self.timeline = None
+        self.trial_label.setText("")
+        self.points = sorted(self.point_values.values(), key=lambda x: x[0])
+        self.protocol = Protocol.from_points(self.points).compile()
+
+        # The same compiled protocol is used for display and scoring
+        self.target_curve.setData(*self.protocol.render())
+
+        if not self.is_animating:
+            self.fit_view()
+
+    def fit_view(self):
+        """Show the whole protocol and the cursor at time 0"""
+        start = min(self.protocol.start_time, 0.0)
+        end = max(self.protocol.end_time, start + 1.0)
+        margin = 0.05 * (end - start)
+        self.plot_widget.setXRange(start - margin, end + margin, padding=0)
+        self.y_axis.reset()
+        self.fit_y()
+
+    def fit_y(self, values=None):
+        """Y range over the target and `values`, changed with hysteresis"""
+        low = min(0.0, self.protocol.min_level)
+        high = self.protocol.max_level
+        if values is not None and len(values):
+            low = min(low, float(np.min(values)))
+            high = max(high, float(np.max(values)))
+        view = self.y_axis.update(low, high)
+        if view is not None:
+            self.plot_widget.setYRange(*view, padding=0)
+
+    def load_protocol_file(self):
+        """Replace the hand-typed points with a multi-trial protocol file"""
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Load Protocol", "", "Protocol files (*.json)"
+        )
+        if not path:
+            return
+        try:
+            timeline = load_protocol(path)
+        except (OSError, ValueError, KeyError) as e:
+            self.trial_label.setText(f"Failed to load protocol: {e}")
+            return
+        self.set_timeline(timeline)
+
+    def set_timeline(self, timeline):
+        """Show a ProtocolTimeline as the target; Start then runs its trials"""
+        self.timeline = timeline
+        self.protocol = timeline.compiled
+        self.target_curve.setData(*self.protocol.render())
+        self.trial_label.setText(
+            f"{len(timeline.trials)} trials, {timeline.duration:.0f} s"
+        )
+        if not self.is_animating:
+            self.fit_view()
 
     def start_animation(self):
-        if not self.points:
+        if len(self.protocol) == 0:
             return
 
         self.is_animating = True
@@ -584,18 +550,19 @@ class MainWindow(QMainWindow):
         self.stop_btn.setEnabled(True)
 
         # Reset baseline and buffers
-        self.aux_baseline = None
-        self.realtime_data_buffer = []
-        self.realtime_time_buffer = []
+        self.engine.reset_baseline()
 
-        mvcs = [p[1] for p in self.points]
-        max_mvc = max(mvcs)
-        min_mvc = min(0, min(mvcs))
+        max_mvc = self.protocol.max_level
+        min_mvc = min(0, self.protocol.min_level)
         self.plot_widget.setYRange(min_mvc - 5, max_mvc + 10, padding=0)
 
-        times = [p[0] for p in self.points]
-        self.min_time = min(times)
-        self.max_time = max(times)
+        self.min_time = self.protocol.start_time
+        self.max_time = self.protocol.end_time
+        self.scorer = None
+        if self.timeline is not None:
+            self.min_time = 0.0
+            self.max_time = self.timeline.duration
+            self.scorer = TrialScorer(self.timeline, 16)
 
         padding = self.time_window / 2
         self.display_min = self.min_time - padding
@@ -631,6 +598,14 @@ class MainWindow(QMainWindow):
             QTimer.singleShot(int(self.end_delay * 1000), self.stop_animation)
             return
 
+        if self.timeline is not None:
+            trial = self.timeline.trial[self.timeline.index(self.current_time)]
+            self.trial_label.setText(
+                f"Trial {trial + 1} / {len(self.timeline.trials)}"
+                if trial >= 0
+                else "Rest"
+            )
+
         # Update view window
         x_start = self.current_time - self.time_window / 2
         x_end = self.current_time + self.time_window / 2
@@ -641,7 +616,19 @@ class MainWindow(QMainWindow):
         self.animation_timer.stop()
         self.start_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
-        self.plot_widget.enableAutoRange()
+        if self.scorer is not None:
+            self.trial_label.setText(self.score_summary(self.scorer.results()))
+            self.scorer = None
+        self.fit_view()
+
+    @staticmethod
+    def score_summary(results):
+        """RMS tracking error (mean over channels) of every scored trial"""
+        scored = [r for r in results if r["rmse"] is not None]
+        if not scored:
+            return "No trial scored"
+        lines = [f"{r['name']}: RMSE {np.mean(r['rmse']):.1f} %MVC" for r in scored]
+        return f"{len(scored)} / {len(results)} trials scored\n" + "\n".join(lines)
 
     def closeEvent(self, event):
         """Clean up when closing the application"""
@@ -662,6 +649,7 @@ class MainWindow(QMainWindow):
 
             if self.data_thread:
                 self.data_thread.join(timeout=2)
+            self.engine.stop()
 
             print("Socket closed")
 
@@ -669,7 +657,11 @@ class MainWindow(QMainWindow):
 
 
 def main():
+    global PROFILE
     app = QApplication(sys.argv)
+    if len(sys.argv) > 1:
+        PROFILE = AcquisitionProfile.from_file(sys.argv[1])
+    print(PROFILE.summary())
     window = MainWindow()
     window.show()
     sys.exit(app.exec_())
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from utils.auto_range import AxisRange, RangeTracker
+
+
+def test_tracker_matches_a_scan_of_the_covered_samples():
+    rng = np.random.default_rng(0)
+    stream = rng.normal(size=(3, 30000)).astype(np.float32)
+    tracker = RangeTracker(3, 400)
+    assert tracker.range() is None
+    sizes = rng.integers(0, 120, 200)
+    start = 0
+    for n in sizes:
+        tracker.append(stream[:, start : start + n])
+        start += n
+        if not len(tracker):
+            continue
+        # The window is covered by at most one chunk more than it needs
+        assert len(tracker) >= min(start, 400)
+        assert len(tracker) < 400 + max(sizes)
+        covered = stream[:, start - len(tracker) : start]
+        lo, hi = tracker.range()
+        np.testing.assert_array_equal(lo, covered.min(axis=1))
+        np.testing.assert_array_equal(hi, covered.max(axis=1))
+
+
+def test_spikes_expire_from_the_window():
+    tracker = RangeTracker(1, 100)
+    tracker.append(np.array([[50.0]]))
+    for _ in range(10):
+        tracker.append(np.zeros((1, 20)))
+    lo, hi = tracker.range()
+    assert (lo[0], hi[0]) == (0, 0)
+
+
+def test_axis_grows_at_once_and_shrinks_with_hysteresis():
+    axis = AxisRange(margin=0.1, shrink=0.5)
+    assert axis.update(0, 10) == (-1, 11)
+    # Small changes inside the view leave it alone
+    assert axis.update(1, 9) is None
+    # Leaving the view grows it immediately
+    assert axis.update(0, 20) == (-2, 22)
+    assert axis.update(3, 16) is None
+    # Shrinks once the data spans less than half of the view
+    assert axis.update(5, 10) == (4.5, 10.5)
+    axis.reset()
+    low, high = axis.update(3, 3)
+    assert high - low == pytest.approx(1.2 * axis.min_span)
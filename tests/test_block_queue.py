@@ -0,0 +1,56 @@
+import threading
+
+from utils.block_queue import BlockQueue
+
+
+def test_blocks_are_delivered_once_in_order():
+    queue = BlockQueue(maxlen=4)
+    assert [queue.put(k) for k in "abc"] == [0, 1, 2]
+    assert queue.drain() == [(0, "a"), (1, "b"), (2, "c")]
+    assert queue.last_consumed == 2
+    assert queue.drain() == [] and queue.last_consumed == 2
+
+
+def test_overflow_drops_the_oldest_and_leaves_a_sequence_gap():
+    queue = BlockQueue(maxlen=3)
+    for k in range(5):
+        queue.put(k)
+    assert queue.dropped == 2
+    items = queue.drain()
+    assert [seq for seq, _ in items] == [2, 3, 4]
+    # Nothing was consumed yet, so the first sequence is the dropped count
+    assert items[0][0] == queue.dropped
+    queue.clear()
+    assert (len(queue), queue.next_seq, queue.dropped) == (0, 0, 0)
+
+
+def test_concurrent_producer_loses_nothing_within_maxlen():
+    queue = BlockQueue(maxlen=10000)
+    received = []
+
+    def produce():
+        for k in range(5000):
+            queue.put(k)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    while producer.is_alive() or len(queue):
+        received.extend(block for _, block in queue.drain())
+    producer.join()
+    received.extend(block for _, block in queue.drain())
+    assert received == list(range(5000))
+    assert queue.dropped == 0
+
+
+def test_waiting_put_blocks_until_drained():
+    queue = BlockQueue(maxlen=2)
+    queue.put("a")
+    queue.put("b")
+    producer = threading.Thread(target=queue.put, args=("c", True))
+    producer.start()
+    producer.join(0.05)
+    assert producer.is_alive()
+    assert queue.drain() == [(0, "a"), (1, "b")]
+    producer.join(1.0)
+    assert not producer.is_alive()
+    assert queue.drain() == [(2, "c")] and queue.dropped == 0
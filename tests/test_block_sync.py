@@ -0,0 +1,97 @@
+import numpy as np
+
+from utils.acquisition_profile import ACCESSORY_ROWS, AcquisitionProfile
+from utils.block_sync import COUNTER_MODULUS, BlockSync
+from utils.simulator import COUNTER_ROW, simulated_frames
+
+COLUMNS = 50
+CONFIG = AcquisitionProfile().layout()
+FRAME = 2 * CONFIG["PacketSize1Block"]
+
+
+def frames(first, count):
+    return simulated_frames(CONFIG, first, count)
+
+
+def feed(sync, stream, piece=1000):
+    """All chunks from feeding `stream` in pieces of `piece` bytes."""
+    chunks = []
+    for i in range(0, len(stream), piece):
+        chunks += sync.feed(stream[i : i + piece])
+    return b"".join(chunk.tobytes() for chunk in chunks)
+
+
+def counters(data):
+    """Frame counter of every frame in `data`."""
+    words = np.frombuffer(data, dtype="<u2").reshape(-1, FRAME // 2)
+    return words[:, FRAME // 2 - ACCESSORY_ROWS + COUNTER_ROW]
+
+
+def test_aligned_stream_passes_unchanged():
+    stream = frames(0, 4 * COLUMNS)
+    sync = BlockSync(CONFIG, columns=COLUMNS)
+    assert feed(sync, stream) == stream
+    assert sync.locked
+    assert (sync.lost_frames, sync.skipped_bytes, len(sync.gaps)) == (0, 0, 0)
+
+
+def test_device_jump_is_reported_as_lost_frames():
+    gaps = []
+    stream = frames(0, 70) + frames(75, 130)
+    sync = BlockSync(CONFIG, columns=COLUMNS, on_gap=gaps.append)
+    assert feed(sync, stream) == stream
+    assert sync.lost_frames == 5
+    assert sync.skipped_bytes == 0
+    assert gaps == list(sync.gaps)
+    assert gaps[0].frame == 70
+    assert gaps[0].lost_frames == 5
+    assert gaps[0].lost_samples == 5 * sync.samples_per_frame
+
+
+def test_stray_bytes_are_skipped_without_losing_frames():
+    stream = frames(0, 4 * COLUMNS)
+    # 7 stray bytes in the middle of frame 120
+    cut = 120 * FRAME + FRAME // 2 + 1
+    sync = BlockSync(CONFIG, columns=COLUMNS)
+    data = feed(sync, stream[:cut] + bytes(7) + stream[cut:])
+    assert sync.lost_frames == 0
+    assert sync.skipped_bytes == 7
+    assert sync.resyncs == 1
+    assert len(data) == len(stream)
+    np.testing.assert_array_equal(counters(data), np.arange(4 * COLUMNS))
+    # Every frame but the one the stray bytes fell into is unchanged
+    assert data[: 120 * FRAME] == stream[: 120 * FRAME]
+    assert data[121 * FRAME :] == stream[121 * FRAME :]
+
+
+def test_counter_wraps_at_modulus():
+    first = COUNTER_MODULUS - 2 * COLUMNS + 10
+    stream = frames(first, 4 * COLUMNS)
+    sync = BlockSync(CONFIG, columns=COLUMNS)
+    assert feed(sync, stream) == stream
+    assert sync.lost_frames == 0
+
+    # A jump across the wrap counts the frames on both sides of it
+    stream = frames(COUNTER_MODULUS - 80, 70) + frames(COUNTER_MODULUS + 3, 130)
+    sync = BlockSync(CONFIG, columns=COLUMNS)
+    assert feed(sync, stream) == stream
+    assert sync.lost_frames == 13
+    assert sync.gaps[0].frame == COUNTER_MODULUS - 10
+
+
+def test_jump_near_chunk_end_waits_for_following_frames():
+    # The jump comes after frame 47 of the second chunk, so whether the
+    # counter continues can only be told from the third chunk
+    stream = frames(0, COLUMNS + 48) + frames(COLUMNS + 52, 2 * COLUMNS + 2)
+    sync = BlockSync(CONFIG, columns=COLUMNS)
+    chunk = sync.chunk_bytes
+    assert len(sync.feed(stream[: 2 * chunk])) == 1
+    assert sync.lost_frames == 0
+    # A few frames more are not enough to decide either
+    assert sync.feed(stream[2 * chunk : 2 * chunk + 3 * FRAME]) == []
+    rest = sync.feed(stream[2 * chunk + 3 * FRAME :])
+    assert len(rest) == 3
+    assert b"".join(c.tobytes() for c in rest) == stream[chunk:]
+    assert sync.lost_frames == 4
+    assert sync.skipped_bytes == 0
+    assert sync.gaps[0].frame == COLUMNS + 48
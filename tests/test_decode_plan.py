@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from utils.acquisition_profile import (
+    AcquisitionProfile,
+    FsampVal,
+    aux_gather_index,
+    input_gather_index,
+)
+from utils.decode_plan import DecodePlan, reshape_decode
+
+
+def random_block(config, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(-(2**15), 2**15, config["blockData"] // 2, dtype=np.int16)
+
+
+@pytest.mark.parametrize("fsel", range(len(FsampVal)))
+def test_decode_matches_reshape_decoder(fsel):
+    config = AcquisitionProfile(fsel_aux=fsel).layout()
+    block = random_block(config)
+    plan = DecodePlan(config)
+    np.testing.assert_allclose(plan.decode(block), reshape_decode(block, config))
+    raw = plan.decode_raw(block, out=plan.empty_raw_output())
+    np.testing.assert_array_equal(
+        raw,
+        block[
+            aux_gather_index(
+                config["Ptr_IN"][10],
+                config["PacketSize1Block"],
+                config["SizeAux"],
+                500,
+            )
+        ],
+    )
+
+
+def test_emg_views_match_gather_index():
+    profile = AcquisitionProfile(probe_types=[5, 1, 0, 0, 0, 0, 0, 0, 0, 0])
+    config = profile.layout()
+    block = random_block(config, seed=1)
+    plan = DecodePlan(config, emg=True)
+    out = plan.empty_output()
+    plan.decode(block, out=out)
+    _, emg = plan.views(out)
+    assert [i for i, _ in emg] == [0, 1]
+    for i, view in emg:
+        index = input_gather_index(
+            config["Ptr_IN"][i],
+            config["Size_IN"][i],
+            config["NumChan"][i],
+            config["PacketSize1Block"],
+            profile.columns,
+        )
+        expected = block[index] * np.float32(config["GainFactor"])
+        np.testing.assert_array_equal(view, expected)
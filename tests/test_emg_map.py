@@ -0,0 +1,53 @@
+import threading
+
+import numpy as np
+
+from utils.emg_map import PROBE_EXTRA_CHANNELS, GridRMS, electrode_grid
+
+
+def test_grid_rms_of_a_sine():
+    rate, n = 2000, 2000
+    t = np.arange(n) / rate
+    # Electrode k is a 50 Hz sine of amplitude k + 1
+    amplitude = np.arange(1, 65, dtype=np.float32)[:, None]
+    samples = np.zeros((64 + PROBE_EXTRA_CHANNELS, n), dtype=np.float32)
+    samples[:64] = amplitude * np.sin(2 * np.pi * 50 * t)
+    grid = GridRMS(samples.shape[0], rate, window=0.1)
+    assert grid.shape == electrode_grid(70) == (8, 8)
+    # Fed in chunks, as the receiver emits them
+    for chunk in np.split(samples, 50, axis=1):
+        grid.process(chunk)
+    expected = (amplitude / np.sqrt(2)).reshape(8, 8)
+    np.testing.assert_allclose(grid.map(), expected, rtol=1e-3)
+    # map() is a copy the GUI can keep
+    grid.reset()
+    assert grid.map().max() == 0
+    assert grid.map() is not grid.map()
+
+
+def test_map_window_processes_on_the_receiver_thread(qapp, monkeypatch):
+    from utils.daq_receiver import DAQReceiver
+    from utils.emg_map import EMGMapWindow
+
+    daq = DAQReceiver(emg=True)
+    window = EMGMapWindow(daq)
+    threads = []
+    process = GridRMS.process
+
+    def spy(grid, chunk):
+        threads.append(threading.current_thread())
+        return process(grid, chunk)
+
+    monkeypatch.setattr(GridRMS, "process", spy)
+    samples = np.ones((70, 40), dtype=np.float32)
+    emitter = threading.Thread(target=daq.emg_received.emit, args=(2, samples))
+    emitter.start()
+    emitter.join()
+    assert threads == [emitter]
+    assert window.input_box.count() == 0
+    window.refresh_map()
+    assert window.input_box.currentData() == 2
+    window.refresh_map()
+    assert window.status_label.text().startswith("8 x 8 electrodes")
+    window.close()
+    qapp.processEvents()
@@ -0,0 +1,142 @@
+import threading
+import tracemalloc
+
+import numpy as np
+
+from utils.acquisition_profile import AcquisitionProfile
+from utils.daq_receiver import DAQReceiver
+from utils.simulator import settings_reply, simulated_frames
+
+POOL_SIZE = DAQReceiver.FRAME_POOL_SIZE
+
+
+class FakeSocket:
+    """Answers the settings request, then streams `data` and closes."""
+
+    def __init__(self, settings, data):
+        self.replies = [settings, data]
+
+    def sendall(self, data):
+        pass
+
+    def recv(self, size):
+        return self.replies.pop(0) if self.replies else b""
+
+    def close(self):
+        pass
+
+
+def receiver(blocks, emg=False):
+    """A DAQReceiver connected to FakeSocket with `blocks` simulated blocks."""
+    profile = AcquisitionProfile(probe_types=[1] * 10)
+    settings = settings_reply(profile.probe_types)
+    config = profile.layout(settings)
+    data = simulated_frames(config, 0, profile.columns * blocks)
+    daq = DAQReceiver(profile, emg=emg)
+
+    def open_socket():
+        daq.tcp_socket = FakeSocket(settings, data)
+
+    daq.open_socket = open_socket
+    daq.running = True
+    daq.connect_daq()
+    return daq
+
+
+def test_pooled_decode_allocates_less_than_a_frame():
+    daq = receiver(POOL_SIZE * 3, emg=True)
+    frame_bytes = daq.decode_plan.empty_output().nbytes
+    peaks = []
+    in_use = []
+
+    def block_received(_):
+        # Peak since the previous block, above what was in use then
+        current, peak = tracemalloc.get_traced_memory()
+        if in_use:
+            peaks.append(peak - in_use[0])
+        in_use[:] = [current]
+        tracemalloc.reset_peak()
+
+    daq.block_received.connect(block_received)
+    tracemalloc.start()
+    try:
+        assert daq.receive() == DAQReceiver.CLOSED
+    finally:
+        tracemalloc.stop()
+    assert len(peaks) == POOL_SIZE * 3 - 1
+    assert max(peaks) < frame_bytes, (max(peaks), frame_bytes)
+    assert daq.frames.fallbacks == 0
+
+
+def test_held_frames_are_never_overwritten():
+    daq = receiver(POOL_SIZE * 2 + 3)
+    held = []
+    copies = []
+
+    def data_received(aux):
+        held.append(aux)
+        copies.append(aux.copy())
+
+    daq.data_received.connect(data_received)
+    assert daq.receive() == DAQReceiver.CLOSED
+    assert len(held) == POOL_SIZE * 2 + 3
+    for aux, copy in zip(held, copies):
+        np.testing.assert_array_equal(aux, copy)
+    # Every block after the first POOL_SIZE found all pooled frames in use
+    assert daq.frames.fallbacks == len(held) - POOL_SIZE
+
+
+def test_slow_queued_consumer_keeps_a_frame_across_receives(qapp):
+    from PyQt5.QtCore import QObject, Qt
+
+    class Consumer(QObject):
+        """Lives on the GUI thread and only runs when events are processed."""
+
+        def __init__(self):
+            super().__init__()
+            self.seen = []
+            self.kept = None
+
+        def on_data(self, aux):
+            self.seen.append(aux.copy())
+            if self.kept is None:
+                self.kept = aux
+
+    blocks = POOL_SIZE + 3
+    daq = receiver(blocks)
+    emitted = []
+    consumer = Consumer()
+    # What each frame held when it was emitted, and the same frames queued
+    daq.data_received.connect(
+        lambda aux: emitted.append(aux.copy()), Qt.DirectConnection
+    )
+    daq.data_received.connect(consumer.on_data, Qt.QueuedConnection)
+
+    def run():
+        before = len(consumer.seen)
+        thread = threading.Thread(target=daq.receive)
+        thread.start()
+        thread.join()
+        # Every frame was emitted before the consumer saw the first one
+        assert len(consumer.seen) == before
+        qapp.processEvents()
+
+    run()
+    assert len(consumer.seen) == blocks
+    kept = consumer.kept.copy()
+    reused = daq.frames.reused
+
+    # The link comes back with the next blocks of the stream
+    config = daq.daq_config
+    data = simulated_frames(
+        config, blocks * daq.profile.columns, daq.profile.columns * blocks
+    )
+    # Reconnected with the cached layout: no settings reply this time
+    daq.tcp_socket = FakeSocket(data, b"")
+    run()
+    assert len(consumer.seen) == len(emitted) == 2 * blocks
+    for seen, copy in zip(consumer.seen, emitted):
+        np.testing.assert_array_equal(seen, copy)
+    np.testing.assert_array_equal(consumer.kept, kept)
+    # Frames the queue let go of were reused, the kept one was not
+    assert daq.frames.reused > reused
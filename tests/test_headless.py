@@ -0,0 +1,52 @@
+import json
+
+from headless import main
+from utils.recording import RecordingReader
+
+PROTOCOL = {
+    "seed": 3,
+    "repetitions": 2,
+    "shuffle": True,
+    "lead_in": 0.5,
+    "rest": {"min": 0.5, "max": 1.0},
+    "trials": [
+        {"name": "low", "level": [10, 20], "segments": [["hold", 1, "level"]]},
+        {
+            "name": "ramp",
+            "level": {"min": 25, "max": 40},
+            "segments": [["ramp", 1, "level"], ["hold", 0.5, "level"]],
+        },
+    ],
+}
+
+
+def run_simulated(tmp_path, name):
+    protocol = tmp_path / "protocol.json"
+    protocol.write_text(json.dumps(PROTOCOL))
+    output = tmp_path / f"{name}.json"
+    record = tmp_path / f"{name}.nvrec"
+    argv = ["--simulate", "--protocol", str(protocol), "--channels", "0", "3"]
+    argv += ["--offset-seconds", "1", "--mvc-seconds", "2", "-o", str(output)]
+    assert main(argv + ["--record", str(record)]) == 0
+    return json.loads(output.read_text()), record
+
+
+def test_simulated_sessions_give_the_same_report(tmp_path, capsys):
+    first, record = run_simulated(tmp_path, "first")
+    again, _ = run_simulated(tmp_path, "again")
+    for key in ("channels", "offsets", "mvc", "trials", "stream_seconds"):
+        assert first[key] == again[key]
+    assert len(first["trials"]) == 4
+    for trial in first["trials"]:
+        assert trial["samples"] > 0
+        assert max(trial["rmse"]) < 5
+    assert first["gap_seconds"] == 0
+
+    # The unpaced session waited for the recorder: every block was kept
+    reader = RecordingReader(record)
+    try:
+        assert reader.gaps == []
+        # One-second blocks at the default profile
+        assert len(reader) == round(first["stream_seconds"])
+    finally:
+        reader.close()
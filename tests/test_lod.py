@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from utils import lod
+from utils.acquisition_profile import AcquisitionProfile, stream_indices
+from utils.lod import LodBuilder, LodReader, LodWriter, choose_level
+from utils.recording import emg_like_blocks
+
+
+def reference_bins(samples, level):
+    """(3, channels, bins) min, max and rounded mean of 2**level samples."""
+    size = 1 << level
+    pieces = [samples[:, k : k + size] for k in range(0, samples.shape[1], size)]
+    return np.stack(
+        [
+            np.stack([p.min(axis=1) for p in pieces], axis=1),
+            np.stack([p.max(axis=1) for p in pieces], axis=1),
+            np.stack([np.rint(p.mean(axis=1)) for p in pieces], axis=1),
+        ]
+    ).astype(np.int16)
+
+
+def test_builder_bins_every_level_incrementally():
+    rng = np.random.default_rng(0)
+    stream = rng.integers(-30000, 30000, (2, 1000)).astype(np.int16)
+    builder = LodBuilder(2, base=2, top=6)
+    levels = {}
+    start = 0
+    for n in rng.integers(0, 50, 60):
+        for level, bins in builder.append(stream[:, start : start + n]):
+            levels.setdefault(level, []).append(bins)
+        start += n
+    # The partial bins at the end come from finish()
+    for level, bins in builder.finish():
+        levels.setdefault(level, []).append(bins)
+    assert sorted(levels) == list(range(2, 7))
+    for level, pieces in levels.items():
+        np.testing.assert_array_equal(
+            np.concatenate(pieces, axis=2), reference_bins(stream[:, :start], level)
+        )
+
+
+def test_choose_level():
+    assert choose_level(1000, 2000) == 0
+    assert choose_level(4096, 1000) == 3
+    assert choose_level(2**40, 1, top=24) == 24
+
+
+def test_writer_and_reader_round_trip(tmp_path, monkeypatch):
+    # Small records, so ranges span several of them
+    monkeypatch.setattr(lod, "FLUSH_BINS", 4)
+    profile = AcquisitionProfile()
+    config = profile.layout()
+    blocks = emg_like_blocks(config, 3)
+    path = tmp_path / "session.nvlod"
+    writer = LodWriter(path, config, profile.columns)
+    writer.append_block(blocks[0])
+    writer.gap(700)
+    writer.append_block(blocks[1])
+    writer.append_block(blocks[2])
+    writer.close()
+
+    index = stream_indices(config, profile.columns)[0]
+    first = np.take(blocks[0], index)
+    aux = np.concatenate(
+        [
+            first,
+            np.repeat(first[:, -1:], 700, axis=1),
+            np.take(blocks[1], index),
+            np.take(blocks[2], index),
+        ],
+        axis=1,
+    )
+    reader = LodReader(path)
+    assert reader.streams[0]["channels"] == aux.shape[0]
+    expected = reference_bins(aux, reader.base)
+    assert reader.bins(0, reader.base) == expected.shape[2]
+    assert reader.samples(0) >= aux.shape[1]
+    np.testing.assert_array_equal(
+        reader.range(0, reader.base, 3, 30), expected[..., 3:30]
+    )
+    np.testing.assert_array_equal(
+        reader.range(0, reader.base + 2, 0, 10**6, channels=[1]),
+        reference_bins(aux, reader.base + 2)[:, [1]],
+    )
+    assert reader.range(0, reader.base, 10**6, 10**6 + 5).shape[2] == 0
+    reader.close()
+
+    # A pyramid cut off mid-record is read up to its last complete record
+    data = path.read_bytes()
+    path.write_bytes(data[: len(data) - 10])
+    reader = LodReader(path)
+    assert 0 < reader.bins(0, reader.base) <= expected.shape[2]
+    reader.close()
+
+
+def test_reader_rejects_other_files(tmp_path):
+    path = tmp_path / "other.nvlod"
+    path.write_bytes(b"not a pyramid")
+    with pytest.raises(ValueError):
+        LodReader(path)
@@ -0,0 +1,47 @@
+import numpy as np
+
+from utils.feedback import CursorState
+from utils.processing import DisplayFrame
+from utils.protocol import build_timeline
+
+DEFINITION = {
+    "lead_in": 1,
+    "rest": 1,
+    "trials": [
+        {"name": "low", "level": 10, "segments": [["hold", 1, "level"]]},
+        {"name": "high", "level": 30, "segments": [["hold", 1, "level"]]},
+    ],
+}
+
+
+def test_animation_follows_and_scores_a_loaded_timeline(qapp):
+    from new_app import MainWindow
+
+    window = MainWindow()
+    try:
+        timeline = build_timeline(DEFINITION)
+        window.set_timeline(timeline)
+        window.start_animation()
+        assert window.max_time == timeline.duration
+        window.start_delay = 0
+        labels = set()
+        while window.is_animating and window.animation_timer.isActive():
+            window.update_animation()
+            labels.add(window.trial_label.text())
+            # The cursor sits 2 %MVC above the target
+            level = timeline.target[timeline.index(window.current_time)] + 2
+            cursor = CursorState(np.full(16, level, np.float32), 0, 0.0, 0.0)
+            window.update_feedback_points(
+                DisplayFrame(1, None, None, None, None, cursor, None, None), False
+            )
+        assert labels >= {"Rest", "Trial 1 / 2", "Trial 2 / 2"}
+        window.stop_animation()
+        summary = window.trial_label.text().splitlines()
+        assert summary[0] == "2 / 2 trials scored"
+        assert summary[1:] == ["low: RMSE 2.0 %MVC", "high: RMSE 2.0 %MVC"]
+
+        # Edited points replace the loaded protocol
+        window.entry_boxes[0].mvc_entry.setText("5")
+        assert window.timeline is None
+    finally:
+        window.close()
@@ -0,0 +1,33 @@
+import numpy as np
+
+from utils.normalize import Normalizer, loop_normalize
+
+
+def test_matches_the_per_channel_loop():
+    rng = np.random.default_rng(0)
+    chunk = rng.integers(-2000, 2000, (4, 300)).astype(np.int16)
+    offsets = {0: 1.5, 2: -0.25}
+    mvc_values = {0: 20.0, 1: None, 3: 0.0}
+    normalizer = Normalizer(4, scale=0.01)
+    normalizer.set_offsets(offsets)
+    normalizer.set_mvc(mvc_values)
+    np.testing.assert_array_equal(normalizer.has_mvc, [True, False, False, False])
+    out = normalizer(chunk)
+    assert out.dtype == np.float32
+    np.testing.assert_allclose(
+        out, loop_normalize(chunk, offsets, mvc_values, scale=0.01), atol=1e-4
+    )
+
+
+def test_percent_mvc_in_place_and_on_selected_channels():
+    normalizer = Normalizer(3)
+    normalizer.set_offsets([1.0, 2.0, 3.0])
+    normalizer.set_mvc({0: 10.0, 1: 50.0, 2: 100.0})
+    chunk = np.array([[2.0, 11.0], [2.0, 52.0], [3.0, 103.0]], dtype=np.float32)
+    result = normalizer(chunk, out=chunk)
+    assert result is chunk
+    np.testing.assert_allclose(chunk, [[10, 100], [0, 100], [0, 100]])
+    # Rows of a partial chunk use the coefficients of their channels
+    np.testing.assert_allclose(
+        normalizer(np.array([[53.0], [1.0]]), channels=[1, 0]), [[102], [0]]
+    )
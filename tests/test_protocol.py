@@ -0,0 +1,97 @@
+import json
+
+import numpy as np
+import pytest
+
+from utils.protocol import REST, TRIAL, TrialScorer, build_timeline, load_protocol
+
+DEFINITION = {
+    "lead_in": 2,
+    "rest": 3,
+    "lead_out": 1,
+    "timeline_rate": 100,
+    "trials": [
+        {"name": "hold", "level": 20, "segments": [["hold", 4, "level"]]},
+        {
+            "name": "ramp",
+            "level": 40,
+            "segments": [["ramp", 2, "level"], ["hold", 2, "level"]],
+        },
+    ],
+}
+
+
+def test_trials_start_and_end_on_their_ticks():
+    timeline = build_timeline(DEFINITION)
+    assert [(t["name"], t["start"], t["end"]) for t in timeline.trials] == [
+        ("hold", 2.0, 6.0),
+        ("ramp", 9.0, 13.0),
+    ]
+    assert timeline.duration == pytest.approx(14.0)
+    assert len(timeline) == 1401
+    # Trial k covers ticks [start * rate, end * rate)
+    assert timeline.trial[199] == -1 and timeline.trial[200] == 0
+    assert timeline.trial[599] == 0 and timeline.trial[600] == -1
+    assert timeline.trial[900] == 1 and timeline.trial[1300] == -1
+    np.testing.assert_array_equal(timeline.phase == TRIAL, timeline.trial >= 0)
+    assert timeline.target[300] == 20
+    assert timeline.target[1000] == pytest.approx(20)
+    assert timeline.target[1200] == 40
+
+
+def test_rest_is_minus_one_with_a_zero_target():
+    timeline = build_timeline(DEFINITION)
+    rest = timeline.trial == -1
+    assert rest.sum() == len(timeline) - 800
+    np.testing.assert_array_equal(timeline.phase[rest], REST)
+    np.testing.assert_array_equal(timeline.target[rest], 0)
+    # Times are clipped to the timeline
+    assert timeline.index(-1.0) == 0
+    assert timeline.index(100.0) == len(timeline) - 1
+
+
+def test_seeded_timelines_are_reproducible(tmp_path):
+    definition = dict(
+        DEFINITION,
+        repetitions=4,
+        shuffle=True,
+        rest={"min": 2, "max": 5},
+        trials=[dict(t, level={"min": 10, "max": 50}) for t in DEFINITION["trials"]],
+    )
+    first = build_timeline(definition, seed=7)
+    again = build_timeline(definition, seed=7)
+    other = build_timeline(definition, seed=8)
+    assert first.trials == again.trials
+    np.testing.assert_array_equal(first.target, again.target)
+    np.testing.assert_array_equal(first.trial, again.trial)
+    assert first.trials != other.trials
+    # A seed in the file is used when none is passed
+    path = tmp_path / "protocol.json"
+    path.write_text(json.dumps(dict(definition, seed=7)))
+    assert load_protocol(path).trials == first.trials
+
+
+def test_scorer_rmse_per_trial_and_channel():
+    timeline = build_timeline(DEFINITION)
+    scorer = TrialScorer(timeline, channels=2, tolerance=5.0)
+    t = np.arange(len(timeline)) / timeline.rate
+    target = timeline.target.astype(np.float64)
+    # Channel 0 is 3 %MVC above the target, channel 1 alternates +-10
+    values = np.vstack([target + 3, target + 10 * (-1) ** np.arange(len(t))])
+    # Fed in chunks, as a session runs
+    for chunk in np.array_split(np.arange(len(t)), 7):
+        scorer.add(t[chunk], values[:, chunk])
+    for result in scorer.results():
+        assert result["samples"] == 400
+        np.testing.assert_allclose(result["rmse"], [3, 10])
+        np.testing.assert_allclose(result["mae"], [3, 10])
+        np.testing.assert_allclose(result["within"], [1, 0])
+
+
+def test_unscored_trials_have_no_errors():
+    timeline = build_timeline(DEFINITION)
+    scorer = TrialScorer(timeline, channels=1)
+    scorer.add([3.0, 7.0, 20.0], np.array([[20.0, 5.0, 1.0]]))
+    first, second = scorer.results()
+    assert first["samples"] == 1 and first["rmse"] == [0.0]
+    assert second["samples"] == 0 and second["rmse"] is None
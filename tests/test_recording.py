@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from utils.acquisition_profile import AcquisitionProfile
+from utils.recording import (
+    _TRAILER,
+    CODECS,
+    BlockCodec,
+    Recorder,
+    RecordingReader,
+    emg_like_blocks,
+)
+from utils.simulator import settings_reply, simulated_frames
+
+PROFILE = AcquisitionProfile(probe_types=[5, 0, 0, 0, 0, 0, 0, 0, 0, 0])
+SETTINGS = settings_reply(PROFILE.probe_types)
+CONFIG = PROFILE.layout(SETTINGS)
+
+
+def simulator_blocks(count):
+    columns = PROFILE.columns
+    return [
+        np.frombuffer(simulated_frames(CONFIG, b * columns, columns), dtype="<i2")
+        for b in range(count)
+    ]
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_codec_round_trip_is_bit_exact(codec):
+    c = BlockCodec(CONFIG, codec)
+    for block in simulator_blocks(2) + emg_like_blocks(CONFIG, 2):
+        np.testing.assert_array_equal(c.decode(c.encode(block)), block)
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_recording_reads_back_blocks_and_gaps(tmp_path, codec):
+    path = tmp_path / "session.nvrec"
+    blocks = simulator_blocks(2) + emg_like_blocks(CONFIG, 3)
+    recorder = Recorder(path, PROFILE, SETTINGS, codec=codec).start()
+    for block in blocks[:2]:
+        recorder.write_block(block)
+    recorder.write_gap(123)
+    for block in blocks[2:]:
+        recorder.write_block(block)
+    recorder.close()
+
+    reader = RecordingReader(path)
+    assert len(reader) == len(blocks)
+    assert reader.settings == SETTINGS
+    assert reader.profile.to_dict() == PROFILE.to_dict()
+    # Out of order, to use the index rather than a pass over the file
+    for k in (4, 0, 3, 1, 2):
+        np.testing.assert_array_equal(reader.block(k), blocks[k])
+    assert reader.gaps == [(2, 123)]
+    reader.close()
+
+
+def test_unclosed_recording_is_scanned(tmp_path):
+    path = tmp_path / "session.nvrec"
+    blocks = simulator_blocks(3)
+    recorder = Recorder(path, PROFILE, SETTINGS, pyramid=False)
+    recorder.write_block(blocks[0])
+    recorder.write_gap(7)
+    recorder.write_block(blocks[1])
+    recorder.write_block(blocks[2])
+    recorder.close()
+    # Drop the index, as if the session had crashed before close()
+    data = path.read_bytes()
+    _, _, index_offset, _ = _TRAILER.unpack(data[-_TRAILER.size :])
+    path.write_bytes(data[:index_offset])
+
+    reader = RecordingReader(path)
+    assert len(reader) == 3
+    assert reader.gaps == [(1, 7)]
+    np.testing.assert_array_equal(reader.block(2), blocks[2])
+    reader.close()
+
+
+def test_blocks_dropped_by_the_queue_are_recorded_as_gaps(tmp_path):
+    path = tmp_path / "session.nvrec"
+    blocks = simulator_blocks(5)
+    # Not started, so the writer falls behind and the oldest blocks drop
+    recorder = Recorder(path, PROFILE, SETTINGS, maxlen=2, pyramid=False)
+    for block in blocks:
+        recorder.write_block(block)
+    recorder.close()
+
+    reader = RecordingReader(path)
+    assert len(reader) == 2
+    assert reader.gaps == [(0, 3 * recorder.block_aux_samples)]
+    np.testing.assert_array_equal(reader.block(0), blocks[3])
+    np.testing.assert_array_equal(reader.block(1), blocks[4])
+    reader.close()
+
+
+def test_waiting_writes_keep_every_block(tmp_path):
+    path = tmp_path / "session.nvrec"
+    blocks = simulator_blocks(2) * 20
+    recorder = Recorder(path, PROFILE, SETTINGS, maxlen=2, pyramid=False).start()
+    for block in blocks:
+        recorder.write_block(block, wait=True)
+    recorder.close()
+
+    reader = RecordingReader(path)
+    assert len(reader) == len(blocks) and reader.gaps == []
+    assert recorder.queue.dropped == 0
+    reader.close()
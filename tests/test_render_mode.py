@@ -0,0 +1,47 @@
+import pytest
+
+from utils import render_mode
+from utils.render_mode import (
+    RENDER_MODES,
+    curve_options,
+    make_pen,
+    make_plot_widget,
+    resolve_render_mode,
+)
+
+
+@pytest.mark.parametrize("available", [True, False])
+@pytest.mark.parametrize("mode", RENDER_MODES)
+def test_resolve_every_mode(monkeypatch, mode, available):
+    monkeypatch.setattr(render_mode, "_opengl_available", available)
+    expected = "fast" if mode == "opengl" and not available else mode
+    assert resolve_render_mode(mode) == expected
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        resolve_render_mode("vulkan")
+
+
+def test_offscreen_opengl_falls_back_to_fast(qapp, monkeypatch):
+    monkeypatch.setattr(render_mode, "_opengl_available", None)
+    if render_mode.opengl_available():
+        pytest.skip("this platform has OpenGL")
+    assert resolve_render_mode("opengl") == "fast"
+
+
+@pytest.mark.parametrize("mode", ["default", "fast"])
+def test_widgets_pens_and_curves_follow_the_mode(qapp, mode):
+    widget = make_plot_widget(mode)
+    try:
+        item = widget.getPlotItem()
+        fast = mode != "default"
+        assert item.clipToViewMode() == fast
+        # (factor, auto, method)
+        assert item.downsampleMode()[1] == fast
+        pen = make_pen((255, 0, 0), 3, mode)
+        assert pen.width() == (1 if fast else 3)
+        assert pen.isCosmetic()
+        assert curve_options(mode) == ({"skipFiniteCheck": True} if fast else {})
+    finally:
+        widget.close()
@@ -0,0 +1,48 @@
+import numpy as np
+
+from utils.ring_buffer import ChannelRingBuffer, TrailBuffer
+
+
+def test_ring_buffer_keeps_the_newest_samples_across_compaction():
+    buffer = ChannelRingBuffer(2, 100, slack=10)
+    stream = np.vstack([np.arange(1000), -np.arange(1000)]).astype(np.float32)
+    # Uneven chunks move the write position past the slack many times
+    for chunk in np.array_split(stream, 77, axis=1):
+        buffer.append(chunk)
+        n = min(buffer.total, 100)
+        assert len(buffer) == n
+        np.testing.assert_array_equal(
+            buffer.view(), stream[:, buffer.total - n : buffer.total]
+        )
+    assert buffer.total == 1000
+    np.testing.assert_array_equal(buffer.view(5, channel=1), -np.arange(995, 1000))
+    # A chunk longer than the capacity keeps its tail
+    buffer.append(stream[:, :250])
+    np.testing.assert_array_equal(buffer.view(), stream[:, 150:250])
+    buffer.clear()
+    assert len(buffer) == 0 and buffer.view().shape == (2, 0)
+
+
+def test_int16_storage_is_scaled_by_values():
+    buffer = ChannelRingBuffer(1, 10, dtype=np.int16, scale=0.5)
+    buffer.append(np.array([[2, -4, 6]], dtype=np.int16))
+    assert buffer.view().dtype == np.int16
+    values = buffer.values(channel=0)
+    assert values.dtype == np.float32
+    np.testing.assert_array_equal(values, [1, -2, 3])
+
+
+def test_trail_decimation_keeps_the_newest_sample():
+    trail = TrailBuffer(50, 3)
+    for k in range(120):
+        trail.append(k * 0.1, np.full(3, k))
+    t, data = trail.view()
+    assert len(trail) == 50
+    np.testing.assert_allclose(t, np.arange(70, 120) * 0.1)
+    np.testing.assert_array_equal(data[2], np.arange(70, 120))
+    t, data = trail.decimated(8)
+    assert len(t) <= 8
+    assert t[-1] == trail.view()[0][-1] and data[0, -1] == 119
+    np.testing.assert_array_equal(data[0], np.round(t / 0.1))
+    # Short trails are returned whole
+    assert len(trail.decimated(100)[0]) == 50
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from utils.acquisition_profile import AcquisitionProfile
+from utils.decode_plan import DecodePlan
+from utils.processing import ProcessingEngine
+
+CHANNELS = [0, 3, 7]
+
+
+def blocks(config, count, seed=0):
+    rng = np.random.default_rng(seed)
+    for k in range(count):
+        block = rng.integers(-200, 200, config["blockData"] // 2, dtype=np.int16)
+        # A contraction in the later blocks sets the MVC
+        block = block * (1 + k)
+        yield block.astype("<i2")
+
+
+def percent_mvc(sample_dtype, count=6):
+    """%MVC of the last block after offsets (first block) and MVC (all)."""
+    profile = AcquisitionProfile(sample_dtype=sample_dtype)
+    config = profile.layout()
+    plan = DecodePlan(config)
+    engine = ProcessingEngine(
+        16,
+        profile.aux_rate,
+        profile.history_samples,
+        profile.sample_dtype,
+        profile.sample_scale,
+    )
+    n = plan.aux.shape[1]
+    for k, block in enumerate(blocks(config, count)):
+        if sample_dtype == "int16":
+            aux = plan.decode_raw(block, out=plan.empty_raw_output())
+        else:
+            aux = plan.decode(block, out=plan.empty_output())
+        engine.submit(aux)
+        engine.process_pending()
+        if k == 0:
+            engine.measure_offsets(CHANNELS, n)
+    mvc = engine.measure_mvc(CHANNELS, count * n)
+    engine.process_pending()
+    engine.set_mvc(mvc.result())
+    return engine.normalizer(aux[CHANNELS], channels=CHANNELS)
+
+
+def test_int16_matches_float32_percent_mvc():
+    expected = percent_mvc("float32")
+    actual = percent_mvc("int16")
+    assert np.abs(expected).max() > 10
+    np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-3)
+
+
+def test_decode_raw_checks_block_size():
+    plan = DecodePlan(AcquisitionProfile().layout())
+    with pytest.raises(ValueError):
+        plan.decode_raw(np.zeros(plan.block_samples - 1, dtype="<i2"))
@@ -0,0 +1,59 @@
+import threading
+
+import numpy as np
+
+from utils.acquisition_profile import AcquisitionProfile
+from utils.spectral import SpectralStage
+from utils.simulator import settings_reply
+
+
+def test_stage_finds_the_frequency_of_a_sine():
+    rate = 2000
+    t = np.arange(4 * rate) / rate
+    samples = np.vstack([np.sin(2 * np.pi * f * t) for f in (80, 150)])
+    stage = SpectralStage(2, rate, window=0.5, hop=0.25)
+    times, mdf, mnf = [], [], []
+    for chunk in np.split(samples, 8, axis=1):
+        ti, d, m = stage.process(chunk)
+        times.append(ti)
+        mdf.append(d)
+        mnf.append(m)
+    times = np.concatenate(times)
+    np.testing.assert_allclose(times, 0.5 + 0.25 * np.arange(len(times)))
+    np.testing.assert_allclose(np.concatenate(mdf, axis=1)[:, 0], [80, 150], atol=2)
+    np.testing.assert_allclose(np.concatenate(mnf, axis=1)[:, -1], [80, 150], atol=5)
+
+
+def test_protocol_window_feeds_the_chosen_input_from_the_receiver(qapp):
+    from utils.daq_receiver import DAQReceiver
+    from utils.protocol_window import ProtocolWindow
+
+    profile = AcquisitionProfile(decode_emg=True, probe_types=[5, 1] + [0] * 8)
+    daq = DAQReceiver(profile, emg=True)
+    daq.settings = settings_reply(profile.probe_types)
+    daq.daq_config.update(profile.layout(daq.settings))
+    window = ProtocolWindow(daq, [0], {0: 1.0}, {})
+    try:
+        box = window.spectral_box
+        assert [box.itemData(k) for k in range(box.count())] == [0, 1]
+        box.setCurrentIndex(1)
+        index, worker = window.spectral
+        assert index == 1
+        assert worker.stage.channels == daq.daq_config["NumChan"][1]
+
+        pushed = []
+        worker.push = lambda samples: pushed.append(
+            (threading.current_thread(), samples.shape)
+        )
+
+        def emit():
+            daq.emg_received.emit(0, np.zeros((70, 4000), np.float32))
+            daq.emg_received.emit(1, np.zeros((14, 4000), np.float32))
+
+        emitter = threading.Thread(target=emit)
+        emitter.start()
+        emitter.join()
+        # Pushed by the receiver thread itself, without waiting for the GUI
+        assert pushed == [(emitter, (14, 4000))]
+    finally:
+        window.close()
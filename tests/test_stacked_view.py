@@ -0,0 +1,65 @@
+import numpy as np
+
+from utils.stacked_view import StackedCurve
+
+
+def curve_points(curve, channels):
+    x, y = curve.getData()
+    return x.reshape(channels, -1), y.reshape(channels, -1)
+
+
+def test_channels_are_drawn_at_the_frame_times(qapp):
+    curve = StackedCurve(spacing=10.0, max_points=100)
+    # A DisplayFrame's x need not start at zero or be evenly spaced
+    x = np.float32(2.5) + np.sort(np.random.default_rng(0).random(40, np.float32))
+    data = np.vstack([np.zeros(40), np.ones(40), -np.ones(40)]).astype(np.float32)
+    curve.set_stacked(data, x)
+    xs, ys = curve_points(curve, 3)
+    for k in range(3):
+        np.testing.assert_array_equal(xs[k, :-1], x)
+        np.testing.assert_array_equal(ys[k, :-1], data[k] + 10 * k)
+    # One NaN break after every channel
+    assert np.isnan(xs[:, -1]).all() and np.isnan(ys[:, -1]).all()
+
+
+def test_decimated_pairs_keep_the_frame_times_of_their_bins(qapp):
+    curve = StackedCurve(spacing=1.0, max_points=10)
+    x = np.linspace(100, 101, 53, dtype=np.float32)
+    data = np.arange(2 * 53, dtype=np.float32).reshape(2, 53)
+    curve.set_stacked(data, x)
+    xs, ys = curve_points(curve, 2)
+    # 4 bins of 11 samples, the 9 oldest samples dropped
+    np.testing.assert_array_equal(xs[0, :-1], x[9::11].repeat(2))
+    np.testing.assert_array_equal(ys[0, :-1:2], data[0, 9::11])
+    np.testing.assert_array_equal(ys[1, 1:-1:2], data[1, 19::11] + 1)
+
+
+def test_times_from_a_sample_rate(qapp):
+    curve = StackedCurve(max_points=100)
+    curve.set_stacked(np.zeros((2, 4), np.float32), sample_rate=2.0, t0=1.0)
+    xs, _ = curve_points(curve, 2)
+    np.testing.assert_array_equal(xs[:, :-1], [[1, 1.5, 2, 2.5]] * 2)
+
+
+def test_mvc_window_stacks_the_published_frame(qapp):
+    from utils.daq_receiver import DAQReceiver
+    from utils.mvc_window import MVCWindow
+
+    window = MVCWindow(DAQReceiver())
+    try:
+        window.checkboxes[0].setChecked(True)
+        window.checkboxes[2].setChecked(True)
+        window.stacked_cb.setChecked(True)
+        window.refresh_plot()
+        window.engine.submit(np.ones((16, 1000), np.float32))
+        window.engine.process_pending()
+        window.refresh_plot()
+        frame = window.engine.latest()
+        assert frame.channels == [0, 2]
+        # Thinned again to the curve's point budget, on the frame's times
+        xs, _ = curve_points(window.stacked_curve, 2)
+        assert np.isin(xs[1, :-1], frame.x).all()
+        # and the newest bin ends at the frame's newest sample
+        assert xs[1, -2] > frame.x[-1] - (xs[1, 2] - xs[1, 0])
+    finally:
+        window.close()
@@ -0,0 +1,84 @@
+import socket
+import time
+
+import numpy as np
+
+from utils.acquisition_profile import AcquisitionProfile
+from utils.stream_server import (
+    KIND_DATA,
+    KIND_GAP,
+    KIND_INFO,
+    StreamClient,
+    StreamServer,
+)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_clients_receive_their_selection_in_order():
+    profile = AcquisitionProfile()
+    server = StreamServer(batch_samples=100, max_delay=10.0).start()
+    everything = StreamClient(server.address)
+    selected = StreamClient(server.address, streams={0: [1, 3]})
+    try:
+        wait_for(lambda: server.clients == 2)
+        server.set_layout(profile.layout(), sample_scale=0.5)
+        data = np.arange(16 * 150, dtype=np.float32).reshape(16, 150)
+        # Two short blocks are sent as one frame, then a gap follows
+        server.publish(data[:, :60])
+        server.publish(data[:, 60:120])
+        server.publish(data[:, 120:])
+        server.mark_gap(40)
+
+        for client in (everything, selected):
+            assert client.read()[0] == KIND_INFO
+            kind, stream, seq, info = client.read()
+            assert kind == KIND_INFO and info == client.info
+            assert info["streams"]["0"]["scale"] == 0.5
+        kind, stream, seq, samples = everything.read()
+        assert (kind, stream, seq) == (KIND_DATA, 0, 0)
+        np.testing.assert_array_equal(samples, data[:, :120])
+        kind, stream, seq, samples = everything.read()
+        assert (kind, stream, seq) == (KIND_DATA, 0, 120)
+        np.testing.assert_array_equal(samples, data[:, 120:])
+        assert everything.read() == (KIND_GAP, 0, 150, 40)
+
+        kind, stream, seq, samples = selected.read()
+        np.testing.assert_array_equal(samples, data[[1, 3], :120])
+        assert selected.read()[2] == 120
+        assert selected.read() == (KIND_GAP, 0, 150, 40)
+    finally:
+        everything.close()
+        selected.close()
+        server.stop()
+
+
+def test_stalled_client_is_dropped_without_holding_up_others(tmp_path):
+    server = StreamServer(
+        path=str(tmp_path / "stream.sock"), batch_samples=1, max_pending=256 * 1024
+    ).start()
+    stalled = StreamClient(server.address)
+    stalled.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    reader = StreamClient(server.address)
+    try:
+        wait_for(lambda: server.clients == 2)
+        assert reader.read()[0] == KIND_INFO
+        data = np.ones((16, 1000), dtype=np.float32)
+        published = 0
+        deadline = time.monotonic() + 10
+        while not server.dropped_clients and time.monotonic() < deadline:
+            server.publish(data)
+            published += 1
+            # The reader keeps getting every frame meanwhile
+            assert reader.read()[2] == (published - 1) * 1000
+        assert server.dropped_clients == 1
+        assert server.clients == 1
+    finally:
+        stalled.close()
+        reader.close()
+        server.stop()
@@ -0,0 +1,361 @@
+"""
+Novecento acquisition settings shared by the receiver, GUI and tools.
+
+    python -m utils.acquisition_profile [profile.json]
+
+prints the profile's stream layout and bandwidth and times one decode.
+"""
+
+import json
+import time
+
+import numpy as np
+
+
+def CRC8(Vector, Len):
+    crc = 0
+    j = 0
+
+    while Len > 0:
+        Extract = Vector[j]
+        for i in range(8, 0, -1):
+            Sum = crc % 2 ^ Extract % 2
+            crc //= 2
+
+            if Sum > 0:
+                a = format(crc, "08b")
+                b = format(140, "08b")
+                str_list = [0] * 8
+
+                for k in range(8):
+                    str_list[k] = int(a[k] != b[k])
+
+                crc = int("".join(map(str, str_list)), 2)
+
+            Extract //= 2
+
+        Len -= 1
+        j += 1
+
+    return crc
+
+
+# Novecento constants (shared by every profile)
+ChVsType = [0, 14, 22, 38, 46, 70, 102, 0, 0, 0, 0, 0, 0, 0, 0, 0]
+AuxFsamp = [0, 16, 32, 48]
+FsampVal = [500, 2000, 4000, 8000]
+SizeAux = [16, 64, 128, 256]
+
+# Every block column is one 2 ms frame; the trailer holds accessory rows.
+FRAMES_PER_SECOND = 500
+ACCESSORY_ROWS = 128
+NUM_INPUTS = 10
+NUM_AUX = 16
+
+
+def aux_gather_index(ptr_aux, packet_size, size_aux, columns):
+    """
+    Flat indices into a Fortran-ordered block (packet_size, columns) that
+    give the AUX samples as a (16, n_samples) array. Equivalent to the two
+    order="F" reshapes in the original decoder.
+    """
+    n_samples = size_aux * columns // NUM_AUX
+    k = np.arange(NUM_AUX)[:, None] + NUM_AUX * np.arange(n_samples)[None, :]
+    return ptr_aux + k % size_aux + (k // size_aux) * packet_size
+
+
+def input_gather_index(ptr, size_in, num_chan, packet_size, columns):
+    """
+    Flat indices for one EMG input (HRES = 0) as a (num_chan, n_samples)
+    array, using the same channel-interleaved layout as the AUX rows.
+    """
+    n_samples = size_in * columns // num_chan
+    k = np.arange(num_chan)[:, None] + num_chan * np.arange(n_samples)[None, :]
+    return ptr + k % size_in + (k // size_in) * packet_size
+
+
+def stream_indices(daq_config, columns):
+    """
+    {stream: (channels, n) flat block indices} of the sample streams in a
+    Fortran-ordered block: stream i + 1 for EMG input i (HRES = 0, in
+    input order), then stream 0 for the AUX channels.
+    """
+    P = daq_config["PacketSize1Block"]
+    ptr = daq_config["Ptr_IN"]
+    streams = {}
+    for i in range(10):
+        size = daq_config["Size_IN"][i]
+        if not daq_config["IN_Active"][i] or not size or daq_config["HRES"][i]:
+            continue
+        channels = daq_config["NumChan"][i]
+        streams[i + 1] = input_gather_index(ptr[i], size, channels, P, columns)
+    size_aux = P - ptr[10] - ACCESSORY_ROWS
+    streams[0] = aux_gather_index(ptr[10], P, size_aux, columns)
+    return streams
+
+
+def stream_rate(daq_config, stream):
+    """Sample rate (Hz) of a stream from stream_indices()."""
+    if stream == 0:
+        return daq_config["FsampVal"][daq_config["FSelAux"]]
+    return daq_config["FsampVal"][daq_config["Fsamp"][stream - 1]]
+
+
+def stream_scale(daq_config, stream):
+    """Factor from a stream's raw counts to physical units."""
+    return daq_config["AuxGainFactor"] if stream == 0 else daq_config["GainFactor"]
+
+
+class AcquisitionProfile:
+    """
+    Validated Novecento acquisition settings. Builds the configuration
+    string and the block layout (Ptr_IN, Size_IN, PacketSize1Block) once,
+    so every receiver can share the same profile.
+
+    A profile can be loaded from a JSON file whose keys match the
+    constructor arguments, e.g. {"fsel_aux": 2, "in_active": [1, 1, 0, ...]}.
+    Unknown keys are rejected.
+    """
+
+    DEFAULTS = {
+        "host": "169.254.1.10",
+        "port": 23456,
+        "plot_time": 1,
+        "in_active": [1, 1, 1, 0, 0, 0, 0, 0, 0, 0],
+        "mode": [0] * 10,
+        "gain": [0] * 10,
+        "hres": [0] * 10,
+        "hpf": [1] * 10,
+        "fsamp": [1] * 8 + [0, 0],
+        "fsel_aux": 0,
+        "an_out_source": 2,
+        "an_out_chan": 1,
+        "an_out_gain": int("00100000", 2),
+        "aux_gain_factor": 5 / 2**16 / 0.5,
+        "emg_gain_factor": 0.0002861,
+        # ChVsType index per input, used for estimates before the device
+        # reports its actual probe configuration
+        "probe_types": [0] * 10,
+        # "float32": scaled samples throughout; "int16": raw counts are kept
+        # in the buffers and scaled by sample_scale when read
+        "sample_dtype": "float32",
+        "history_seconds": 60,
+        # Moving-average window (s) of the feedback cursor
+        "feedback_smoothing": 0.02,
+        # Plot rendering: "default", "fast" (software, thin cosmetic pens,
+        # clip-to-view and downsampling) or "opengl" (falls back to "fast")
+        "render_mode": "default",
+        # Seconds a receiver keeps trying to reconnect after the link drops
+        # (0: give up immediately)
+        "reconnect_timeout": 30.0,
+        # Recording codec: "zlib", "lzma" or "none" (blocks stored as is)
+        "record_codec": "zlib",
+        # Local TCP port the protocol window re-publishes the streams on
+        # (0: off)
+        "publish_port": 0,
+        # Garbage collection during protocols: "default", "tuned" (rare
+        # young collections, full ones in rests) or "off" (only in rests)
+        "gc_mode": "default",
+        # Decode the EMG inputs too, for the RMS map and fatigue monitor
+        "decode_emg": False,
+    }
+
+    def __init__(self, **kwargs):
+        unknown = set(kwargs) - set(self.DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown profile keys: {sorted(unknown)}")
+        for key, default in self.DEFAULTS.items():
+            value = kwargs.get(key, default)
+            setattr(self, key, list(value) if isinstance(value, list) else value)
+        self.validate()
+        self._conf_string = None
+        self._layouts = {}
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "r") as f:
+            return cls(**json.load(f))
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.DEFAULTS}
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def validate(self):
+        for key in ("in_active", "mode", "gain", "hres", "hpf", "fsamp", "probe_types"):
+            values = getattr(self, key)
+            if len(values) != NUM_INPUTS:
+                raise ValueError(f"{key} must have {NUM_INPUTS} entries")
+        for key in ("in_active", "hres", "hpf"):
+            if any(v not in (0, 1) for v in getattr(self, key)):
+                raise ValueError(f"{key} entries must be 0 or 1")
+        for key in ("mode", "gain", "fsamp"):
+            if any(v not in (0, 1, 2, 3) for v in getattr(self, key)):
+                raise ValueError(f"{key} entries must be between 0 and 3")
+        if any(not 0 <= v < len(ChVsType) for v in self.probe_types):
+            raise ValueError("probe_types entries must index ChVsType")
+        if self.fsel_aux not in (0, 1, 2, 3):
+            raise ValueError("fsel_aux must be between 0 and 3")
+        if not isinstance(self.plot_time, int) or self.plot_time < 1:
+            raise ValueError("plot_time must be a positive integer")
+        if not 0 <= self.an_out_chan < 256 or not 0 <= self.an_out_source < 16:
+            raise ValueError("analog output settings out of range")
+        if not 0 < self.port < 65536:
+            raise ValueError("port must be between 1 and 65535")
+        if self.sample_dtype not in ("float32", "int16"):
+            raise ValueError("sample_dtype must be 'float32' or 'int16'")
+        if self.history_seconds <= 0:
+            raise ValueError("history_seconds must be positive")
+        if self.feedback_smoothing < 0:
+            raise ValueError("feedback_smoothing must not be negative")
+        if self.render_mode not in ("default", "fast", "opengl"):
+            raise ValueError("render_mode must be 'default', 'fast' or 'opengl'")
+        if self.reconnect_timeout < 0:
+            raise ValueError("reconnect_timeout must not be negative")
+        if self.record_codec not in ("none", "zlib", "lzma"):
+            raise ValueError("record_codec must be 'none', 'zlib' or 'lzma'")
+        if not 0 <= self.publish_port < 65536:
+            raise ValueError("publish_port must be between 0 and 65535")
+        if self.gc_mode not in ("default", "tuned", "off"):
+            raise ValueError("gc_mode must be 'default', 'tuned' or 'off'")
+        if self.decode_emg not in (True, False):
+            raise ValueError("decode_emg must be true or false")
+
+    @property
+    def aux_rate(self):
+        return FsampVal[self.fsel_aux]
+
+    def input_rate(self, i):
+        """EMG sample rate of input i (HRES = 0)."""
+        return FsampVal[self.fsamp[i]]
+
+    @property
+    def sample_scale(self):
+        # Factor from emitted/stored AUX samples to physical units
+        return self.aux_gain_factor if self.sample_dtype == "int16" else 1.0
+
+    @property
+    def history_samples(self):
+        return int(self.history_seconds * self.aux_rate)
+
+    @property
+    def columns(self):
+        # Frames (block columns) per received block
+        return FRAMES_PER_SECOND * self.plot_time
+
+    def conf_string(self):
+        if self._conf_string is None:
+            ConfString = [0] * 15
+            ConfString[0] = (
+                int("10000000", 2)
+                + AuxFsamp[self.fsel_aux]
+                + self.in_active[9] * 2
+                + self.in_active[8]
+            )
+            ConfString[1] = 0
+            for i in range(8):
+                ConfString[1] += self.in_active[i] * (2**i)
+            ConfString[2] = self.an_out_gain + self.an_out_source
+            ConfString[3] = self.an_out_chan
+            for i in range(10):
+                ConfString[4 + i] = (
+                    self.mode[i] * 64
+                    + self.gain[i] * 16
+                    + self.hpf[i] * 8
+                    + self.hres[i] * 4
+                    + self.fsamp[i]
+                )
+            ConfString[14] = CRC8(ConfString, 14)
+            self._conf_string = bytes(ConfString)
+        return self._conf_string
+
+    def layout(self, settings=None):
+        """
+        Block layout for a given device settings reply (the 20-byte answer
+        to request 1). Without settings, probe_types is used. The result is
+        cached per probe configuration and returned as a daq_config dict.
+        """
+        if isinstance(settings, (bytes, bytearray)) and len(settings) >= 11:
+            probes = tuple(settings[1:11])
+        else:
+            probes = tuple(self.probe_types)
+        if probes in self._layouts:
+            return self._layouts[probes]
+
+        in_active = list(self.in_active)
+        NumChan = [0] * 10
+        Ptr_IN = [0] * 11
+        Size_IN = [0] * 11
+        for i in range(10):
+            idx = probes[i]
+            NumChan[i] = ChVsType[idx] if idx < len(ChVsType) else 0
+            if NumChan[i] == 0:
+                in_active[i] = 0
+            if in_active[i] == 1:
+                Size_IN[i] = (
+                    (self.hres[i] + 1) * FsampVal[self.fsamp[i]] // 500 * NumChan[i]
+                )
+            Ptr_IN[i + 1] = Ptr_IN[i] + Size_IN[i]
+
+        PacketSize1Block = Ptr_IN[10] + SizeAux[self.fsel_aux] + ACCESSORY_ROWS
+        blockData = PacketSize1Block * self.columns * 2
+
+        config = {
+            "PlotTime": self.plot_time,
+            "IN_Active": in_active,
+            "NumChan": NumChan,
+            "Ptr_IN": Ptr_IN,
+            "Size_IN": Size_IN,
+            "SizeAux": SizeAux[self.fsel_aux],
+            "PacketSize1Block": PacketSize1Block,
+            "blockData": blockData,
+            "FSelAux": self.fsel_aux,
+            "FsampVal": FsampVal,
+            "Fsamp": list(self.fsamp),
+            "HRES": list(self.hres),
+            "AuxGainFactor": self.aux_gain_factor,
+            "GainFactor": self.emg_gain_factor,
+        }
+        self._layouts[probes] = config
+        return config
+
+    def estimate_bandwidth(self, settings=None):
+        """Expected stream rate in bytes per second."""
+        config = self.layout(settings)
+        return config["blockData"] / self.plot_time
+
+    def estimate_decode_cost(self, settings=None, repeats=20):
+        """
+        Measured seconds needed to extract and scale the AUX channels of one
+        block, timed on a synthetic block with a DecodePlan.
+        """
+        from utils.decode_plan import DecodePlan
+
+        plan = DecodePlan(self.layout(settings))
+        block = np.zeros(plan.block_samples, dtype="<i2")
+        start = time.perf_counter()
+        for _ in range(repeats):
+            plan.decode(block)
+        return (time.perf_counter() - start) / repeats
+
+    def summary(self, settings=None):
+        """Layout and bandwidth of the stream; nothing is timed."""
+        config = self.layout(settings)
+        return (
+            f"AUX {self.aux_rate} Hz, block {config['PacketSize1Block']} x "
+            f"{self.columns}, {self.estimate_bandwidth(settings) / 1e6:.2f} MB/s"
+        )
+
+
+if __name__ == "__main__":
+    import sys
+
+    profile = (
+        AcquisitionProfile.from_file(sys.argv[1])
+        if len(sys.argv) > 1
+        else AcquisitionProfile()
+    )
+    print(profile.summary())
+    print(f"decode {profile.estimate_decode_cost() * 1e3:.3f} ms/block")
@@ -0,0 +1,151 @@
+"""
+Incremental axis ranges for live plots.
+
+    python -m utils.auto_range
+
+compares RangeTracker with the full min/max scan of the history that
+autorange does on every refresh.
+"""
+
+import time
+
+import numpy as np
+
+
+class RangeTracker:
+    """
+    Per-channel min/max over the newest `window` samples of a stream of
+    (channels, n) chunks. append() costs one min and one max over the
+    chunk; range() combines two running aggregates, whatever the window.
+    Chunks are kept as (n, min, max) entries in a queue made of two
+    stacks: new entries go on the back stack, which keeps its overall
+    min/max, and expired ones are popped from the front stack, which
+    stores the min/max from each entry to its newest. When the front runs
+    empty the back stack is moved over, so every entry is handled a
+    constant number of times. A chunk expires once the newer ones cover
+    the window, so up to one chunk more than `window` samples is covered.
+    """
+
+    def __init__(self, channels, window):
+        self.channels = channels
+        self.window = int(window)
+        self.clear()
+
+    def __len__(self):
+        return self.samples
+
+    def clear(self):
+        self.samples = 0
+        # (n, min, max of this entry and every newer front entry); the
+        # oldest entry is last
+        self._front = []
+        # (n, min, max) per entry, oldest first, and their min and max
+        self._back = []
+        self._back_range = None
+
+    def append(self, chunk):
+        n = chunk.shape[1]
+        if not n:
+            return
+        lo, hi = chunk.min(axis=1), chunk.max(axis=1)
+        self._back.append((n, lo, hi))
+        if self._back_range is None:
+            self._back_range = (lo, hi)
+        else:
+            back_lo, back_hi = self._back_range
+            self._back_range = (np.minimum(back_lo, lo), np.maximum(back_hi, hi))
+        self.samples += n
+        while self.samples - self._oldest() >= self.window:
+            self._pop()
+
+    def range(self):
+        """Per-channel (min, max) arrays, or None before any data."""
+        if self._front:
+            _, lo, hi = self._front[-1]
+            if self._back_range is not None:
+                back_lo, back_hi = self._back_range
+                lo, hi = np.minimum(lo, back_lo), np.maximum(hi, back_hi)
+            return lo, hi
+        return self._back_range
+
+    def _oldest(self):
+        return self._front[-1][0] if self._front else self._back[0][0]
+
+    def _pop(self):
+        if not self._front:
+            lo = hi = None
+            for n, chunk_lo, chunk_hi in reversed(self._back):
+                if lo is None:
+                    lo, hi = chunk_lo, chunk_hi
+                else:
+                    lo, hi = np.minimum(lo, chunk_lo), np.maximum(hi, chunk_hi)
+                self._front.append((n, lo, hi))
+            self._back = []
+            self._back_range = None
+        self.samples -= self._front.pop()[0]
+
+
+class AxisRange:
+    """
+    View range of one axis that follows a data range with hysteresis: it
+    grows as soon as the data leaves the view (to the data range plus
+    `margin` of its span on either side) and shrinks only when the data
+    spans less than `shrink` of the view. update() returns the new
+    (low, high), or None while the view can stay, so small changes in
+    the data do not move the axis.
+    """
+
+    def __init__(self, margin=0.1, shrink=0.5, min_span=1e-3):
+        self.margin = margin
+        self.shrink = shrink
+        self.min_span = min_span
+        self.view = None
+
+    def reset(self):
+        self.view = None
+
+    def update(self, low, high):
+        span = max(high - low, self.min_span)
+        if self.view is not None:
+            view_low, view_high = self.view
+            inside = view_low <= low and high <= view_high
+            if inside and span >= self.shrink * (view_high - view_low):
+                return None
+        centre = (low + high) / 2
+        half = (0.5 + self.margin) * span
+        self.view = (centre - half, centre + half)
+        return self.view
+
+
+def benchmark(history=30000, chunks=(10, 500), channels=16, repeats=2000):
+    """
+    (chunk samples, full scan s, RangeTracker s) per chunk: the scan is
+    one min and max over the whole (channels, history) buffer, the tracker
+    one append() and range().
+    """
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(channels, history)).astype(np.float32)
+    results = []
+    for n in chunks:
+        chunk = rng.normal(size=(channels, n)).astype(np.float32)
+        tracker = RangeTracker(channels, history)
+        for k in range(0, history, n):
+            tracker.append(data[:, k : k + n])
+        start = time.perf_counter()
+        for _ in range(repeats):
+            data.min(axis=1)
+            data.max(axis=1)
+        t_scan = (time.perf_counter() - start) / repeats
+        start = time.perf_counter()
+        for _ in range(repeats):
+            tracker.append(chunk)
+            tracker.range()
+        t_tracker = (time.perf_counter() - start) / repeats
+        results.append((n, t_scan, t_tracker))
+    return results
+
+
+if __name__ == "__main__":
+    print(f"{'chunk':>6} {'full scan (us)':>15} {'RangeTracker (us)':>18}")
+    for n, t_scan, t_tracker in benchmark():
+        print(f"{n:>6} {t_scan * 1e6:>15.1f} {t_tracker * 1e6:>18.1f}")
@@ -0,0 +1,56 @@
+import threading
+from collections import deque
+
+
+class BlockQueue:
+    """
+    Sequence-numbered hand-off of decoded blocks from a receiving thread to
+    a consumer (e.g. a GUI timer). Every block is delivered exactly once;
+    if the consumer falls more than `maxlen` blocks behind, the oldest are
+    dropped and counted in `dropped`, and the gap is visible in the
+    sequence numbers. A producer that must not lose blocks (e.g. one
+    running faster than real time) can put() with `wait` instead, which
+    blocks while the queue is full until the consumer drains it.
+    """
+
+    def __init__(self, maxlen=16):
+        self._blocks = deque()
+        self._lock = threading.Lock()
+        self._space = threading.Condition(self._lock)
+        self.maxlen = maxlen
+        self.next_seq = 0
+        self.last_consumed = -1
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def put(self, block, wait=False):
+        with self._space:
+            while wait and len(self._blocks) >= self.maxlen:
+                self._space.wait()
+            seq = self.next_seq
+            self.next_seq += 1
+            self._blocks.append((seq, block))
+            if len(self._blocks) > self.maxlen:
+                self._blocks.popleft()
+                self.dropped += 1
+        return seq
+
+    def drain(self):
+        """All pending (seq, block) pairs, oldest first."""
+        with self._space:
+            items = list(self._blocks)
+            self._blocks.clear()
+            self._space.notify_all()
+        if items:
+            self.last_consumed = items[-1][0]
+        return items
+
+    def clear(self):
+        with self._space:
+            self._blocks.clear()
+            self._space.notify_all()
+            self.next_seq = 0
+            self.last_consumed = -1
+            self.dropped = 0
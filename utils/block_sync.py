@@ -0,0 +1,339 @@
+"""
+Block alignment and gap detection for the raw Novecento byte stream.
+
+    python -m utils.block_sync
+
+times the recovery from a misaligned stream at every FsampVal.
+"""
+
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+from utils.acquisition_profile import ACCESSORY_ROWS, NUM_AUX
+
+COUNTER_MODULUS = 65536
+# Frames checked when searching for the block alignment
+SEARCH_COLUMNS = 10
+_WAIT = -1
+
+# One discontinuity in the stream:
+#   - frame         : counter value that was expected next
+#   - lost_frames   : frames missing according to the counter (modulo
+#                     65536 frames, i.e. about 131 s)
+#   - lost_samples  : AUX samples per channel in those frames
+#   - skipped_bytes : bytes discarded to get back onto a frame boundary
+StreamGap = namedtuple(
+    "StreamGap", ["frame", "lost_frames", "lost_samples", "skipped_bytes"]
+)
+
+
+class BlockSync:
+    """
+    Splits a raw byte stream into chunks of `columns` frames (default: one
+    block) that start on a frame boundary. A frame counter in accessory
+    row `counter_row` that increases by `counter_step` per frame is used
+    to check every chunk:
+      - consecutive counters, or a single jump after which the counter
+        continues for SEARCH_COLUMNS frames (frames dropped by the
+        device): the chunk is passed on and the jump is reported as lost
+        frames
+      - otherwise the alignment was lost after the last good frame. From
+        there, 2 * PacketSize1Block byte offsets are searched for the
+        counter pattern (O(block) work) and only the bytes between the
+        last good frame and the new boundary are discarded, so the good
+        frames on both sides end up in the same chunk. The frame the
+        stray bytes fell into is passed on, so a few of its words may be
+        shifted.
+    With counter_row=None the counter is detected in the first chunk (the
+    stream starts on a boundary): the first accessory row that changes by
+    the same non-zero step every frame. Without one, chunks are split
+    unchecked. feed() returns int16 arrays that stay valid after later
+    calls. Every discontinuity is added to `gaps` and passed to
+    `on_gap(StreamGap)`; lost_frames, skipped_bytes and resyncs are
+    running totals.
+    """
+
+    def __init__(
+        self, daq_config, columns=None, counter_row=None, counter_step=1, on_gap=None
+    ):
+        self.packet_size = daq_config["PacketSize1Block"]
+        self.columns = 500 * daq_config["PlotTime"] if columns is None else columns
+        self.chunk_words = self.packet_size * self.columns
+        self.chunk_bytes = 2 * self.chunk_words
+        self.samples_per_frame = daq_config["SizeAux"] // NUM_AUX
+        self.search_columns = min(self.columns, SEARCH_COLUMNS)
+        self.on_gap = on_gap
+        self.gaps = deque(maxlen=64)
+        self.lost_frames = 0
+        self.skipped_bytes = 0
+        self.resyncs = 0
+        self._detect = counter_row is None
+        self._lock(counter_row, counter_step)
+        self._buffer = bytearray()
+        self._expected = None
+        self._skipped = 0
+
+    @property
+    def locked(self):
+        """True when chunks are checked against the frame counter."""
+        return self.counter_row is not None
+
+    @property
+    def lost_samples(self):
+        return self.lost_frames * self.samples_per_frame
+
+    def _lock(self, counter_row, counter_step):
+        self.counter_row = counter_row
+        self.counter_step = counter_step
+        if counter_row is not None:
+            self._counter_word = self.packet_size - ACCESSORY_ROWS + counter_row
+            self._counter_index = self._counter_word + self.packet_size * np.arange(
+                self.columns
+            )
+
+    def reset(self):
+        """Forget buffered bytes and the expected counter (new connection)."""
+        self._buffer.clear()
+        self._expected = None
+        self._skipped = 0
+
+    def feed(self, data):
+        self._buffer += data
+        if self._detect and len(self._buffer) >= self.chunk_bytes:
+            self._detect_counter()
+
+        starts = []
+        pos = 0
+        while len(self._buffer) - pos >= self.chunk_bytes:
+            if not self.locked:
+                starts.append(pos)
+                pos += self.chunk_bytes
+                continue
+            counters = self._counters(pos)
+            broken = self._first_break(pos, counters)
+            if broken == _WAIT:
+                break
+            if broken is not None:
+                if not self._realign(pos, counters, broken):
+                    break
+                continue
+            self._account(counters)
+            starts.append(pos)
+            pos += self.chunk_bytes
+
+        if not pos:
+            return []
+        with memoryview(self._buffer) as view:
+            consumed = bytes(view[:pos])
+        del self._buffer[:pos]
+        return [
+            np.frombuffer(consumed, dtype="<i2", count=self.chunk_words, offset=start)
+            for start in starts
+        ]
+
+    def _detect_counter(self):
+        self._detect = False
+        if self.columns < 3:
+            return
+        P = self.packet_size
+        frames = np.frombuffer(self._buffer, dtype="<u2", count=self.chunk_words)
+        accessory = frames.reshape(self.columns, P)[:, P - ACCESSORY_ROWS :]
+        steps = np.diff(accessory.astype(np.int64), axis=0) % COUNTER_MODULUS
+        rows = np.flatnonzero((steps == steps[0]).all(axis=0) & (steps[0] != 0))
+        if len(rows):
+            self._lock(int(rows[0]), int(steps[0, rows[0]]))
+
+    def _counters(self, pos):
+        words = np.frombuffer(
+            self._buffer, dtype="<u2", count=self.chunk_words, offset=pos
+        )
+        return words[self._counter_index].astype(np.int64)
+
+    def _first_break(self, pos, counters):
+        """
+        None if the chunk at `pos` is aligned, else the frame after which
+        the alignment was lost (_WAIT until that can be decided).
+        """
+        step = self.counter_step
+        broken = np.flatnonzero(np.diff(counters) % COUNTER_MODULUS != step)
+        if not len(broken):
+            return None
+        if len(broken) > 1:
+            return int(broken[0])
+        if broken[0] == 0 and self._expected not in (None, counters[0]):
+            # Not a gap but a first frame that fits neither neighbour
+            return 0
+        # A jump is frames dropped by the device only if the counter then
+        # continues for search_columns frames, looking into the following
+        # chunk when the jump is close to the end of this one
+        k = int(broken[0])
+        extra = self.search_columns - 1 - (self.columns - 2 - k)
+        if extra <= 0:
+            return None
+        P = self.packet_size
+        words = (extra - 1) * P + self._counter_word + 1
+        if len(self._buffer) < pos + self.chunk_bytes + 2 * words:
+            return _WAIT
+        following = np.frombuffer(
+            self._buffer, dtype="<u2", count=words, offset=pos + self.chunk_bytes
+        )[self._counter_word :: P].astype(np.int64)
+        steps = np.diff(following, prepend=counters[-1]) % COUNTER_MODULUS
+        if (steps == step).all():
+            return None
+        return k
+
+    def _realign(self, pos, counters, broken):
+        """
+        Remove the bytes between the good frames of the chunk at `pos`
+        (up to frame `broken`) and the next frame boundary; False until
+        that boundary is found. The good frames are kept, except a last
+        one cut short by the boundary (bytes lost rather than inserted).
+        """
+        frame = 2 * self.packet_size
+        keep = broken + 1
+        if broken == 0 and counters[0] != self._expected:
+            keep = 0
+        end = pos + frame * keep
+        start = max(pos + 1, pos + frame * broken)
+        while True:
+            result = self._search(start)
+            if result is None:
+                # Bytes already searched past the good frames are garbage
+                if start > end:
+                    del self._buffer[end:start]
+                    self._skipped += start - end
+                return False
+            start, aligned = result
+            if aligned:
+                break
+        keep = min(keep, (start - pos) // frame)
+        # A kept frame must come before the one found; stray bytes can
+        # look like a counter that fits the frames before them
+        word = start + 2 * self._counter_word
+        following = int.from_bytes(self._buffer[word : word + 2], "little")
+        while keep:
+            ahead = (following - counters[keep - 1]) % COUNTER_MODULUS
+            if 0 < ahead < COUNTER_MODULUS // 2:
+                break
+            keep -= 1
+        end = pos + frame * keep
+        if start == end:
+            # Nothing to remove: the break was a jump (frames dropped by the
+            # device) followed by another one in the same chunk. The frames
+            # before it are dropped so the chunk from `start` holds one jump
+            del self._buffer[pos:start]
+            self._skipped += start - pos
+            return True
+        del self._buffer[end:start]
+        self._skipped += start - end
+        return True
+
+    def _search(self, pos):
+        """
+        (offset, True) of the first frame boundary at or after `pos`: the
+        counter positions of `search_columns` frames must step by
+        counter_step, allowing one jump after the first frame.
+        (pos + 2 * P, False) when no offset fits, None until enough bytes
+        are buffered.
+        """
+        P = self.packet_size
+        m = self.search_columns
+        if len(self._buffer) - pos < 2 * (m + 2) * P + 1:
+            return None
+        # A frame starting in the first 2 * P bytes has its counter in the
+        # first row of words, or in the second one when the counter comes
+        # before the search position within the frame
+        second = np.arange(P) < self._counter_word
+        best = None
+        for parity in (0, 1):
+            words = np.frombuffer(
+                self._buffer, dtype="<u2", count=(m + 2) * P, offset=pos + parity
+            ).reshape(m + 2, P)
+            words = words.astype(np.int64)
+            steps = (words[1:] - words[:-1]) % COUNTER_MODULUS
+            good = steps == self.counter_step
+            matches = np.where(
+                second,
+                good[1] & (good[1:].sum(axis=0) >= m - 1),
+                good[0] & (good[:-1].sum(axis=0) >= m - 1),
+            )
+            for j in np.flatnonzero(matches):
+                start = parity + 2 * int((j - self._counter_word) % P)
+                if best is None or start < best:
+                    best = start
+        if best is None:
+            return pos + 2 * P, False
+        return pos + best, True
+
+    def _account(self, counters):
+        step = self.counter_step
+        jumps = (np.diff(counters) - step) % COUNTER_MODULUS
+        lost = int(jumps.sum()) // step
+        expected = self._expected
+        if expected is not None:
+            lost += int((counters[0] - expected) % COUNTER_MODULUS) // step
+        self._expected = int(counters[-1] + step) % COUNTER_MODULUS
+        skipped, self._skipped = self._skipped, 0
+        if not lost and not skipped:
+            return
+        # The gap is before the chunk, or at the jump inside it
+        frame = expected if expected is not None else int(counters[0])
+        if frame == counters[0] and jumps.any():
+            frame = int(counters[np.argmax(jumps > 0)] + step) % COUNTER_MODULUS
+        self.lost_frames += lost
+        self.skipped_bytes += skipped
+        if skipped:
+            self.resyncs += 1
+        gap = StreamGap(
+            frame,
+            lost,
+            lost * self.samples_per_frame,
+            skipped,
+        )
+        self.gaps.append(gap)
+        if self.on_gap is not None:
+            self.on_gap(gap)
+
+
+def benchmark(blocks=4, garbage=7, runs=3, repeats=20):
+    """
+    (FsampVal, s per block, frames lost, bytes skipped) for `blocks`
+    one-second blocks with `runs` runs of `garbage` stray bytes inserted
+    in the second half of the stream, fed one block at a time. Stray bytes
+    must cost fewer frames than there are runs.
+    """
+    from utils.acquisition_profile import AcquisitionProfile, FsampVal
+    from utils.simulator import simulated_frames
+
+    results = []
+    for fsel in range(len(FsampVal)):
+        config = AcquisitionProfile(fsel_aux=fsel).layout()
+        stream = simulated_frames(config, 0, 500 * blocks)
+        # From the back, so earlier cut positions stay valid
+        for k in range(runs, 0, -1):
+            cut = len(stream) // 2 + k * len(stream) // (2 * runs + 2) + 1
+            stream = stream[:cut] + bytes(garbage) + stream[cut:]
+        block = config["blockData"]
+        elapsed = 0.0
+        for _ in range(repeats):
+            sync = BlockSync(config)
+            start = time.perf_counter()
+            for i in range(0, len(stream), block):
+                sync.feed(stream[i : i + block])
+            elapsed += time.perf_counter() - start
+        assert sync.lost_frames < runs, sync.lost_frames
+        assert sync.skipped_bytes == runs * garbage, sync.skipped_bytes
+        cost = elapsed / repeats / blocks
+        results.append((FsampVal[fsel], cost, sync.lost_frames, sync.skipped_bytes))
+    return results
+
+
+if __name__ == "__main__":
+    print("4 one-second blocks, 3 runs of 7 stray bytes in blocks 3 and 4:")
+    for rate, cost, lost, skipped in benchmark():
+        print(
+            f"  AUX {rate:4d} Hz: {cost * 1e3:6.3f} ms per block, "
+            f"{lost} frame(s) lost, {skipped} bytes skipped"
+        )
@@ -1,192 +1,256 @@
 import socket
+import time
+
 import numpy as np
 from PyQt5.QtCore import QThread, pyqtSignal
 
-
-def CRC8(Vector, Len):
-    crc = 0
-    j = 0
-
-    while Len > 0:
-        Extract = Vector[j]
-        for i in range(8, 0, -1):
-            Sum = crc % 2 ^ Extract % 2
-            crc //= 2
-
-            if Sum > 0:
-                a = format(crc, "08b")
-                b = format(140, "08b")
-                str_list = [0] * 8
-
-                for k in range(8):
-                    str_list[k] = int(a[k] != b[k])
-
-                crc = int("".join(map(str, str_list)), 2)
-
-            Extract //= 2
-
-        Len -= 1
-        j += 1
-
-    return crc
+from utils.acquisition_profile import FRAMES_PER_SECOND, AcquisitionProfile, CRC8
+from utils.block_sync import BlockSync
+from utils.decode_plan import DecodePlan
+from utils.frame_pool import FramePool
 
 
 class DAQReceiver(QThread):
     """
     Threaded DAQ receiver that emits aux channel data as a 2D numpy array
-    with shape (16, N_samples). Signals:
+    with shape (16, N_samples): float32 in physical units, or raw int16
+    counts when the profile's sample_dtype is "int16" (multiply by
+    profile.sample_scale). Device settings come from an
+    AcquisitionProfile, which can be shared between receivers. With
+    emg=True the EMG inputs (HRES = 0) are decoded too and emitted per
+    input as float32 (NumChan, N) arrays. Blocks are cut from the stream
+    by a BlockSync, which re-aligns after stray or lost bytes. Decoded
+    blocks go into frames from a FramePool: a consumer that keeps one is
+    never overwritten, but one that lets go within FRAME_POOL_SIZE blocks
+    lets the receiver run without allocating output arrays.
+
+    When the link drops (connection closed, socket error or no data for
+    plot_time + 2 s) the receiver reconnects for up to
+    profile.reconnect_timeout seconds, reusing the cached layout and
+    decode plan. The outage is reported as a stream_gap of the samples
+    the device produced meanwhile, so consumers can keep their history
+    and timeline in step. The device restarts its frame counter with
+    every stream, so the gap is estimated from the clock: the time the
+    new stream was requested minus the end of the frames counted since
+    the previous one was requested. Both ends are taken the same way, so
+    network latency cancels and the error (about one frame) does not
+    add up over outages. Signals:
       - data_received(np.ndarray)
+      - emg_received(int, np.ndarray) : (input index, samples)
+      - block_received(np.ndarray)    : the raw block (flat "<i2",
+                                         read-only), e.g. for a Recorder
+      - stream_gap(int, int)          : (AUX samples lost per channel,
+                                         bytes skipped), before the first
+                                         block after the gap
       - connected()
+      - link_lost(str)                : reason; reconnecting starts
+      - reconnected(float)            : seconds the link was down
       - disconnected()
       - error(str)
     """
 
+    # Delay before the second reconnect attempt (s), doubled up to the
+    # maximum; the first attempt is immediate
+    RECONNECT_DELAY = 0.05
+    RECONNECT_MAX_DELAY = 2.0
+    # Output frames recycled per kind (raw AUX counts, decoded samples)
+    FRAME_POOL_SIZE = 8
+    # receive()'s reason when the device closed the connection
+    CLOSED = "connection closed"
+
     data_received = pyqtSignal(np.ndarray)
+    emg_received = pyqtSignal(int, np.ndarray)
+    block_received = pyqtSignal(np.ndarray)
+    stream_gap = pyqtSignal(int, int)
     connected = pyqtSignal()
+    link_lost = pyqtSignal(str)
+    reconnected = pyqtSignal(float)
     disconnected = pyqtSignal()
     error = pyqtSignal(str)
 
-    def __init__(self, host="169.254.1.10", port=23456, parent=None):
+    def __init__(self, profile=None, host=None, port=None, emg=False, parent=None):
         super().__init__(parent)
-        self.host = host
-        self.port = port
+        self.profile = profile if profile is not None else AcquisitionProfile()
+        self.emg = emg
+        self.host = host or self.profile.host
+        self.port = port or self.profile.port
         self.running = False
         self.tcp_socket = None
         self.daq_config = {}
+        # The device's reply to the settings request of the last handshake
+        self.settings = None
+        self.decode_plan = None
+        self.sync = None
+        self.raw_frames = None
+        self.frames = None
+        # time.monotonic() the current stream was requested, and the frames
+        # of it emitted or reported lost since
+        self._stream_start = None
+        self._stream_frames = 0
 
     def run(self):
         try:
             self.running = True
             self.connect_daq()
-            buffer = b""
-
             while self.running:
-                # Receive chunk (blocking)
-                chunk = self.tcp_socket.recv(self.daq_config["blockData"])
-                if not chunk:
+                reason = self.receive()
+                if not self.running:
+                    break
+                if self.profile.reconnect_timeout <= 0:
+                    # Without reconnecting, a closed stream just ends the
+                    # session; a socket error is still reported
+                    if reason != self.CLOSED:
+                        self.error.emit(reason)
+                    break
+                if not self.reconnect(reason):
+                    if self.running:
+                        self.error.emit(f"Link lost: {reason}")
                     break
-                buffer += chunk
-
-                while len(buffer) >= self.daq_config["blockData"]:
-                    packet = buffer[: self.daq_config["blockData"]]
-                    buffer = buffer[self.daq_config["blockData"] :]
-
-                    Temp = np.frombuffer(packet, dtype="<i2")
-                    if len(Temp) == self.daq_config["PacketSize1Block"] * 500:
-                        Data = Temp.reshape(
-                            self.daq_config["PacketSize1Block"], 500, order="F"
-                        )
-                        # Extract AUX channels
-                        Temp_aux = Data[
-                            self.daq_config["Ptr_IN"][10] : -128, :
-                        ].reshape(
-                            1,
-                            16
-                            * self.daq_config["FsampVal"][self.daq_config["FSelAux"]]
-                            * self.daq_config["PlotTime"],
-                            order="F",
-                        )
-                        Sig_AUX = Temp_aux.reshape(
-                            16,
-                            self.daq_config["FsampVal"][self.daq_config["FSelAux"]]
-                            * self.daq_config["PlotTime"],
-                            order="F",
-                        ).astype(np.int32)
-
-                        Sig_AUX_scaled = Sig_AUX * self.daq_config["AuxGainFactor"]
-                        # Emit shape (16, N)
-                        self.data_received.emit(Sig_AUX_scaled)
         except Exception as e:
             self.error.emit(str(e))
         finally:
             self.disconnect()
 
-    def connect_daq(self):
-        # Configuration (taken from original script)
-        PlotTime = 1
-        IN_Active = [1, 1, 1, 0, 0, 0, 0, 0, 0, 0]
-        Mode = [0] * 10
-        Gain = [0] * 10
-        HRES = [0] * 10
-        HPF = [1] * 10
-        Fsamp = [1] * 8 + [0, 0]
-
-        ChVsType = [0, 14, 22, 38, 46, 70, 102, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-
-        AuxFsamp = [0, 16, 32, 48]
-        FsampVal = [500, 2000, 4000, 8000]
-        SizeAux = [16, 64, 128, 256]
-        FSelAux = 0
-
-        AnOutINSource = 2
-        AnOutChan = 1
-        AnOutGain = int("00100000", 2)
-
-        TCPPort = self.port
-        AuxGainFactor = 5 / 2**16 / 0.5
-
-        # Build configuration string
-        ConfString = [0] * 15
-        ConfString[0] = (
-            int("10000000", 2) + AuxFsamp[FSelAux] + IN_Active[9] * 2 + IN_Active[8]
+    def receive(self):
+        """
+        Decode and emit blocks until stop() is called or the link drops;
+        returns the reason the link dropped.
+        """
+        raw = self.profile.sample_dtype == "int16"
+        try:
+            while self.running:
+                # Receive chunk (blocking, up to link_timeout)
+                chunk = self.tcp_socket.recv(self.daq_config["blockData"])
+                if not chunk:
+                    return self.CLOSED
+
+                for Temp in self.sync.feed(chunk):
+                    self.block_received.emit(Temp)
+                    # The frame crosses threads, so each block gets its own
+                    # output frame from the pools; extraction itself
+                    # allocates nothing.
+                    if raw:
+                        raw_frame = self.raw_frames.acquire()
+                        Sig_AUX = self.decode_plan.decode_raw(Temp, out=raw_frame)
+                    if not raw or self.emg:
+                        out = self.frames.acquire()
+                        aux = self.decode_plan.decode(Temp, out=out)
+                        if not raw:
+                            Sig_AUX = aux
+                    # Emit shape (16, N)
+                    self.data_received.emit(Sig_AUX)
+                    if self.emg:
+                        for i, Sig_EMG in self.decode_plan.views(out)[1]:
+                            self.emg_received.emit(i, Sig_EMG)
+                    if raw:
+                        self.raw_frames.release(raw_frame)
+                    if not raw or self.emg:
+                        self.frames.release(out)
+                    self._stream_frames += self.sync.columns
+        except OSError as e:
+            return str(e) or type(e).__name__
+        return "stopped"
+
+    def reconnect(self, reason):
+        """
+        Re-open the stream, first immediately and then with exponential
+        backoff. Returns False if reconnect_timeout passes (or stop() is
+        called) before the link is back.
+        """
+        timeout = self.profile.reconnect_timeout
+        if timeout <= 0:
+            return False
+        lost_at = time.monotonic()
+        # Where the device's timeline would continue: the end of the frames
+        # counted since the lost stream was requested
+        received_until = self._stream_start + self._stream_frames / FRAMES_PER_SECOND
+        self.link_lost.emit(reason)
+        self.close_socket()
+        delay = 0.0
+        while self.running:
+            try:
+                restored = self.open_stream()
+            except OSError:
+                self.close_socket()
+            else:
+                lost = round((restored - received_until) * FRAMES_PER_SECOND)
+                if lost > 0:
+                    self.stream_gap.emit(lost * self.sync.samples_per_frame, 0)
+                self.reconnected.emit(restored - lost_at)
+                return True
+            delay = min(max(2 * delay, self.RECONNECT_DELAY), self.RECONNECT_MAX_DELAY)
+            if time.monotonic() - lost_at + delay > timeout:
+                return False
+            deadline = time.monotonic() + delay
+            while self.running and time.monotonic() < deadline:
+                self.msleep(10)
+        return False
+
+    def open_socket(self):
+        # recv() times out when no data arrives for a while, so a silently
+        # dead link is noticed too
+        self.tcp_socket = socket.create_connection(
+            (self.host, self.port), timeout=self.profile.plot_time + 2
         )
-        ConfString[1] = 0
-        for i in range(8):
-            ConfString[1] += IN_Active[i] * (2**i)
-        ConfString[2] = AnOutGain + AnOutINSource
-        ConfString[3] = AnOutChan
-        for i in range(10):
-            ConfString[4 + i] = (
-                Mode[i] * 64 + Gain[i] * 16 + HPF[i] * 8 + HRES[i] * 4 + Fsamp[i]
-            )
-        ConfString[14] = CRC8(ConfString, 14)
-
-        # Connect to DAQ
-        self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.tcp_socket.connect((self.host, TCPPort))
         # Give a reasonably large receive buffer
         self.tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024 * 8)
-        self.tcp_socket.sendall(bytearray(ConfString))
 
-        # Calculate packet parameters
-        NumChan = [0] * 10
-        Ptr_IN = [0] * 11
-        Size_IN = [0] * 11
+    def connect_daq(self):
+        # Connect to DAQ
+        self.open_socket()
 
-        # Query settings
+        # Query settings before streaming starts, so the reply cannot end up
+        # between stream bytes. The layout is computed once per probe
+        # configuration.
         settings = self.send_request(1)
-        # settings is raw bytes; keep safe indexing
-        if isinstance(settings, (bytes, bytearray)) and len(settings) >= 11:
-            settings_arr = settings
-        else:
-            settings_arr = [0] * 11
-
-        for i in range(10):
-            idx = settings_arr[i + 1] if i + 1 < len(settings_arr) else 0
-            NumChan[i] = ChVsType[idx] if idx < len(ChVsType) else 0
-            if NumChan[i] == 0:
-                IN_Active[i] = 0
-            if IN_Active[i] == 1:
-                Size_IN[i] = (HRES[i] + 1) * FsampVal[Fsamp[i]] // 500 * NumChan[i]
-            Ptr_IN[i + 1] = Ptr_IN[i] + Size_IN[i]
-
-        PacketSize1Block = Ptr_IN[10] + SizeAux[FSelAux] + 128
-        blockData = PacketSize1Block * 500 * PlotTime * 2
-
-        # Store config
-        self.daq_config.update(
-            {
-                "PlotTime": PlotTime,
-                "Ptr_IN": Ptr_IN,
-                "PacketSize1Block": PacketSize1Block,
-                "blockData": blockData,
-                "FSelAux": FSelAux,
-                "FsampVal": FsampVal,
-                "AuxGainFactor": AuxGainFactor,
-            }
-        )
+        self.settings = bytes(settings)
+        layout = self.profile.layout(settings)
+        self.daq_config.update(layout)
+        if self.decode_plan is None or self.decode_plan.daq_config is not layout:
+            self.decode_plan = DecodePlan(layout, emg=self.emg)
+            self.sync = BlockSync(layout, on_gap=self._on_gap)
+            self.make_frame_pools()
+        self.sync.reset()
+        self._start_stream()
         self.connected.emit()
 
+    def make_frame_pools(self):
+        raw = self.profile.sample_dtype == "int16"
+        size = self.FRAME_POOL_SIZE
+        self.raw_frames = self.frames = None
+        if raw:
+            self.raw_frames = FramePool(self.decode_plan.empty_raw_output, size)
+        if not raw or self.emg:
+            self.frames = FramePool(self.decode_plan.empty_output, size)
+
+    def open_stream(self):
+        """
+        Reconnect with the cached layout and decode plan: only the
+        configuration string is sent. Returns the time it was sent.
+        """
+        self.open_socket()
+        self.sync.reset()
+        return self._start_stream()
+
+    def _start_stream(self):
+        """Send the configuration string; returns the time it was sent."""
+        self.tcp_socket.sendall(self.profile.conf_string())
+        self._stream_start = time.monotonic()
+        self._stream_frames = 0
+        return self._stream_start
+
+    def close_socket(self):
+        if self.tcp_socket is not None:
+            try:
+                self.tcp_socket.close()
+            except OSError:
+                pass
+            self.tcp_socket = None
+
+    def _on_gap(self, gap):
+        self._stream_frames += gap.lost_frames
+        self.stream_gap.emit(gap.lost_samples, gap.skipped_bytes)
+
     def send_request(self, command):
         cmd = [command, CRC8([command], 1)]
         try:
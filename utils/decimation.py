@@ -0,0 +1,50 @@
+import numpy as np
+
+
+def decimation_plan(n, max_points):
+    """(step, start) used by minmax_decimate for `n` samples."""
+    if n <= max_points:
+        return 1, 0
+    # The smallest step that fits, so less than one bin is dropped
+    step = -(-n // max(max_points // 2, 1))
+    return step, n % step
+
+
+def minmax_decimate(data, max_points, out=None):
+    """
+    Reduce (channels, n) `data` to at most `max_points` columns of per-bin
+    (min, max) pairs, so peaks stay visible. Bins cover the newest samples;
+    up to one bin of the oldest samples is dropped. Returns (data, step,
+    start): the (possibly unchanged) array, the bin length and the index
+    of the first sample used. Short bins use pairwise np.minimum/np.maximum
+    over the bin columns, which is much faster than a reduction along a
+    short last axis; long bins are reduced directly.
+    """
+    channels, n = data.shape
+    step, start = decimation_plan(n, max_points)
+    if step == 1:
+        return data, 1, 0
+    bins = (n - start) // step
+    if out is None:
+        out = np.empty((channels, 2 * bins), dtype=data.dtype)
+    blocks = data[:, start:].reshape(channels, bins, step)
+    lo, hi = out[:, 0::2], out[:, 1::2]
+    if step > 32:
+        np.min(blocks, axis=2, out=lo)
+        np.max(blocks, axis=2, out=hi)
+        return out, step, start
+    lo[:] = blocks[..., 0]
+    hi[:] = blocks[..., 0]
+    for j in range(1, step):
+        np.minimum(lo, blocks[..., j], out=lo)
+        np.maximum(hi, blocks[..., j], out=hi)
+    return out, step, start
+
+
+def decimated_times(n, step, start, sample_rate):
+    """Sample times (s, float32) matching minmax_decimate's columns."""
+    if step == 1:
+        t = np.arange(n)
+    else:
+        t = (start + np.arange((n - start) // step) * step).repeat(2)
+    return (t / sample_rate).astype(np.float32)
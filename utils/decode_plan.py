@@ -0,0 +1,219 @@
+import time
+import tracemalloc
+
+import numpy as np
+
+from utils.acquisition_profile import (
+    ACCESSORY_ROWS,
+    NUM_AUX,
+    AcquisitionProfile,
+    FsampVal,
+)
+from utils.block_sync import BlockSync
+
+
+class DecodePlan:
+    """
+    Slice-based decoder for one daq_config. In the Fortran-ordered block
+    the AUX rows of every frame (and the rows of each EMG input) are
+    contiguous and hold a few samples of every channel, channel fastest,
+    so each input is a strided (columns, rows) view of the block. decode()
+    casts and scales those views with out= into a preallocated float32
+    buffer, so decoding allocates nothing and no index is gathered. The
+    (channels, n) views of the result are Fortran-ordered, like the
+    arrays of the original reshape decoder. After decode():
+      - aux : (16, N_aux) float32 view
+      - emg : list of (input, (NumChan, N_in) float32 view) for active
+              inputs with HRES = 0
+    Both views are overwritten by the next decode() unless `out` is given.
+    With `columns` set, the plan decodes that many frames (block columns)
+    instead of a whole block.
+    """
+
+    def __init__(self, daq_config, emg=False, columns=None):
+        self.daq_config = daq_config
+        self.packet_size = packet_size = daq_config["PacketSize1Block"]
+        # A plan for fewer columns decodes partial blocks (sub-block chunks)
+        columns = 500 * daq_config["PlotTime"] if columns is None else columns
+        self.columns = columns
+        self.block_samples = packet_size * columns
+
+        ptr_aux = daq_config["Ptr_IN"][10]
+        size_aux = packet_size - ptr_aux - ACCESSORY_ROWS
+        inputs = [("aux", ptr_aux, size_aux, NUM_AUX, daq_config["AuxGainFactor"])]
+        if emg:
+            for i in range(10):
+                if (
+                    not daq_config["IN_Active"][i]
+                    or daq_config["HRES"][i]
+                    or not daq_config["Size_IN"][i]
+                ):
+                    continue
+                inputs.append(
+                    (
+                        i,
+                        daq_config["Ptr_IN"][i],
+                        daq_config["Size_IN"][i],
+                        daq_config["NumChan"][i],
+                        daq_config["GainFactor"],
+                    )
+                )
+
+        # (key, output slice, block rows, channels, gain) for each input
+        self._segments = []
+        start = 0
+        for key, ptr, size, channels, gain in inputs:
+            stop = start + size * columns
+            self._segments.append(
+                (key, slice(start, stop), slice(ptr, ptr + size), channels, gain)
+            )
+            start = stop
+        self.size = start
+        self.out = self.empty_output()
+        self._raw = np.empty(size_aux * columns, dtype=np.int16)
+        self.aux, self.emg = self._views(self.out)
+
+    def _views(self, out):
+        aux = None
+        emg = []
+        for key, span, _, channels, _ in self._segments:
+            view = out[span].reshape(-1, channels).T
+            if key == "aux":
+                aux = view
+            else:
+                emg.append((key, view))
+        return aux, emg
+
+    def _rows(self, block):
+        if not isinstance(block, np.ndarray):
+            block = np.frombuffer(block, dtype="<i2")
+        if block.size != self.block_samples:
+            raise ValueError(
+                f"Block has {block.size} samples, expected {self.block_samples}"
+            )
+        return block.reshape(self.columns, self.packet_size)
+
+    def empty_output(self):
+        """A fresh flat float32 output array suitable for decode(out=...)."""
+        return np.empty(self.size, dtype=np.float32)
+
+    def empty_raw_output(self):
+        """A fresh flat int16 output array suitable for decode_raw(out=...)."""
+        return np.empty(len(self._raw), dtype=np.int16)
+
+    def decode(self, block, out=None):
+        """
+        Decode one flat "<i2" block (bytes or array). Returns the AUX view;
+        when `out` is given the result is written there and the views refer
+        to it.
+        """
+        rows = self._rows(block)
+        target = self.out if out is None else out
+        for _, span, block_rows, _, gain in self._segments:
+            # Casting first and scaling in place avoids the cast buffers a
+            # mixed-type multiply allocates on every call
+            segment = target[span].reshape(self.columns, -1)
+            np.copyto(segment, rows[:, block_rows], casting="unsafe")
+            segment *= gain
+        return self.aux if out is None else self._views(out)[0]
+
+    def decode_raw(self, block, out=None):
+        """
+        The AUX samples of one block as raw int16 counts, a (16, N_aux)
+        view of `out` (from empty_raw_output()), for the int16 sample_dtype
+        policy.
+        """
+        rows = self._rows(block)
+        out = self._raw if out is None else out
+        _, _, block_rows, channels, _ = self._segments[0]
+        np.copyto(out.reshape(self.columns, -1), rows[:, block_rows])
+        return out.reshape(-1, channels).T
+
+    def views(self, out):
+        """(aux, emg) views into an output array filled by decode(out=...)."""
+        return self._views(out)
+
+
+class StreamDecoder:
+    """
+    Decodes a raw byte stream in chunks of `columns` frames (2 ms each)
+    rather than whole blocks, so samples are available shortly after they
+    arrive. feed() returns the AUX arrays (16, n) of every complete chunk,
+    each in its own array. Chunks are cut by a BlockSync (`sync`), which
+    restores the frame alignment after stray or lost bytes and counts lost
+    frames; `on_gap` is passed on to it.
+    """
+
+    def __init__(self, daq_config, columns=10, counter_row=None, on_gap=None):
+        self.plan = DecodePlan(daq_config, columns=columns)
+        self.sync = BlockSync(
+            daq_config, columns, counter_row=counter_row, on_gap=on_gap
+        )
+
+    def reset(self):
+        self.sync.reset()
+
+    def feed(self, data):
+        chunks = []
+        for raw in self.sync.feed(data):
+            out = self.plan.empty_output()
+            chunks.append(self.plan.decode(raw, out=out))
+        return chunks
+
+
+def reshape_decode(Temp, daq_config):
+    # The original two-reshape decoder, kept for benchmarking
+    columns = 500 * daq_config["PlotTime"]
+    n_aux = daq_config["FsampVal"][daq_config["FSelAux"]] * daq_config["PlotTime"]
+    Data = Temp.reshape(daq_config["PacketSize1Block"], columns, order="F")
+    Temp_aux = Data[daq_config["Ptr_IN"][10] : -128, :].reshape(
+        1, 16 * n_aux, order="F"
+    )
+    Sig_AUX = Temp_aux.reshape(16, n_aux, order="F").astype(np.int32)
+    return Sig_AUX * daq_config["AuxGainFactor"]
+
+
+def benchmark(repeats=200):
+    """Time the reshape decoder against DecodePlan at every FsampVal."""
+    results = []
+    for fsel in range(len(FsampVal)):
+        profile = AcquisitionProfile(fsel_aux=fsel)
+        config = profile.layout()
+        block = np.random.randint(
+            -(2**15), 2**15, config["blockData"] // 2, dtype=np.int16
+        )
+        plan = DecodePlan(config)
+        assert np.allclose(plan.decode(block), reshape_decode(block, config))
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            reshape_decode(block, config)
+        t_reshape = (time.perf_counter() - start) / repeats
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            plan.decode(block)
+        t_plan = (time.perf_counter() - start) / repeats
+
+        tracemalloc.start()
+        reshape_decode(block, config)
+        a_reshape = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        plan.decode(block)
+        a_plan = tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.stop()
+        results.append((FsampVal[fsel], t_reshape, t_plan, a_reshape, a_plan))
+    return results
+
+
+if __name__ == "__main__":
+    print(
+        f"{'FsampVal':>8} {'reshape (us)':>13} {'plan (us)':>10} "
+        f"{'reshape alloc (kB)':>19} {'plan alloc (kB)':>16}"
+    )
+    for rate, t_reshape, t_plan, a_reshape, a_plan in benchmark():
+        print(
+            f"{rate:>8} {t_reshape * 1e6:>13.1f} {t_plan * 1e6:>10.1f} "
+            f"{a_reshape / 1024:>19.1f} {a_plan / 1024:>16.1f}"
+        )
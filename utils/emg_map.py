@@ -0,0 +1,210 @@
+"""
+Live HD-EMG RMS map: windowed RMS per electrode, shown as a grid image.
+
+    python -m utils.emg_map [profile.json]
+
+connects a DAQReceiver with EMG decoding and shows the RMS map of the
+first active input. With --benchmark it instead prints the processing cost
+of one second of data at 2 kHz for each grid size.
+"""
+
+import sys
+import threading
+import time
+
+import numpy as np
+from PyQt5.QtWidgets import (
+    QApplication,
+    QComboBox,
+    QLabel,
+    QMainWindow,
+    QVBoxLayout,
+    QWidget,
+)
+from PyQt5.QtCore import Qt, QTimer
+
+from utils.acquisition_profile import AcquisitionProfile, ChVsType
+from utils.feedback import StreamingEnvelope
+
+# Channels each probe sends after its electrodes (not part of the grid)
+PROBE_EXTRA_CHANNELS = 6
+
+# Electrode count -> (rows, columns) of the grid, electrodes row by row
+ELECTRODE_GRIDS = {
+    8: (2, 4),
+    16: (4, 4),
+    32: (4, 8),
+    40: (5, 8),
+    64: (8, 8),
+    96: (8, 12),
+}
+
+
+def electrode_grid(num_chan):
+    """(rows, columns) of the electrode grid of a probe with `num_chan`."""
+    electrodes = num_chan - PROBE_EXTRA_CHANNELS
+    if electrodes in ELECTRODE_GRIDS:
+        return ELECTRODE_GRIDS[electrodes]
+    return (1, max(num_chan, 1))
+
+
+class GridRMS:
+    """
+    Windowed RMS of every electrode of one probe. Each chunk is squared
+    and run through a StreamingEnvelope (a cumulative-sum moving average
+    that carries its state across chunks); map() is the RMS at the newest
+    sample, shaped as the electrode grid. process() may run on the
+    receiver thread while map() is read from the GUI. Qt-free.
+    """
+
+    def __init__(self, num_chan, sample_rate, window=0.1):
+        self.shape = electrode_grid(num_chan)
+        self.electrodes = self.shape[0] * self.shape[1]
+        self.envelope = StreamingEnvelope(self.electrodes, window * sample_rate)
+        self._map = np.zeros(self.shape, dtype=np.float32)
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.envelope.reset()
+            self._map[:] = 0
+
+    def process(self, chunk):
+        """Feed (NumChan, n) samples; returns the updated RMS map."""
+        x = chunk[: self.electrodes]
+        with self._lock:
+            mean_square = self.envelope.process(x * x)
+            np.sqrt(mean_square[:, -1].reshape(self.shape), out=self._map)
+        return self._map
+
+    def map(self):
+        """A copy of the latest RMS map."""
+        with self._lock:
+            return self._map.copy()
+
+
+class EMGMapWindow(QMainWindow):
+    """
+    RMS map of one EMG input of a DAQReceiver created with emg=True. RMS is
+    updated on the receiver thread for every emg_received chunk (direct
+    connection); the GUI thread only redraws the image from a timer with
+    a single ImageItem.setImage call.
+    """
+
+    def __init__(self, daq_receiver, window=0.1, refresh_ms=33, parent=None):
+        super().__init__(parent)
+        import pyqtgraph as pg
+
+        self.setWindowTitle("HD-EMG RMS Map")
+        self.setGeometry(200, 200, 600, 600)
+
+        self.daq = daq_receiver
+        self.window = window
+        self.grids = {}
+        self.level = 0.0
+        # Input shown, read on the receiver thread
+        self.selected_input = None
+        self._dirty = False
+
+        widget = QWidget()
+        self.setCentralWidget(widget)
+        layout = QVBoxLayout()
+        widget.setLayout(layout)
+
+        self.input_box = QComboBox()
+        self.input_box.currentIndexChanged.connect(self.on_input_changed)
+        layout.addWidget(self.input_box)
+
+        self.plot_widget = pg.PlotWidget()
+        self.plot_widget.setAspectLocked(True)
+        self.plot_widget.invertY(True)
+        self.image = pg.ImageItem(axisOrder="row-major")
+        self.image.setColorMap(pg.colormap.get("viridis"))
+        self.plot_widget.addItem(self.image)
+        layout.addWidget(self.plot_widget)
+
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+
+        self.daq.emg_received.connect(self.on_emg, Qt.DirectConnection)
+
+        self.gui_timer = QTimer()
+        self.gui_timer.timeout.connect(self.refresh_map)
+        self.gui_timer.start(refresh_ms)
+
+    def on_emg(self, index, samples):
+        # Receiver thread: no widgets here; refresh_map() lists new inputs
+        grid = self.grids.get(index)
+        if grid is None:
+            rate = self.daq.profile.input_rate(index)
+            grid = GridRMS(samples.shape[0], rate, self.window)
+            self.grids[index] = grid
+        grid.process(samples)
+        if index == self.selected_input:
+            self._dirty = True
+
+    def on_input_changed(self):
+        self.selected_input = self.input_box.currentData()
+        self.level = 0.0
+        self._dirty = True
+
+    def refresh_map(self):
+        for index in sorted(self.grids):
+            if self.input_box.findData(index) < 0:
+                self.input_box.addItem(f"Input {index + 1}", index)
+        if not self._dirty:
+            return
+        self._dirty = False
+        grid = self.grids.get(self.selected_input)
+        if grid is None:
+            return
+        rms = grid.map()
+        # Colour scale follows the peak and decays slowly
+        self.level = max(self.level * 0.99, float(rms.max()))
+        self.image.setImage(rms, autoLevels=False, levels=(0.0, self.level or 1.0))
+        rows, cols = grid.shape
+        self.status_label.setText(
+            f"{rows} x {cols} electrodes, peak RMS {self.level:.4g}"
+        )
+
+    def closeEvent(self, event):
+        self.gui_timer.stop()
+        self.daq.emg_received.disconnect(self.on_emg)
+        event.accept()
+
+
+def benchmark(seconds=1.0, rate=2000, chunk=0.02):
+    """Seconds of CPU per second of data for each grid size."""
+    results = []
+    n = int(chunk * rate)
+    for num_chan in sorted(set(ChVsType) - {0}):
+        grid = GridRMS(num_chan, rate)
+        data = np.random.normal(0, 1e-4, (num_chan, n)).astype(np.float32)
+        chunks = int(seconds / chunk)
+        start = time.perf_counter()
+        for _ in range(chunks):
+            grid.process(data)
+        cost = (time.perf_counter() - start) / seconds
+        results.append((num_chan, grid.shape, cost))
+    return results
+
+
+if __name__ == "__main__":
+    if "--benchmark" in sys.argv:
+        for num_chan, shape, cost in benchmark():
+            print(
+                f"{num_chan:4d} channels ({shape[0]} x {shape[1]}): "
+                f"{cost * 1e3:6.2f} ms per second of data"
+            )
+        sys.exit()
+
+    from utils.daq_receiver import DAQReceiver
+
+    app = QApplication(sys.argv)
+    args = sys.argv[1:]
+    profile = AcquisitionProfile.from_file(args[0]) if args else AcquisitionProfile()
+    daq = DAQReceiver(profile, emg=True)
+    win = EMGMapWindow(daq)
+    win.show()
+    daq.start()
+    sys.exit(app.exec_())
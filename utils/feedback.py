@@ -0,0 +1,185 @@
+import socket
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from utils.acquisition_profile import AcquisitionProfile, CRC8
+from utils.decode_plan import StreamDecoder
+from utils.simulator import NovecentoSimulator
+
+
+class StreamingEnvelope:
+    """
+    Causal moving-average envelope over `window` samples that carries its
+    state across chunks, so chunked input gives the same result as one long
+    signal. With rectify=True the absolute value is averaged (EMG); for
+    force signals leave it off.
+    """
+
+    def __init__(self, channels, window, rectify=False):
+        self.window = max(int(window), 1)
+        self.rectify = rectify
+        self._tail = np.zeros((channels, self.window - 1), dtype=np.float64)
+        self._filled = 0
+
+    def reset(self):
+        self._tail[:] = 0
+        self._filled = 0
+
+    def process(self, chunk):
+        x = np.abs(chunk) if self.rectify else chunk
+        n = x.shape[1]
+        w = self.window
+        if w == 1:
+            return x.astype(np.float32)
+        ext = np.concatenate([self._tail, x], axis=1)
+        csum = np.cumsum(ext, axis=1)
+        csum = np.concatenate([np.zeros((ext.shape[0], 1)), csum], axis=1)
+        # Until the window is filled, average over the samples seen so far
+        counts = np.minimum(self._filled + np.arange(1, n + 1), w)
+        ends = np.arange(w, w + n)
+        out = (csum[:, ends] - csum[:, ends - counts]) / counts
+        self._tail = ext[:, -(w - 1) :]
+        self._filled = min(self._filled + n, w)
+        return out.astype(np.float32)
+
+
+def extrapolate(value, slope, last_time, max_extrapolate, display_time=None):
+    """value + slope * dt, with dt clamped to [0, max_extrapolate] seconds."""
+    if last_time is None:
+        return value
+    if display_time is None:
+        display_time = time.monotonic()
+    dt = min(max(display_time - last_time, 0.0), max_extrapolate)
+    return value + slope * np.float32(dt)
+
+
+class CursorState(
+    namedtuple("CursorState", ["value", "slope", "last_time", "max_extrapolate"])
+):
+    """Immutable copy of a FeedbackCursor that can be read from any thread."""
+
+    __slots__ = ()
+
+    def value_at(self, display_time=None):
+        return extrapolate(*self, display_time)
+
+
+class FeedbackCursor:
+    """
+    Per-channel feedback value for the display. Each update() takes newly
+    decoded samples and the wall-clock time the newest one arrived; the
+    envelope smooths them and the recent slope is kept, so value_at() can
+    extrapolate the value to the display time (capped at `max_extrapolate`
+    seconds) instead of showing a stale sample.
+    """
+
+    def __init__(
+        self,
+        channels,
+        sample_rate,
+        smoothing=0.02,
+        slope_window=0.01,
+        max_extrapolate=0.05,
+    ):
+        self.sample_rate = float(sample_rate)
+        self.envelope = StreamingEnvelope(channels, smoothing * sample_rate)
+        self.slope_samples = max(int(slope_window * sample_rate), 2)
+        self.max_extrapolate = max_extrapolate
+        self.value = np.zeros(channels, dtype=np.float32)
+        self.slope = np.zeros(channels, dtype=np.float32)
+        self.last_time = None
+
+    def reset(self):
+        self.envelope.reset()
+        self.value[:] = 0
+        self.slope[:] = 0
+        self.last_time = None
+
+    def update(self, samples, arrival_time=None):
+        smoothed = self.envelope.process(samples)
+        self.value = smoothed[:, -1].copy()
+        m = min(self.slope_samples, smoothed.shape[1])
+        if m >= 2:
+            self.slope = (smoothed[:, -1] - smoothed[:, -m]) * (
+                self.sample_rate / (m - 1)
+            )
+        self.last_time = time.monotonic() if arrival_time is None else arrival_time
+        return smoothed
+
+    def value_at(self, display_time=None):
+        return extrapolate(
+            self.value, self.slope, self.last_time, self.max_extrapolate, display_time
+        )
+
+    def snapshot(self):
+        return CursorState(
+            self.value.copy(), self.slope.copy(), self.last_time, self.max_extrapolate
+        )
+
+
+def measure_latency(
+    profile=None, smoothing=0.02, chunk_columns=10, display_rate=60.0, steps=5
+):
+    """
+    Display-to-force latency against the simulator: time from a simulated
+    force step (channel 0, 0 -> 1 V every 2 s) to the first display tick at
+    which the cursor passes half the step. Returns a list of latencies (s).
+    """
+    profile = profile if profile is not None else AcquisitionProfile()
+    sim = NovecentoSimulator(profile).start()
+    sock = socket.create_connection((sim.host, sim.port))
+    try:
+        sock.sendall(bytes([1, CRC8([1], 1)]))
+        settings = sock.recv(20)
+        config = profile.layout(settings)
+        sock.sendall(profile.conf_string())
+        sock.setblocking(False)
+
+        decoder = StreamDecoder(config, chunk_columns)
+        cursor = FeedbackCursor(16, profile.aux_rate, smoothing=smoothing)
+        latencies = []
+        level = 0
+        next_tick = time.monotonic()
+        while len(latencies) < steps:
+            try:
+                while True:
+                    data = sock.recv(65536)
+                    if not data:
+                        raise OSError("simulator closed the connection")
+                    now = time.monotonic()
+                    for chunk in decoder.feed(data):
+                        cursor.update(chunk, now)
+            except BlockingIOError:
+                pass
+
+            now = time.monotonic()
+            if now < next_tick:
+                time.sleep(min(next_tick - now, 0.001))
+                continue
+            next_tick += 1.0 / display_rate
+            shown = cursor.value_at(now)[0]
+            if sim.stream_start is None:
+                continue
+            # Steps happen at every even second of stream time
+            step_index = int((now - sim.stream_start) // 2.0)
+            expected = step_index % 2
+            if expected != level and abs(shown - expected) < 0.5:
+                step_time = sim.stream_start + 2.0 * step_index
+                latencies.append(now - step_time)
+                level = expected
+        return latencies
+    finally:
+        sock.close()
+        sim.stop()
+
+
+if __name__ == "__main__":
+    for smoothing in (0.005, 0.02, 0.05, 0.1):
+        latencies = measure_latency(smoothing=smoothing)
+        print(
+            f"smoothing {smoothing * 1e3:5.0f} ms: latency "
+            f"mean {np.mean(latencies) * 1e3:5.1f} ms, "
+            f"max {np.max(latencies) * 1e3:5.1f} ms"
+        )
@@ -0,0 +1,125 @@
+"""
+Recycled output arrays for decoded blocks.
+
+    python -m utils.frame_pool
+
+decodes blocks the way DAQReceiver does, into fresh arrays and into a
+FramePool, and reports the array memory tracemalloc sees allocated.
+"""
+
+import sys
+import threading
+import tracemalloc
+from collections import deque
+
+import numpy as np
+
+
+class FramePool:
+    """
+    A fixed set of `size` output arrays made by `factory()`, for a
+    producer that decodes each block into a frame with out= and passes it
+    on. acquire() hands out a released frame and release() gives one back,
+    usually right after the frame was emitted.
+
+    Consumers may keep a frame. A released frame is only reused once
+    nothing else refers to it or to a view of it (sys.getrefcount), so a
+    frame held in a queue, a batch or a baseline, or still waiting in a
+    queued signal for its slot to run, is never overwritten:
+    acquire() moves on to another one and, with all of them in use,
+    returns a newly allocated array instead (counted in `fallbacks`),
+    which the consumer can keep for good. As long as consumers let go of
+    frames within `size` blocks, nothing is allocated per block.
+    """
+
+    def __init__(self, factory, size=8):
+        self.factory = factory
+        self._frames = [factory() for _ in range(size)]
+        self._ids = {id(frame): k for k, frame in enumerate(self._frames)}
+        self._free = deque(range(size))
+        self._lock = threading.Lock()
+        # References to a frame nobody else holds, counted the way
+        # acquire() counts them
+        self._refs = sys.getrefcount(self._frames[0])
+        self.reused = 0
+        self.fallbacks = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    def acquire(self):
+        with self._lock:
+            for _ in range(len(self._free)):
+                k = self._free.popleft()
+                if sys.getrefcount(self._frames[k]) <= self._refs:
+                    self.reused += 1
+                    return self._frames[k]
+                # Released but still referenced: check again next time
+                self._free.append(k)
+            self.fallbacks += 1
+        return self.factory()
+
+    def release(self, frame):
+        """Give back a frame from acquire(); other arrays are ignored."""
+        with self._lock:
+            k = self._ids.get(id(frame))
+            if k is not None and self._frames[k] is frame and k not in self._free:
+                self._free.append(k)
+
+
+def measure_allocations(blocks=200, pool_size=8, hold=0):
+    """
+    {"fresh" | "pool": (bytes allocated per block, fallbacks)} for
+    decoding simulator blocks (16 AUX channels and three EMG inputs)
+    with DAQReceiver's out= path into fresh arrays or pooled frames, while
+    a consumer keeps the newest `hold` frames. The bytes are the mean
+    tracemalloc peak above the memory in use while one block is decoded,
+    so they include the small view objects decode() returns.
+    """
+    from utils.acquisition_profile import AcquisitionProfile
+    from utils.decode_plan import DecodePlan
+    from utils.simulator import settings_reply, simulated_frames
+
+    profile = AcquisitionProfile(probe_types=[1] * 10)
+    config = profile.layout(settings_reply(profile.probe_types))
+    plan = DecodePlan(config, emg=True)
+    block = np.frombuffer(simulated_frames(config, 0, profile.columns), dtype="<i2")
+
+    results = {}
+    for name in ("fresh", "pool"):
+        pool = FramePool(plan.empty_output, pool_size)
+        held = deque(maxlen=max(hold, 1))
+
+        def decode():
+            out = pool.acquire() if name == "pool" else plan.empty_output()
+            aux = plan.decode(block, out=out)
+            if hold:
+                held.append(aux)
+            if name == "pool":
+                pool.release(out)
+
+        # Warm up, so the pool and the held frames are in their steady state
+        for _ in range(pool_size + hold + 2):
+            decode()
+        fallbacks = pool.fallbacks
+        tracemalloc.start()
+        allocated = 0
+        for _ in range(blocks):
+            in_use = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            decode()
+            allocated += tracemalloc.get_traced_memory()[1] - in_use
+        tracemalloc.stop()
+        results[name] = (allocated / blocks, pool.fallbacks - fallbacks)
+    return results
+
+
+if __name__ == "__main__":
+    print(
+        f"{'held frames':>11} {'fresh (B/block)':>16} {'pool (B/block)':>15} "
+        f"{'fallbacks':>10}"
+    )
+    for hold in (0, 4, 12):
+        results = measure_allocations(hold=hold)
+        (fresh, _), (pooled, fallbacks) = results["fresh"], results["pool"]
+        print(f"{hold:>11} {fresh:>16.0f} {pooled:>15.0f} {fallbacks:>10}")
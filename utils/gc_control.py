@@ -0,0 +1,219 @@
+"""
+Garbage-collector control during acquisition.
+
+    python -m utils.gc_control
+
+runs an allocation-heavy block loop next to a large live heap with each
+GcPolicy mode and prints the collector pauses during trials and rests.
+"""
+
+import gc
+import time
+
+import numpy as np
+
+GC_MODES = ("default", "tuned", "off")
+
+
+class GcMonitor:
+    """
+    Collector pauses timed through gc.callbacks, from each collection's
+    "start" to its "stop" callback. Every Python thread waits for a
+    collection, so these are pauses of the receiver and the GUI alike.
+    Collections while `scheduled` is set (GcPolicy.rest()) are counted
+    separately from the ones the collector triggered itself.
+    """
+
+    def __init__(self):
+        self.scheduled = False
+        self._started = None
+        self.reset()
+
+    def install(self):
+        if self._callback not in gc.callbacks:
+            gc.callbacks.append(self._callback)
+        return self
+
+    def remove(self):
+        if self._callback in gc.callbacks:
+            gc.callbacks.remove(self._callback)
+
+    def reset(self):
+        # Per generation: collections, total s and longest s
+        self.counts = [0, 0, 0]
+        self.totals = [0.0, 0.0, 0.0]
+        self.worst = [0.0, 0.0, 0.0]
+        self.scheduled_count = 0
+        self.scheduled_total = 0.0
+        self.scheduled_worst = 0.0
+
+    def _callback(self, phase, info):
+        if phase == "start":
+            self._started = time.perf_counter()
+            return
+        if self._started is None:
+            return
+        pause = time.perf_counter() - self._started
+        self._started = None
+        if self.scheduled:
+            self.scheduled_count += 1
+            self.scheduled_total += pause
+            self.scheduled_worst = max(self.scheduled_worst, pause)
+            return
+        generation = min(info.get("generation", 0), 2)
+        self.counts[generation] += 1
+        self.totals[generation] += pause
+        self.worst[generation] = max(self.worst[generation], pause)
+
+    def stats(self):
+        """Pause counts and durations (ms) as a JSON-friendly dict."""
+        return {
+            "collections": list(self.counts),
+            "total_ms": sum(self.totals) * 1e3,
+            "max_ms": max(self.worst) * 1e3,
+            "max_ms_per_generation": [t * 1e3 for t in self.worst],
+            "scheduled": self.scheduled_count,
+            "scheduled_total_ms": self.scheduled_total * 1e3,
+            "scheduled_max_ms": self.scheduled_worst * 1e3,
+        }
+
+    def summary(self):
+        return describe_pauses(self.stats())
+
+
+def describe_pauses(stats):
+    """One line for the pause statistics of GcMonitor.stats()."""
+    text = (
+        f"GC: {sum(stats['collections'])} pauses, {stats['total_ms']:.1f} ms, "
+        f"max {stats['max_ms']:.1f} ms"
+    )
+    if stats["scheduled"]:
+        text += (
+            f"; {stats['scheduled']} in rests, max "
+            f"{stats['scheduled_max_ms']:.1f} ms"
+        )
+    return text
+
+
+class GcPolicy:
+    """
+    When the cyclic collector may run during acquisition. start(), called
+    once the windows and buffers exist, collects and gc.freeze()s
+    everything alive, so later collections skip the long-lived objects.
+    Between begin_protocol() and end_protocol() the mode applies:
+      - "default" : the collector is left alone (and nothing is frozen)
+      - "tuned"   : young collections stay automatic but run less often
+                    (TUNED_THRESHOLDS); older generations, whose scans
+                    cause the long pauses, wait for rest()
+      - "off"     : gc.disable(); only rest() collects
+    rest() runs a full collection and is meant for the rest periods
+    between trials. stop() restores the collector. Pauses are measured
+    by `monitor` in every mode.
+    """
+
+    TUNED_THRESHOLDS = (10000, 1000000, 1000000)
+
+    def __init__(self, mode="default"):
+        if mode not in GC_MODES:
+            raise ValueError(f"gc mode must be one of {GC_MODES}")
+        self.mode = mode
+        self.monitor = GcMonitor()
+        self.in_protocol = False
+        self._thresholds = None
+        self._was_enabled = None
+
+    def start(self):
+        if self.mode != "default":
+            gc.collect()
+            gc.freeze()
+        self.monitor.install()
+        return self
+
+    def begin_protocol(self):
+        if self.in_protocol or self.mode == "default":
+            self.in_protocol = True
+            return
+        self.in_protocol = True
+        self._thresholds = gc.get_threshold()
+        self._was_enabled = gc.isenabled()
+        if self.mode == "tuned":
+            gc.set_threshold(*self.TUNED_THRESHOLDS)
+        else:
+            gc.disable()
+
+    def rest(self):
+        """Collect now, counted as a scheduled pause."""
+        if self.mode == "default":
+            return
+        self.monitor.scheduled = True
+        try:
+            gc.collect()
+        finally:
+            self.monitor.scheduled = False
+
+    def end_protocol(self):
+        if not self.in_protocol:
+            return
+        self.in_protocol = False
+        if self._thresholds is None:
+            return
+        gc.set_threshold(*self._thresholds)
+        if self._was_enabled:
+            gc.enable()
+        self._thresholds = None
+        self.rest()
+
+    def stop(self):
+        self.end_protocol()
+        if self.mode != "default":
+            gc.unfreeze()
+        self.monitor.remove()
+
+
+def benchmark(blocks=10000, trial_blocks=500, heap=1000000, block=(16, 500)):
+    """
+    {mode: GcMonitor.stats()} for a loop that per block allocates the
+    arrays, dicts and reference cycles a receive/process/publish step
+    makes and keeps a few objects for the session (events, gaps), next to
+    `heap` long-lived dicts standing in for the Qt and plot objects.
+    rest() runs after every `trial_blocks` blocks.
+    """
+    rng = np.random.default_rng(0)
+    raw = rng.integers(-1000, 1000, size=block, dtype=np.int16)
+    results = {}
+    for mode in GC_MODES:
+        gc.collect()
+        live = [{"index": i, "name": str(i)} for i in range(heap)]
+        policy = GcPolicy(mode).start()
+        policy.begin_protocol()
+        recent = []
+        session = []
+        for k in range(blocks):
+            samples = raw.astype(np.float32) * 0.5
+            frame = {"seq": k, "samples": samples, "range": [samples.min()]}
+            # Callbacks and closures referencing their owner form cycles
+            frame["owner"] = frame
+            recent.append([frame, [{} for _ in range(20)]])
+            if len(recent) > 50:
+                recent.pop(0)
+            session.append([{"block": k, "time": time.monotonic()} for _ in range(20)])
+            if (k + 1) % trial_blocks == 0:
+                policy.rest()
+        policy.end_protocol()
+        results[mode] = policy.monitor.stats()
+        policy.stop()
+        del live, recent, session
+    return results
+
+
+if __name__ == "__main__":
+    print(
+        f"{'mode':>8} {'pauses':>7} {'total (ms)':>11} {'max (ms)':>9} "
+        f"{'rests':>6} {'rest max (ms)':>14}"
+    )
+    for mode, stats in benchmark().items():
+        print(
+            f"{mode:>8} {sum(stats['collections']):>7} {stats['total_ms']:>11.1f} "
+            f"{stats['max_ms']:>9.2f} {stats['scheduled']:>6} "
+            f"{stats['scheduled_max_ms']:>14.2f}"
+        )
@@ -0,0 +1,413 @@
+"""
+Level-of-detail pyramids of recorded streams: per level k one (min, max,
+mean) per 2**k samples, so any time range of a long recording can be
+drawn from about one bin per pixel.
+
+    python -m utils.lod
+
+times building the pyramid of a one-hour session and querying ranges of
+it at every zoom level.
+"""
+
+import json
+import math
+import os
+import struct
+import time
+
+import numpy as np
+
+from utils.acquisition_profile import stream_indices, stream_rate, stream_scale
+
+LOD_MAGIC = b"NVLOD\x00\x01\x00"
+# Levels LOD_BASE..LOD_TOP are stored (32 samples up to 2**24, i.e. more
+# than 2 h at 2 kHz per bin); finer views read the recording itself
+LOD_BASE = 5
+LOD_TOP = 24
+# Bins of one level buffered before they are written as one record
+FLUSH_BINS = 4096
+# Samples per piece when a gap is filled with held values
+HOLD_SAMPLES = 1 << 16
+_LOD_RECORD = struct.Struct("<BBHII")  # stream, level, channels, first bin, bins
+
+
+def lod_path(recording_path):
+    """Pyramid file stored next to a recording."""
+    return os.path.splitext(recording_path)[0] + ".nvlod"
+
+
+def choose_level(samples, pixels, top=LOD_TOP):
+    """
+    Finest level with at most one bin per pixel when `samples` samples
+    are drawn `pixels` wide. Each bin is drawn as a min and a max point.
+    """
+    if samples <= pixels or pixels <= 0:
+        return 0
+    return min(math.ceil(math.log2(samples / pixels)), top)
+
+
+class LodBuilder:
+    """
+    Incremental pyramid of one int16 (channels, n) stream. append() takes
+    the next samples and returns the bins they complete as (level, bins)
+    pairs, bins being int16 (3, channels, n): min, max and rounded mean.
+    Each level is made from the one below by pairing bins, with one
+    unpaired bin kept per level, so a chunk costs O(chunk) however long
+    the stream already is. Sums are kept exact, the means are rounded
+    only when a level is emitted.
+    """
+
+    def __init__(self, channels, base=LOD_BASE, top=LOD_TOP):
+        self.channels = channels
+        self.base = base
+        self.top = top
+        self.samples = 0
+        self._tail = np.empty((channels, 0), dtype=np.int16)
+        self._last = np.zeros((channels, 1), dtype=np.int16)
+        # Per level: (min, max, sum) of a bin waiting for its pair
+        self._unpaired = {}
+
+    def append(self, chunk):
+        if not chunk.shape[1]:
+            return []
+        self.samples += chunk.shape[1]
+        self._last = chunk[:, -1:].copy()
+        if self._tail.shape[1]:
+            chunk = np.concatenate([self._tail, chunk], axis=1)
+        size = 1 << self.base
+        n = chunk.shape[1] // size
+        self._tail = chunk[:, n * size :].copy()
+        if not n:
+            return []
+        # Pairwise np.minimum/np.maximum beat a reduction along a short
+        # last axis (see minmax_decimate); bin sums fit int32 up to here
+        even, odd = chunk[:, 0 : n * size : 2], chunk[:, 1 : n * size : 2]
+        level = (
+            np.minimum(even, odd),
+            np.maximum(even, odd),
+            even.astype(np.int32) + odd,
+        )
+        for _ in range(self.base - 1):
+            level = _pair(level)
+        return self._cascade((level[0], level[1], level[2].astype(np.int64)))
+
+    def hold(self, samples):
+        """Append `samples` copies of the last sample (zeros before any)."""
+        result = []
+        while samples > 0:
+            n = min(samples, HOLD_SAMPLES)
+            result += self.append(np.repeat(self._last, n, axis=1))
+            samples -= n
+        return result
+
+    def finish(self):
+        """
+        Bins covering the samples after the last complete bin of every
+        level, i.e. the end of the stream; append() must not follow.
+        """
+        result = []
+        carry, count = None, 0
+        if self._tail.shape[1]:
+            t = self._tail
+            carry = (
+                t.min(axis=1, keepdims=True),
+                t.max(axis=1, keepdims=True),
+                t.sum(axis=1, keepdims=True, dtype=np.int64),
+            )
+            count = t.shape[1]
+        for k in range(self.base, self.top + 1):
+            if carry is not None:
+                result.append((k, self._pack(carry, count)))
+            unpaired = self._unpaired.pop(k, None)
+            if unpaired is not None:
+                if carry is not None:
+                    unpaired = _merge(unpaired, carry)
+                carry, count = unpaired, count + (1 << k)
+        self._tail = self._tail[:, :0]
+        return result
+
+    def _cascade(self, level):
+        result = []
+        for k in range(self.base, self.top + 1):
+            result.append((k, self._pack(level, 1 << k)))
+            if k == self.top:
+                break
+            unpaired = self._unpaired.pop(k, None)
+            if unpaired is not None:
+                level = tuple(
+                    np.concatenate(pair, axis=1) for pair in zip(unpaired, level)
+                )
+            n = level[0].shape[1] // 2
+            if level[0].shape[1] % 2:
+                self._unpaired[k] = tuple(b[:, 2 * n :] for b in level)
+            if not n:
+                break
+            level = _pair(tuple(b[:, : 2 * n] for b in level))
+        return result
+
+    @staticmethod
+    def _pack(level, count):
+        lo, hi, total = level
+        bins = np.empty((3,) + lo.shape, dtype=np.int16)
+        bins[0] = lo
+        bins[1] = hi
+        bins[2] = np.rint(total / count)
+        return bins
+
+
+def _pair(level):
+    """Level of bins made from pairs of neighbouring bins of `level`."""
+    lo, hi, total = level
+    return (
+        np.minimum(lo[:, 0::2], lo[:, 1::2]),
+        np.maximum(hi[:, 0::2], hi[:, 1::2]),
+        total[:, 0::2] + total[:, 1::2],
+    )
+
+
+def _merge(first, second):
+    lo, hi, total = (np.concatenate(pair, axis=1) for pair in zip(first, second))
+    return (
+        lo.min(axis=1, keepdims=True),
+        hi.max(axis=1, keepdims=True),
+        total.sum(axis=1, keepdims=True),
+    )
+
+
+class LodWriter:
+    """
+    Builds the pyramid of every stream of a recording (stream_indices():
+    AUX and the EMG inputs) from its raw blocks and appends it to a file.
+    Gaps are filled with the last value, so bin positions stay in step
+    with wall-clock time, as in the ProcessingEngine's history.
+
+    File layout: LOD_MAGIC, a uint32 length and a JSON header (base, top
+    and per stream its channels, rate and scale), then records of
+    _LOD_RECORD followed by int16 (3, channels, bins). Each level is
+    written in records of about FLUSH_BINS bins; close() writes the rest
+    and the partial bins at the end of every level.
+    """
+
+    def __init__(self, path, daq_config, columns=None):
+        columns = 500 * daq_config["PlotTime"] if columns is None else columns
+        self.indices = stream_indices(daq_config, columns)
+        self.rates = {s: stream_rate(daq_config, s) for s in self.indices}
+        self.builders = {
+            s: LodBuilder(index.shape[0]) for s, index in self.indices.items()
+        }
+        header = {
+            "base": LOD_BASE,
+            "top": LOD_TOP,
+            "streams": {
+                str(s): {
+                    "channels": index.shape[0],
+                    "rate": self.rates[s],
+                    "scale": stream_scale(daq_config, s),
+                }
+                for s, index in self.indices.items()
+            },
+        }
+        header = json.dumps(header).encode()
+        self._file = open(path, "wb")
+        self._file.write(LOD_MAGIC + struct.pack("<I", len(header)) + header)
+        # Per (stream, level): ([bins not yet written], their bin count),
+        # and the bins written
+        self._batches = {}
+        self._written = {}
+
+    def append_block(self, block):
+        """One raw block as a flat "<i2" array."""
+        block = np.asarray(block).reshape(-1)
+        for stream, index in self.indices.items():
+            self._add(stream, self.builders[stream].append(np.take(block, index)))
+
+    def gap(self, aux_samples):
+        """`aux_samples` AUX samples per channel are missing."""
+        for stream, builder in self.builders.items():
+            samples = round(aux_samples * self.rates[stream] / self.rates[0])
+            self._add(stream, builder.hold(samples))
+
+    def close(self):
+        for stream, builder in self.builders.items():
+            self._add(stream, builder.finish())
+        for key in list(self._batches):
+            self._flush(key)
+        self._file.close()
+
+    def _add(self, stream, levels):
+        for level, bins in levels:
+            key = (stream, level)
+            batch, count = self._batches.get(key, ([], 0))
+            batch.append(bins)
+            self._batches[key] = (batch, count + bins.shape[2])
+            if count + bins.shape[2] >= FLUSH_BINS:
+                self._flush(key)
+
+    def _flush(self, key):
+        batch, _ = self._batches.pop(key, ([], 0))
+        if not batch:
+            return
+        bins = np.concatenate(batch, axis=2) if len(batch) > 1 else batch[0]
+        stream, level = key
+        first = self._written.get(key, 0)
+        self._written[key] = first + bins.shape[2]
+        self._file.write(
+            _LOD_RECORD.pack(stream, level, bins.shape[1], first, bins.shape[2])
+        )
+        self._file.write(np.ascontiguousarray(bins, dtype="<i2").tobytes())
+
+
+class LodReader:
+    """
+    Range queries on a pyramid file. The file is memory-mapped and only
+    the record headers are read when it is opened, so a query touches
+    just the records that overlap it. A pyramid that was not closed is
+    read up to its last complete record. Attributes: base, top and
+    streams ({stream: {"channels", "rate", "scale"}}).
+    """
+
+    def __init__(self, path):
+        self._data = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(self._data[: len(LOD_MAGIC)]) != LOD_MAGIC:
+            raise ValueError(f"{path} is not a pyramid file")
+        start = len(LOD_MAGIC)
+        (length,) = struct.unpack("<I", bytes(self._data[start : start + 4]))
+        header = json.loads(bytes(self._data[start + 4 : start + 4 + length]))
+        self.base = header["base"]
+        self.top = header["top"]
+        self.streams = {int(s): info for s, info in header["streams"].items()}
+        self._scan(start + 4 + length)
+
+    def _scan(self, pos):
+        records = {}
+        end = len(self._data)
+        while pos + _LOD_RECORD.size <= end:
+            head = bytes(self._data[pos : pos + _LOD_RECORD.size])
+            stream, level, channels, first, bins = _LOD_RECORD.unpack(head)
+            pos += _LOD_RECORD.size
+            size = 6 * channels * bins
+            if pos + size > end:
+                break
+            records.setdefault((stream, level), []).append((first, bins, pos))
+            pos += size
+        # (stream, level): (first bin of every record, [(bins, offset)])
+        self._records = {
+            key: (np.array([r[0] for r in found]), [(r[1], r[2]) for r in found])
+            for key, found in records.items()
+        }
+
+    def bins(self, stream, level):
+        """Bins stored at `level`."""
+        found = self._records.get((stream, level))
+        if found is None:
+            return 0
+        firsts, spans = found
+        return int(firsts[-1]) + spans[-1][0]
+
+    def samples(self, stream):
+        """Length of a stream, to within one base-level bin."""
+        return self.bins(stream, self.base) << self.base
+
+    def range(self, stream, level, start, stop, channels=None):
+        """
+        int16 (3, len(channels), n) min, max and mean of bins start..stop
+        of `level` (all channels by default), possibly a read-only view
+        of the file.
+        """
+        start = max(start, 0)
+        stop = min(stop, self.bins(stream, level))
+        n_channels = self.streams[stream]["channels"]
+        if channels is None:
+            channels = slice(None)
+        if stop <= start:
+            return np.empty((3, n_channels, 0), dtype=np.int16)[:, channels]
+        firsts, spans = self._records[(stream, level)]
+        pieces = []
+        for r in range(np.searchsorted(firsts, start, "right") - 1, len(firsts)):
+            first = int(firsts[r])
+            if first >= stop:
+                break
+            bins, offset = spans[r]
+            data = self._data[offset : offset + 6 * n_channels * bins]
+            data = data.view("<i2").reshape(3, n_channels, bins)
+            pieces.append(data[:, channels, max(start - first, 0) : stop - first])
+        return np.concatenate(pieces, axis=2) if len(pieces) > 1 else pieces[0]
+
+    def close(self):
+        # The file is unmapped once no range() result refers to it
+        self._data = None
+        self._records = {}
+
+
+def build_lod(recording_path, path=None):
+    """Build the pyramid of an existing recording; returns its path."""
+    from utils.recording import RecordingReader
+
+    path = lod_path(recording_path) if path is None else path
+    reader = RecordingReader(recording_path)
+    writer = LodWriter(path, reader.daq_config, reader.profile.columns)
+    gaps = list(reader.gaps)
+    for k, block in enumerate(reader.blocks()):
+        while gaps and gaps[0][0] <= k:
+            writer.gap(gaps.pop(0)[1])
+        writer.append_block(block)
+    for _, samples in gaps:
+        writer.gap(samples)
+    writer.close()
+    reader.close()
+    return path
+
+
+def benchmark(seconds=3600, pixels=1500, queries=20, path="/tmp/lod_benchmark.nvlod"):
+    """
+    Builds the pyramid of `seconds` of synthetic blocks (three 70-channel
+    EMG inputs at 2 kHz and the AUX channels), then times range queries
+    `pixels` wide over the first EMG input. Returns (s per block, file
+    bytes per raw byte, [(visible s, level, ms per query)]).
+    """
+    from utils.acquisition_profile import AcquisitionProfile
+    from utils.recording import emg_like_blocks
+
+    probes = [5, 5, 5] + [0] * 7
+    profile = AcquisitionProfile(probe_types=probes)
+    config = profile.layout()
+    # A handful of distinct blocks, repeated: the build cost does not
+    # depend on the values
+    blocks = emg_like_blocks(config, 8)
+    writer = LodWriter(path, config)
+    start = time.perf_counter()
+    for k in range(seconds):
+        writer.append_block(blocks[k % len(blocks)])
+    writer.close()
+    build = (time.perf_counter() - start) / seconds
+    size = os.path.getsize(path) / (seconds * blocks[0].nbytes)
+
+    reader = LodReader(path)
+    rate = reader.streams[1]["rate"]
+    total = reader.samples(1)
+    rng = np.random.default_rng(0)
+    results = []
+    for visible in (4, 60, 600, seconds):
+        samples = visible * rate
+        level = max(choose_level(samples, pixels), reader.base)
+        elapsed = 0.0
+        for _ in range(queries):
+            first = int(rng.integers(0, total - samples + 1))
+            t0 = time.perf_counter()
+            reader.range(1, level, first >> level, ((first + samples) >> level) + 1)
+            elapsed += time.perf_counter() - t0
+        results.append((visible, level, elapsed / queries * 1e3))
+    reader.close()
+    os.remove(path)
+    return build, size, results
+
+
+if __name__ == "__main__":
+    build, size, results = benchmark()
+    print(
+        f"one hour of 3 x 70 EMG channels at 2 kHz: {build * 1e3:.2f} ms per "
+        f"block to build, pyramid is {size:.1%} of the raw data"
+    )
+    print(f"{'visible (s)':>12} {'level':>6} {'query (ms)':>11}")
+    for visible, level, ms in results:
+        print(f"{visible:>12} {level:>6} {ms:>11.2f}")
@@ -8,10 +8,12 @@ from PyQt5.QtWidgets import (
     QCheckBox,
     QScrollArea,
 )
-from PyQt5.QtCore import QTimer, pyqtSignal
-import pyqtgraph as pg
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 import numpy as np
 
+from utils.auto_range import AxisRange
+from utils.processing import ProcessingEngine
+
 
 class MVCWindow(QMainWindow):
     """
@@ -62,6 +64,10 @@ class MVCWindow(QMainWindow):
 
         l_layout.addWidget(scroll)
 
+        self.stacked_cb = QCheckBox("Stacked view")
+        self.stacked_cb.stateChanged.connect(self.redraw)
+        l_layout.addWidget(self.stacked_cb)
+
         self.remove_offset_btn = QPushButton("Remove Offset")
         self.remove_offset_btn.clicked.connect(self.remove_offset)
         l_layout.addWidget(self.remove_offset_btn)
@@ -75,81 +81,164 @@ class MVCWindow(QMainWindow):
         l_layout.addStretch()
 
         layout.addWidget(left)
+        self.main_layout = layout
+
+        # Right: plot. pyqtgraph is imported and the plot built after the
+        # first frame is shown; curves are created only for channels that
+        # get selected.
+        self.plot_widget = None
+        self.curves = [None] * 16
+        self.stacked_curve = None
+        self.stacked_labels = None
+        # Axes follow the engine's tracked value range instead of
+        # autorange, which scans every curve on each refresh
+        self.y_axis = AxisRange()
+        self.x_span = None
+        QTimer.singleShot(0, self.build_plot)
+
+        # History, offsets and the offset/MVC scans live on the processing
+        # engine's thread; DAQ blocks go straight to it from the receiver
+        # thread. Storage dtype follows the profile's sample_dtype policy.
+        profile = self.daq.profile
+        self.sample_rate = profile.aux_rate
+        self.engine = ProcessingEngine(
+            16,
+            profile.aux_rate,
+            profile.history_samples,
+            profile.sample_dtype,
+            profile.sample_scale,
+        )
+        self.engine.start()
+        self.daq.data_received.connect(self.engine.submit, Qt.DirectConnection)
+        self.daq.stream_gap.connect(self.engine.mark_gap, Qt.DirectConnection)
+        self.frame_seq = 0
+        # (future, handler) of the offset / MVC scan in progress
+        self.pending = None
+
+        # GUI refresh timer
+        self.gui_timer = QTimer()
+        self.gui_timer.timeout.connect(self.refresh_plot)
+        self.gui_timer.start(50)
 
-        # Right: plot
-        self.plot_widget = pg.PlotWidget()
+    def build_plot(self):
+        if self.plot_widget is not None:
+            return
+        from utils.render_mode import make_plot_widget, resolve_render_mode
+
+        self.render_mode = resolve_render_mode(self.daq.profile.render_mode)
+        self.plot_widget = make_plot_widget(self.render_mode)
         self.plot_widget.setBackground("#222222")
         self.plot_widget.addLegend()
         self.plot_widget.setLabel("left", "AUX value")
         self.plot_widget.setLabel("bottom", "Time (s)")
         self.plot_widget.showGrid(x=True, y=True, alpha=0.3)
-        layout.addWidget(self.plot_widget)
-
-        self.curves = []
-        colors = [pg.intColor(i, 16) for i in range(16)]
-        for i in range(16):
-            curve = self.plot_widget.plot(
-                [], [], pen=pg.mkPen(colors[i], width=2), name=f"AUX{i}"
+        self.plot_widget.disableAutoRange()
+        self.main_layout.addWidget(self.plot_widget)
+
+    def curve(self, i):
+        if self.curves[i] is None:
+            import pyqtgraph as pg
+            from utils.render_mode import curve_options, make_pen
+
+            self.build_plot()
+            self.curves[i] = self.plot_widget.plot(
+                [],
+                [],
+                pen=make_pen(pg.intColor(i, 16), 2, self.render_mode),
+                name=f"AUX{i}",
+                **curve_options(self.render_mode),
             )
-            curve.setVisible(False)
-            self.curves.append(curve)
+        return self.curves[i]
 
-        # Live buffers (append-only); each DAQ emission is a chunk
-        self.buffers = [np.array([]) for _ in range(16)]
-        self.sample_rate = 500
+    def stacked(self):
+        if self.stacked_curve is None:
+            from utils.stacked_view import StackedCurve
 
-        # connect DAQ signal
-        self.daq.data_received.connect(self.on_data)
+            self.build_plot()
+            self.stacked_curve = StackedCurve(spacing=0.0)
+            self.plot_widget.addItem(self.stacked_curve)
+        return self.stacked_curve
 
-        # GUI refresh timer
-        self.gui_timer = QTimer()
-        self.gui_timer.timeout.connect(self.refresh_plot)
-        self.gui_timer.start(50)
-
-    def on_data(self, aux_array):
-        # aux_array expected shape (16, N)
-        for i in range(16):
-            self.buffers[i] = np.append(self.buffers[i], aux_array[i, :])
-            max_samples = 30000
-            if len(self.buffers[i]) > max_samples:
-                self.buffers[i] = self.buffers[i][-max_samples:]
+    def redraw(self):
+        """Draw the latest frame again on the next refresh."""
+        self.frame_seq = 0
 
     def refresh_plot(self):
+        if self.pending is not None and self.pending[0].done():
+            future, handler = self.pending
+            self.pending = None
+            handler(future)
+
         selected = [i for i, cb in enumerate(self.checkboxes) if cb.isChecked()]
-        if not selected:
+        if selected != self.engine.display_channels:
+            self.engine.set_display_channels(selected)
+        frame = self.engine.latest()
+        if frame is None or frame.seq == self.frame_seq or frame.x is None:
             return
-        tlen = max(len(self.buffers[i]) for i in selected)
-        if tlen == 0:
+        if frame.channels != selected:
             return
+        self.frame_seq = frame.seq
+
+        if self.stacked_cb.isChecked():
+            self.refresh_stacked(frame)
+            return
+        if self.stacked_curve is not None and self.stacked_curve.isVisible():
+            self.stacked_curve.setVisible(False)
+            self.plot_widget.getPlotItem().getAxis("left").setTicks(None)
+            self.stacked_labels = None
 
         for i in range(16):
-            visible = i in selected
-            self.curves[i].setVisible(visible)
-            if visible and len(self.buffers[i]) > 0:
-                data = self.buffers[i]
-                data = data - self.offsets.get(i, 0.0)
-                x = np.arange(len(data)) / self.sample_rate
-                self.curves[i].setData(x, data)
+            if i not in selected and self.curves[i] is not None:
+                self.curves[i].setVisible(False)
+        for row, i in enumerate(frame.channels):
+            self.curve(i).setVisible(True)
+            self.curves[i].setData(frame.x, frame.y[row])
+        self.set_view(frame.span, frame.bounds.min(), frame.bounds.max())
+
+    def set_view(self, span, low, high):
+        """Show the whole history and, with hysteresis, low..high."""
+        if span != self.x_span:
+            self.x_span = span
+            self.plot_widget.setXRange(0, span, padding=0)
+        view = self.y_axis.update(float(low), float(high))
+        if view is not None:
+            self.plot_widget.setYRange(*view, padding=0)
+
+    def refresh_stacked(self, frame):
+        """All selected channels as one offset-stacked curve."""
+        from utils.stacked_view import set_channel_ticks
+
+        for curve in self.curves:
+            if curve is not None:
+                curve.setVisible(False)
+        curve = self.stacked()
+        # Spacing only grows, so channels do not jump between refreshes
+        spacing = float(frame.bounds.max() - frame.bounds.min()) * 1.1
+        labels = [f"AUX{i}" for i in frame.channels]
+        if spacing > curve.spacing or labels != self.stacked_labels:
+            curve.spacing = max(spacing, curve.spacing) or 1.0
+            set_channel_ticks(self.plot_widget, labels, curve.spacing)
+            self.stacked_labels = labels
+        curve.setVisible(True)
+        curve.set_stacked(frame.y, frame.x)
+        shifted = frame.bounds + curve.spacing * np.arange(len(labels))[:, None]
+        self.set_view(frame.span, shifted[:, 0].min(), shifted[:, 1].max())
 
     def remove_offset(self):
         selected = [i for i, cb in enumerate(self.checkboxes) if cb.isChecked()]
         if not selected:
             self.status_label.setText("No channels selected")
             return
+        if self.pending is not None:
+            return
 
+        # not enough data yet: take what is available
         nsamp = int(0.5 * self.sample_rate)
-        for i in selected:
-            buf = self.buffers[i]
-            if len(buf) < nsamp:
-                # not enough data yet: take what is available
-                if len(buf) == 0:
-                    self.offsets[i] = 0.0
-                else:
-                    self.offsets[i] = float(np.mean(buf))
-            else:
-                segment = buf[-nsamp:]
-                self.offsets[i] = float(np.mean(segment))
+        self.pending = (self.engine.measure_offsets(selected, nsamp), self.on_offsets)
+        self.status_label.setText("Removing offsets...")
 
+    def on_offsets(self, future):
+        self.offsets.update(future.result())
         self.status_label.setText("Offsets removed for selected channels")
 
     def collect_mvc(self):
@@ -157,28 +246,38 @@ class MVCWindow(QMainWindow):
         if not selected:
             self.status_label.setText("No channels selected for MVC collection")
             return
+        if self.pending is not None:
+            return
 
         duration = 2.0
         nsamp = int(duration * self.sample_rate)
+        self.pending = (self.engine.measure_mvc(selected, nsamp), self.on_mvc)
+        self.status_label.setText("Collecting MVC...")
 
+    def on_mvc(self, future):
         # ensure enough buffered data; if not, notify and return
-        available = min(len(self.buffers[i]) for i in selected)
-        if available < nsamp:
+        try:
+            mvcs = future.result()
+        except ValueError:
             self.status_label.setText(
                 "Not enough buffered data yet; wait briefly and try again"
             )
             return
 
-        mvcs = {}
-        for i in selected:
-            data = self.buffers[i][-nsamp:]
-            data = data - self.offsets.get(i, 0.0)
-            mvcs[i] = float(np.max(np.abs(data)))
-
         self.mvc_values = mvcs
         self.status_label.setText(f"MVC collected for channels: {list(mvcs.keys())}")
 
         # emit values and finish
         self.mvc_collected.emit(mvcs)
-        self.finished.emit(selected, self.offsets)
+        self.finished.emit(list(mvcs), self.offsets)
         self.close()
+
+    def closeEvent(self, event):
+        self.gui_timer.stop()
+        try:
+            self.daq.data_received.disconnect(self.engine.submit)
+            self.daq.stream_gap.disconnect(self.engine.mark_gap)
+        except TypeError:
+            pass
+        self.engine.stop()
+        event.accept()
@@ -0,0 +1,123 @@
+"""
+Vectorized offset removal and %MVC scaling.
+
+    python -m utils.normalize
+
+compares the per-channel loop with Normalizer on (16, N) chunks.
+"""
+
+import time
+
+import numpy as np
+
+
+class Normalizer:
+    """
+    Offset removal and %MVC scaling of whole (channels, n) chunks:
+
+        y = (x * scale - offset) * inverse_mvc * 100
+          = x * gain + bias
+
+    gain and bias are per-channel float32 column vectors computed when the
+    offsets or MVC values change, so each chunk costs one broadcast
+    multiply and one broadcast add, both in place. Channels without a
+    positive MVC are masked (`has_mvc` False) and keep their offset-free
+    raw units. The (gain, bias) pair is replaced as a whole, so a chunk is
+    never normalized with half-updated vectors when set_* is called from
+    another thread.
+    """
+
+    def __init__(self, channels, scale=1.0):
+        self.channels = channels
+        self.scale = np.float32(scale)
+        self.offsets = np.zeros(channels, dtype=np.float32)
+        self.inverse_mvc = np.ones(channels, dtype=np.float32)
+        self.has_mvc = np.zeros(channels, dtype=bool)
+        self._update()
+
+    def _update(self):
+        gain = (self.scale * self.inverse_mvc).astype(np.float32)
+        bias = (-self.offsets * self.inverse_mvc).astype(np.float32)
+        self._coeffs = (gain[:, None], bias[:, None])
+
+    def set_offsets(self, offsets):
+        """Offsets as a {channel: value} dict or a per-channel sequence."""
+        vector = np.zeros(self.channels, dtype=np.float32)
+        if isinstance(offsets, dict):
+            for i, value in offsets.items():
+                vector[i] = value
+        else:
+            vector[:] = offsets
+        self.offsets = vector
+        self._update()
+
+    def set_mvc(self, mvc_values):
+        """{channel: mvc}; channels without a positive MVC stay unscaled."""
+        mvc = np.zeros(self.channels, dtype=np.float64)
+        for i, value in mvc_values.items():
+            mvc[i] = value or 0.0
+        has_mvc = mvc > 0
+        inverse = np.ones(self.channels, dtype=np.float32)
+        inverse[has_mvc] = 100.0 / mvc[has_mvc]
+        self.has_mvc = has_mvc
+        self.inverse_mvc = inverse
+        self._update()
+
+    def __call__(self, chunk, out=None, channels=None):
+        """
+        Normalized float32 copy of `chunk` (rows are `channels`, default
+        all), written to `out` when given. Pass out=chunk to normalize a
+        float32 chunk in place.
+        """
+        gain, bias = self._coeffs
+        if channels is not None:
+            gain, bias = gain[channels], bias[channels]
+        if out is None:
+            out = np.empty(chunk.shape, dtype=np.float32)
+        np.multiply(chunk, gain, out=out, casting="unsafe")
+        out += bias
+        return out
+
+
+def loop_normalize(chunk, offsets, mvc_values, scale=1.0):
+    """The per-channel loop Normalizer replaces, kept for benchmarking."""
+    out = []
+    for i in range(chunk.shape[0]):
+        data = chunk[i].astype(np.float64) * scale - offsets.get(i, 0.0)
+        mvc = mvc_values.get(i, None)
+        if mvc and mvc > 0:
+            data = data / mvc * 100.0
+        out.append(data)
+    return np.array(out)
+
+
+def benchmark(sizes=(10, 500, 4000, 30000), channels=16, repeats=200):
+    """(n, loop s, Normalizer s) per (channels, n) chunk."""
+    offsets = {i: 0.01 * i for i in range(channels)}
+    mvc_values = {i: 1.0 + i for i in range(0, channels, 2)}
+    normalizer = Normalizer(channels)
+    normalizer.set_offsets(offsets)
+    normalizer.set_mvc(mvc_values)
+    results = []
+    for n in sizes:
+        chunk = np.random.rand(channels, n).astype(np.float32)
+        out = np.empty_like(chunk)
+        assert np.allclose(
+            normalizer(chunk), loop_normalize(chunk, offsets, mvc_values), atol=1e-4
+        )
+        start = time.perf_counter()
+        for _ in range(repeats):
+            loop_normalize(chunk, offsets, mvc_values)
+        t_loop = (time.perf_counter() - start) / repeats
+        start = time.perf_counter()
+        for _ in range(repeats):
+            normalizer(chunk, out=out)
+        t_vector = (time.perf_counter() - start) / repeats
+        results.append((n, t_loop, t_vector))
+    return results
+
+
+if __name__ == "__main__":
+    print(f"{'samples':>8} {'loop (us)':>10} {'Normalizer (us)':>16}")
+    for n, t_loop, t_vector in benchmark():
+        print(f"{n:>8} {t_loop * 1e6:>10.1f} {t_vector * 1e6:>16.1f}")
@@ -0,0 +1,396 @@
+"""
+Per-chunk processing off the GUI thread.
+
+    python -m utils.processing
+
+times publishing a frame of the whole history and of a display window
+at several history lengths.
+"""
+
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future
+
+import numpy as np
+
+from utils.auto_range import RangeTracker
+from utils.block_queue import BlockQueue
+from utils.decimation import decimated_times, minmax_decimate
+from utils.normalize import Normalizer
+from utils.ring_buffer import ChannelRingBuffer
+
+# Ready-to-plot output of a ProcessingEngine. Arrays are never modified
+# after publishing.
+#   - seq      : increases with every published frame
+#   - channels : channel indices of the rows of y
+#   - x, y     : time (s, from the start of the retained history) and
+#                conditioned, scaled values (len(channels), len(x)), of
+#                the display window
+#   - span     : seconds of retained history; the newest sample is at
+#                x = span
+#   - cursor   : CursorState of the attached FeedbackCursor, or None
+#   - trail    : (t, values) of the attached TrailBuffer, or None
+#   - bounds   : (len(channels), 2) min and max of each channel over the
+#                display window, in the units of y, or None
+DisplayFrame = namedtuple(
+    "DisplayFrame",
+    ["seq", "channels", "x", "y", "span", "cursor", "trail", "bounds"],
+)
+
+
+class ProcessingEngine:
+    """
+    Per-chunk processing on a worker thread, so the GUI thread only has to
+    call setData. Chunks of (channels, n) samples, as emitted by
+    DAQReceiver or StreamDecoder, are passed to submit() from any thread.
+    The worker:
+      - keeps the raw samples in a ChannelRingBuffer (storage dtype and
+        scale as in the acquisition profile)
+      - conditions and scales them with a Normalizer: (x * scale - offset)
+        * 100 / MVC, in raw units for channels without an MVC. With
+        `baseline_samples` the offsets are set to the mean of the first
+        samples and earlier chunks are not passed on.
+      - updates an attached FeedbackCursor and TrailBuffer (trail times
+        come from `trail_clock()`, which returns the time of the newest
+        sample or None while nothing should be recorded)
+      - publishes a DisplayFrame at most every `publish_interval` seconds,
+        with `display_channels` of the history min/max decimated to
+        `max_points`, and their bounds from a RangeTracker that is updated
+        per chunk, so plots can set their axes without scanning the data.
+        With set_display_window() only the newest samples are published
+        and the cost no longer depends on the history length.
+    mark_gap() records samples missing from the stream (e.g. a link
+    outage) in order with the chunks: the history holds the last value
+    over the gap so it stays aligned with wall-clock time, and
+    (stream sample index, length) is added to `gaps`.
+    Metrics over the history (measure_offsets, measure_mvc) also run on
+    the worker and return concurrent.futures.Future objects. The engine is
+    Qt-free: without start(), process_pending() does the same work on the
+    calling thread.
+    """
+
+    def __init__(
+        self,
+        channels,
+        sample_rate,
+        history_samples,
+        dtype=np.float32,
+        scale=1.0,
+        max_points=2000,
+        publish_interval=1 / 60,
+        baseline_samples=0,
+        feedback=None,
+        trail=None,
+        trail_clock=None,
+        trail_points=1000,
+    ):
+        self.channels = channels
+        self.sample_rate = float(sample_rate)
+        self.history = ChannelRingBuffer(channels, history_samples, dtype, scale)
+        self.range_tracker = RangeTracker(channels, history_samples)
+        self.max_points = max_points
+        self.publish_interval = publish_interval
+        self.baseline_samples = baseline_samples
+        self.feedback = feedback
+        self.trail = trail
+        self.trail_clock = trail_clock
+        self.trail_points = trail_points
+        self.display_channels = []
+        self.display_window = None
+        self.normalizer = Normalizer(channels, scale)
+        self.gaps = []
+
+        self.queue = BlockQueue(maxlen=256)
+        self.missed = 0
+        self._last_seq = -1
+        self._baseline_chunks = []
+        self._baseline_done = baseline_samples <= 0
+        self._tasks = deque()
+        self._frame = None
+        self._frame_seq = 0
+        self._dirty = False
+        self._last_publish = 0.0
+        self._x_cache = {}
+        self._conditioned = None
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+
+    # ------------------------------------------------------------------
+    # Called from the GUI (or any) thread
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def submit(self, chunk, arrival=None):
+        """Queue one (channels, n) chunk received at `arrival` (monotonic)."""
+        self.queue.put((time.monotonic() if arrival is None else arrival, chunk))
+        self._wake.set()
+
+    def mark_gap(self, samples, skipped_bytes=0):
+        """
+        `samples` per channel are missing after the chunks submitted so
+        far. Matches DAQReceiver.stream_gap, so it can be connected to it.
+        """
+        self.queue.put((time.monotonic(), int(samples)))
+        self._wake.set()
+
+    def latest(self):
+        """The most recently published DisplayFrame, or None."""
+        return self._frame
+
+    def set_offsets(self, offsets):
+        """Offsets as a {channel: value} dict or a per-channel sequence."""
+        self.normalizer.set_offsets(offsets)
+        self._dirty = True
+
+    def set_mvc(self, mvc_values):
+        """Scale to %MVC for channels with a positive MVC ({channel: mvc})."""
+        self.normalizer.set_mvc(mvc_values)
+        self._dirty = True
+
+    @property
+    def offsets(self):
+        return self.normalizer.offsets
+
+    def set_display_channels(self, channels):
+        self.display_channels = list(channels)
+        self._dirty = True
+
+    def set_display_window(self, seconds, max_points=None):
+        """
+        Publish only the newest `seconds` of history (None: all of it),
+        decimated to `max_points` (unchanged if None).
+        """
+        self.display_window = seconds
+        if max_points is not None:
+            self.max_points = max(int(max_points), 2)
+        self._dirty = True
+
+    def reset_baseline(self):
+        """Take the offsets again from the next `baseline_samples` samples."""
+        self.request(self._reset_baseline)
+
+    def clear(self):
+        self.request(self._clear)
+
+    def measure_offsets(self, channels, n):
+        """Future of {channel: mean of the newest n samples}; also applied."""
+        return self.request(self._measure_offsets, list(channels), n)
+
+    def measure_mvc(self, channels, n):
+        """Future of {channel: max |x - offset| over the newest n samples}."""
+        return self.request(self._measure_mvc, list(channels), n)
+
+    def request(self, fn, *args):
+        """Run fn(*args) on the worker; returns a Future of its result."""
+        future = Future()
+        self._tasks.append((future, fn, args))
+        self._wake.set()
+        return future
+
+    # ------------------------------------------------------------------
+    # Worker
+
+    def _run(self):
+        while self._running:
+            self._wake.wait(self.publish_interval)
+            self._wake.clear()
+            self.process_pending()
+
+    def process_pending(self):
+        """Process queued chunks and tasks; True if a frame was published."""
+        for seq, (arrival, chunk) in self.queue.drain():
+            if seq != self._last_seq + 1:
+                self.missed += seq - self._last_seq - 1
+            self._last_seq = seq
+            if isinstance(chunk, int):
+                self._fill_gap(chunk)
+            else:
+                self._process(chunk, arrival)
+        # Requests see every chunk submitted before them
+        while self._tasks:
+            future, fn, args = self._tasks.popleft()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+        now = time.monotonic()
+        if self._dirty and now - self._last_publish >= self.publish_interval:
+            self._publish()
+            self._last_publish = now
+            return True
+        return False
+
+    def _process(self, chunk, arrival):
+        self.history.append(chunk)
+        self.range_tracker.append(chunk)
+        self._dirty = True
+        if not self._baseline_done:
+            self._baseline_chunks.append(chunk)
+            collected = np.concatenate(self._baseline_chunks, axis=1)
+            if collected.shape[1] < self.baseline_samples:
+                return
+            baseline = collected[:, : self.baseline_samples] * self.history.scale
+            self.normalizer.set_offsets(np.mean(baseline, axis=1, dtype=np.float64))
+            self._baseline_chunks = []
+            self._baseline_done = True
+        if self.feedback is None and self.trail is None:
+            return
+
+        # Chunks usually have the same length, so the conditioned copy
+        # reuses one buffer; feedback and trail copy what they keep
+        if self._conditioned is None or self._conditioned.shape != chunk.shape:
+            self._conditioned = np.empty(chunk.shape, dtype=np.float32)
+        values = self.normalizer(chunk, out=self._conditioned)
+        if self.feedback is not None:
+            values = self.feedback.update(values, arrival)
+        if self.trail is not None and self.trail_clock is not None:
+            newest = self.trail_clock()
+            if newest is not None:
+                # The newest sample is placed at the clock time; earlier
+                # samples are spaced by the sample period behind it
+                n = values.shape[1]
+                times = newest - np.arange(n - 1, -1, -1) / self.sample_rate
+                self.trail.append(times, values)
+
+    def _fill_gap(self, samples):
+        if samples <= 0:
+            return
+        self.gaps.append((self.history.total, samples))
+        n = min(samples, self.history.capacity)
+        if len(self.history):
+            last = self.history.view(1)
+        else:
+            last = np.zeros((self.channels, 1), dtype=self.history.dtype)
+        held = np.repeat(last, n, axis=1)
+        self.history.append(held)
+        self.range_tracker.append(held)
+        self.history.total += samples - n
+        self._dirty = True
+
+    def _publish(self):
+        self._dirty = False
+        channels = [i for i in self.display_channels if 0 <= i < self.channels]
+        n = len(self.history)
+        w = n
+        if self.display_window is not None:
+            w = min(n, int(np.ceil(self.display_window * self.sample_rate)))
+        x = y = bounds = None
+        if channels and w:
+            # Only the window is decimated, as a view of the history
+            reduced, step, start = minmax_decimate(
+                self.history.view(w)[channels], self.max_points
+            )
+            key = (n, w, step, start)
+            x = self._x_cache.get(key)
+            if x is None:
+                x = decimated_times(w, step, start, self.sample_rate)
+                x += np.float32((n - w) / self.sample_rate)
+                self._x_cache = {key: x}
+            y = self.normalizer(reduced, channels=channels)
+            if w < n:
+                # min/max decimation keeps the extremes of the window
+                bounds = np.stack([y.min(axis=1), y.max(axis=1)], axis=1)
+            else:
+                # Scaling is affine per channel, so the raw extremes map
+                # to the extremes of y
+                lo, hi = self.range_tracker.range()
+                bounds = np.stack([lo[channels], hi[channels]], axis=1)
+                bounds = np.sort(self.normalizer(bounds, channels=channels), axis=1)
+        cursor = self.feedback.snapshot() if self.feedback is not None else None
+        trail = None
+        if self.trail is not None and len(self.trail):
+            t, values = self.trail.decimated(self.trail_points)
+            trail = (t.copy(), values.copy())
+        self._frame_seq += 1
+        self._frame = DisplayFrame(
+            self._frame_seq,
+            channels,
+            x,
+            y,
+            n / self.sample_rate,
+            cursor,
+            trail,
+            bounds,
+        )
+
+    def _reset_baseline(self):
+        self._baseline_chunks = []
+        self._baseline_done = self.baseline_samples <= 0
+        if self.feedback is not None:
+            self.feedback.reset()
+        if self.trail is not None:
+            self.trail.clear()
+        self._dirty = True
+
+    def _clear(self):
+        self.history.clear()
+        self.range_tracker.clear()
+        self.gaps = []
+        self._reset_baseline()
+
+    def _measure_offsets(self, channels, n):
+        offsets = self.normalizer.offsets.copy()
+        result = {}
+        for i in channels:
+            value = 0.0
+            if len(self.history):
+                segment = self.history.values(n, channel=i)
+                value = float(np.mean(segment, dtype=np.float64))
+            offsets[i] = value
+            result[i] = value
+        self.normalizer.set_offsets(offsets)
+        self._dirty = True
+        return result
+
+    def _measure_mvc(self, channels, n):
+        if len(self.history) < n:
+            raise ValueError("not enough buffered data")
+        result = {}
+        for i in channels:
+            data = self.history.values(n, channel=i) - self.offsets[i]
+            result[i] = float(np.max(np.abs(data)))
+        return result
+
+
+def benchmark_publish(histories=(30000, 300000, 3000000), channels=4, repeats=50):
+    """
+    (history samples, s per frame for the whole history, s per frame for
+    a 6 s display window), both decimated to 2000 points, for `channels`
+    displayed AUX channels at 500 Hz.
+    """
+    results = []
+    for history in histories:
+        engine = ProcessingEngine(16, 500, history)
+        rng = np.random.default_rng(0)
+        for _ in range(0, history, 50000):
+            engine.submit(rng.normal(size=(16, 50000)).astype(np.float32))
+        engine.process_pending()
+        engine.set_display_channels(range(channels))
+        times = []
+        for window, points in ((None, 2000), (6.0, 2000)):
+            engine.set_display_window(window, points)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                engine._publish()
+            times.append((time.perf_counter() - start) / repeats)
+        results.append((history, *times))
+    return results
+
+
+if __name__ == "__main__":
+    print(f"{'history':>9} {'whole history (ms)':>19} {'6 s window (ms)':>16}")
+    for history, t_all, t_window in benchmark_publish():
+        print(f"{history:>9} {t_all * 1e3:>19.3f} {t_window * 1e3:>16.3f}")
@@ -0,0 +1,335 @@
+import json
+
+import numpy as np
+
+
+class Protocol:
+    """
+    Target force trajectory (in %MVC) built from consecutive segments:
+      - points(pts)      : piecewise-linear through (time, level) pairs
+      - hold(d, level)   : constant level for d seconds
+      - ramp(d, level)   : linear change to `level` over d seconds
+      - sine(d, mean, amplitude, frequency, phase=0)
+    Segments are appended at the current end time. compile() turns the
+    protocol into a CompiledProtocol for fast evaluation.
+    """
+
+    def __init__(self, start_time=0.0, start_level=0.0):
+        self.start_time = float(start_time)
+        self.end_time = float(start_time)
+        self.level = float(start_level)
+        self.knots = []
+        self.sines = []
+
+    @classmethod
+    def from_points(cls, points):
+        points = sorted(points, key=lambda p: p[0])
+        if not points:
+            return cls()
+        protocol = cls(points[0][0], points[0][1])
+        protocol.points(points)
+        return protocol
+
+    def _knot(self, t, level):
+        self.knots.append((float(t), float(level)))
+        self.end_time = float(t)
+        self.level = float(level)
+
+    def points(self, points):
+        for t, level in sorted(points, key=lambda p: p[0]):
+            if t < self.end_time:
+                raise ValueError("protocol points must not go back in time")
+            if not self.knots and t > self.end_time:
+                self._knot(self.end_time, self.level)
+            self._knot(t, level)
+        return self
+
+    def hold(self, duration, level=None):
+        level = self.level if level is None else level
+        if not self.knots or level != self.level:
+            self._knot(self.end_time, level)
+        self._knot(self.end_time + duration, level)
+        return self
+
+    def ramp(self, duration, level):
+        if not self.knots:
+            self._knot(self.end_time, self.level)
+        self._knot(self.end_time + duration, level)
+        return self
+
+    def sine(self, duration, mean, amplitude, frequency, phase=0.0):
+        # The mean goes through the linear knots; the oscillation is added
+        # on top for the duration of the segment.
+        start = self.end_time
+        self.hold(duration, mean)
+        self.sines.append((start, start + duration, amplitude, frequency, phase))
+        return self
+
+    def compile(self):
+        return CompiledProtocol(self.knots, self.sines)
+
+
+class CompiledProtocol:
+    """
+    Breakpoints of a Protocol stored as NumPy arrays. evaluate() is fully
+    vectorised (np.interp plus one searchsorted for sine segments), and
+    render() caches a dense trajectory per sample rate for plotting.
+    """
+
+    def __init__(self, knots, sines=()):
+        knots = np.asarray(knots, dtype=np.float64).reshape(-1, 2)
+        self.knot_t = knots[:, 0].copy()
+        self.knot_y = knots[:, 1].copy()
+        sines = np.asarray(sines, dtype=np.float64).reshape(-1, 5)
+        (
+            self.sine_start,
+            self.sine_end,
+            self.sine_amp,
+            self.sine_freq,
+            self.sine_phase,
+        ) = sines.T.copy()
+        self._dense = {}
+
+    def __len__(self):
+        return len(self.knot_t)
+
+    @property
+    def start_time(self):
+        return float(self.knot_t[0]) if len(self.knot_t) else 0.0
+
+    @property
+    def end_time(self):
+        return float(self.knot_t[-1]) if len(self.knot_t) else 0.0
+
+    @property
+    def min_level(self):
+        if not len(self.knot_y):
+            return 0.0
+        return float(np.min(self.knot_y) - np.max(self.sine_amp, initial=0.0))
+
+    @property
+    def max_level(self):
+        if not len(self.knot_y):
+            return 0.0
+        return float(np.max(self.knot_y) + np.max(self.sine_amp, initial=0.0))
+
+    def _oscillation(self, t):
+        if not len(self.sine_start):
+            return 0.0
+        idx = np.searchsorted(self.sine_start, t, side="right") - 1
+        valid = idx >= 0
+        idx = np.where(valid, idx, 0)
+        valid &= t < self.sine_end[idx]
+        phase = 2 * np.pi * self.sine_freq[idx] * (t - self.sine_start[idx])
+        return np.where(
+            valid, self.sine_amp[idx] * np.sin(phase + self.sine_phase[idx]), 0.0
+        )
+
+    def evaluate(self, t, outside=np.nan):
+        """Target level at time(s) t; `outside` before start and after end."""
+        t = np.asarray(t, dtype=np.float64)
+        if not len(self.knot_t):
+            return np.full(t.shape, outside)
+        y = np.interp(t, self.knot_t, self.knot_y, left=outside, right=outside)
+        return y + self._oscillation(t)
+
+    def render(self, sample_rate=100.0):
+        """Cached (times, levels) covering the whole protocol."""
+        if sample_rate not in self._dense:
+            if not len(self.knot_t):
+                self._dense[sample_rate] = (np.array([]), np.array([]))
+            else:
+                n = int(round((self.end_time - self.start_time) * sample_rate)) + 1
+                grid = self.start_time + np.arange(n) / sample_rate
+                grid = grid[~np.isin(grid, self.knot_t)]
+                # Keep every breakpoint (including both sides of a step) so
+                # corners are drawn sharply
+                t = np.concatenate([grid, self.knot_t])
+                y = np.concatenate(
+                    [
+                        self.evaluate(grid),
+                        self.knot_y + self._oscillation(self.knot_t),
+                    ]
+                )
+                order = np.argsort(t, kind="stable")
+                self._dense[sample_rate] = (t[order], y[order])
+        return self._dense[sample_rate]
+
+
+# Timeline phase codes
+REST = 0
+TRIAL = 1
+
+
+class ProtocolTimeline:
+    """
+    A whole session flattened onto a fixed-rate grid, so the animation and
+    scoring can index it directly (i = int(t * rate)) without branching:
+      - target : float32 %MVC target per tick (0 during rest)
+      - trial  : int16 trial number per tick, -1 during rest
+      - phase  : int8 REST / TRIAL per tick
+      - trials : list of dicts with name, level, start, end (seconds)
+    `compiled` is the underlying CompiledProtocol, used for plotting.
+    """
+
+    def __init__(self, compiled, trials, rate):
+        self.compiled = compiled
+        self.trials = trials
+        self.rate = float(rate)
+        n = int(np.ceil(compiled.end_time * self.rate)) + 1
+        t = np.arange(n) / self.rate
+        self.target = np.nan_to_num(compiled.evaluate(t), nan=0.0).astype(np.float32)
+        self.trial = np.full(n, -1, dtype=np.int16)
+        self.phase = np.full(n, REST, dtype=np.int8)
+        for k, trial in enumerate(trials):
+            i0 = int(round(trial["start"] * self.rate))
+            i1 = int(round(trial["end"] * self.rate))
+            self.trial[i0:i1] = k
+            self.phase[i0:i1] = TRIAL
+
+    def __len__(self):
+        return len(self.target)
+
+    @property
+    def duration(self):
+        return (len(self.target) - 1) / self.rate
+
+    def index(self, t):
+        """Tick index (or indices) for time(s) t, clipped to the timeline."""
+        # The tolerance keeps e.g. 0.29 s at 100 ticks/s on tick 29 rather
+        # than 28 (0.29 * 100 = 28.999...)
+        i = np.floor(np.asarray(t) * self.rate + 1e-6)
+        return np.clip(i.astype(np.int64), 0, len(self.target) - 1)
+
+
+class TrialScorer:
+    """
+    Tracking error per trial of a ProtocolTimeline, accumulated from
+    chunks of (channels, n) %MVC values and their times (s from the start
+    of the timeline), so a session can be scored while it runs. Samples
+    during rest or outside the timeline are ignored. results() gives, per
+    trial and channel, the RMS and mean absolute error against the target
+    and the fraction of samples within `tolerance` %MVC of it.
+    """
+
+    def __init__(self, timeline, channels, tolerance=5.0):
+        self.timeline = timeline
+        self.tolerance = float(tolerance)
+        trials = len(timeline.trials)
+        self.samples = np.zeros(trials, dtype=np.int64)
+        self.squared = np.zeros((trials, channels))
+        self.absolute = np.zeros((trials, channels))
+        self.within = np.zeros((trials, channels))
+
+    def add(self, t, values):
+        t = np.asarray(t, dtype=np.float64)
+        i = self.timeline.index(t)
+        trial = self.timeline.trial[i]
+        inside = (trial >= 0) & (t >= 0) & (t <= self.timeline.duration)
+        if not inside.any():
+            return
+        trial = trial[inside]
+        error = np.abs(values[:, inside] - self.timeline.target[i[inside]])
+        trials = len(self.samples)
+        self.samples += np.bincount(trial, minlength=trials)
+        for c, row in enumerate(error):
+            self.squared[:, c] += np.bincount(trial, row * row, minlength=trials)
+            self.absolute[:, c] += np.bincount(trial, row, minlength=trials)
+            hits = row <= self.tolerance
+            self.within[:, c] += np.bincount(trial, hits, minlength=trials)
+
+    def results(self):
+        """One dict per trial; error fields are None for unscored trials."""
+        results = []
+        for k, trial in enumerate(self.timeline.trials):
+            n = int(self.samples[k])
+            result = dict(trial, samples=n, rmse=None, mae=None, within=None)
+            if n:
+                result["rmse"] = np.sqrt(self.squared[k] / n).tolist()
+                result["mae"] = (self.absolute[k] / n).tolist()
+                result["within"] = (self.within[k] / n).tolist()
+            results.append(result)
+        return results
+
+
+def _resolve_level(spec, rng):
+    # A number, a list to draw from, or {"min": a, "max": b}
+    if isinstance(spec, (int, float)):
+        return float(spec)
+    if isinstance(spec, list):
+        return float(spec[rng.integers(len(spec))])
+    return float(rng.uniform(spec["min"], spec["max"]))
+
+
+def _resolve_duration(spec, rng):
+    if isinstance(spec, (int, float)):
+        return float(spec)
+    return float(rng.uniform(spec["min"], spec["max"]))
+
+
+def build_timeline(definition, seed=None):
+    """
+    Compile a protocol definition into a ProtocolTimeline.
+
+    definition keys:
+      - trials      : list of trial templates, each with "name", "level"
+                      (number, list or {"min", "max"}) and "segments", a
+                      list of [kind, duration, *args] where kind is "hold",
+                      "ramp" or "sine"; the string "level" in args is
+                      replaced by the trial's drawn level
+      - repetitions : times the trial list is repeated (default 1)
+      - shuffle     : shuffle trial order within each repetition
+      - rest        : rest between trials in s (number or {"min", "max"})
+      - lead_in     : rest before the first trial in s (default rest)
+      - seed        : random seed (overridden by the `seed` argument)
+      - timeline_rate : ticks per second of the flat timeline (default 100)
+    """
+    rng = np.random.default_rng(definition.get("seed") if seed is None else seed)
+    templates = definition["trials"]
+    if not templates:
+        raise ValueError("protocol has no trials")
+    rest = definition.get("rest", 5.0)
+
+    order = []
+    for _ in range(int(definition.get("repetitions", 1))):
+        block = list(range(len(templates)))
+        if definition.get("shuffle", False):
+            rng.shuffle(block)
+        order.extend(block)
+
+    protocol = Protocol()
+    protocol.hold(_resolve_duration(definition.get("lead_in", rest), rng), 0.0)
+    trials = []
+    for k, t_idx in enumerate(order):
+        template = templates[t_idx]
+        level = _resolve_level(template.get("level", 0.0), rng)
+        start = protocol.end_time
+        for segment in template["segments"]:
+            kind, duration, *args = segment
+            args = [level if a == "level" else a for a in args]
+            if kind not in ("hold", "ramp", "sine"):
+                raise ValueError(f"Unknown segment kind: {kind}")
+            getattr(protocol, kind)(float(duration), *args)
+        trials.append(
+            {
+                "name": template.get("name", f"trial {t_idx}"),
+                "level": level,
+                "start": start,
+                "end": protocol.end_time,
+            }
+        )
+        if k < len(order) - 1:
+            protocol.hold(_resolve_duration(rest, rng), 0.0)
+    lead_out = _resolve_duration(definition.get("lead_out", 0.0), rng)
+    if lead_out > 0:
+        protocol.hold(lead_out, 0.0)
+
+    return ProtocolTimeline(
+        protocol.compile(), trials, definition.get("timeline_rate", 100.0)
+    )
+
+
+def load_protocol(path, seed=None):
+    """Load a JSON protocol definition file and compile its timeline."""
+    with open(path, "r") as f:
+        return build_timeline(json.load(f), seed)
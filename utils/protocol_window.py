@@ -7,12 +7,28 @@ from PyQt5.QtWidgets import (
     QPushButton,
     QScrollArea,
     QCheckBox,
+    QComboBox,
     QGroupBox,
+    QFileDialog,
 )
 from PyQt5.QtCore import Qt, QTimer
 import pyqtgraph as pg
 import numpy as np
 
+from utils.auto_range import AxisRange
+from utils.gc_control import GcPolicy
+from utils.protocol import load_protocol
+from utils.render_mode import (
+    curve_options,
+    make_pen,
+    make_plot_widget,
+    resolve_render_mode,
+)
+from utils.processing import ProcessingEngine
+from utils.recording import Recorder
+from utils.spectral import SpectralWorker
+from utils.stream_server import StreamServer
+
 
 class ProtocolWindow(QMainWindow):
     """
@@ -59,6 +75,13 @@ class ProtocolWindow(QMainWindow):
         add_btn.clicked.connect(self.add_entry_box)
         btn_layout.addWidget(add_btn)
 
+        load_btn = QPushButton("Load Protocol")
+        load_btn.clicked.connect(self.load_protocol_file)
+        btn_layout.addWidget(load_btn)
+
+        self.trial_label = QLabel("")
+        btn_layout.addWidget(self.trial_label)
+
         self.start_btn = QPushButton("Start")
         self.start_btn.clicked.connect(self.start_animation)
         btn_layout.addWidget(self.start_btn)
@@ -72,7 +95,8 @@ class ProtocolWindow(QMainWindow):
         main_layout.addWidget(left_panel)
 
         # Center plot
-        self.plot_widget = pg.PlotWidget()
+        self.render_mode = resolve_render_mode(self.daq.profile.render_mode)
+        self.plot_widget = make_plot_widget(self.render_mode)
         self.plot_widget.setBackground("#2b2b2b")
         self.plot_widget.setLabel(
             "left", "% MVC / Signal", **{"color": "#FFFFFF", "font-size": "12pt"}
@@ -82,6 +106,10 @@ class ProtocolWindow(QMainWindow):
         )
         self.plot_widget.showGrid(x=True, y=True, alpha=0.3)
         self.plot_widget.addLegend()
+        # Only the visible time window is drawn, so both axes are set
+        # explicitly rather than from the data
+        self.plot_widget.disableAutoRange()
+        self.y_axis = AxisRange()
         main_layout.addWidget(self.plot_widget)
 
         # Right: channel control & DAQ control
@@ -101,9 +129,43 @@ class ProtocolWindow(QMainWindow):
         self.disconnect_daq_btn.setEnabled(False)
         daq_layout.addWidget(self.disconnect_daq_btn)
 
+        self.link_label = QLabel("")
+        self.link_label.setWordWrap(True)
+        daq_layout.addWidget(self.link_label)
+
+        # Raw blocks are recorded once the device settings are known
+        self.recorder = None
+        self.record_btn = QPushButton("Start Recording")
+        self.record_btn.clicked.connect(self.toggle_recording)
+        self.record_btn.setEnabled(self.daq.settings is not None)
+        daq_layout.addWidget(self.record_btn)
+        self.record_label = QLabel("")
+        self.record_label.setWordWrap(True)
+        daq_layout.addWidget(self.record_label)
+        self.gc_label = QLabel("")
+        self.gc_label.setWordWrap(True)
+        daq_layout.addWidget(self.gc_label)
+
         daq_group.setLayout(daq_layout)
         right_panel_layout.addWidget(daq_group)
 
+        # EMG fatigue (median / mean power frequency) of the chosen input,
+        # shown when the receiver decodes EMG
+        fatigue_group = QGroupBox("EMG Fatigue")
+        fatigue_layout = QVBoxLayout()
+        self.spectral_box = QComboBox()
+        self.spectral_box.currentIndexChanged.connect(self.on_spectral_input_changed)
+        fatigue_layout.addWidget(self.spectral_box)
+        self.fatigue_label = QLabel("No EMG data")
+        fatigue_layout.addWidget(self.fatigue_label)
+        self.emg_map = None
+        emg_map_btn = QPushButton("Show RMS Map")
+        emg_map_btn.clicked.connect(self.show_emg_map)
+        fatigue_layout.addWidget(emg_map_btn)
+        fatigue_group.setLayout(fatigue_layout)
+        fatigue_group.setVisible(getattr(self.daq, "emg", False))
+        right_panel_layout.addWidget(fatigue_group)
+
         channel_group = QGroupBox("AUX Channels")
         channel_scroll = QScrollArea()
         channel_scroll.setWidgetResizable(True)
@@ -112,6 +174,48 @@ class ProtocolWindow(QMainWindow):
         channel_widget.setLayout(self.channel_layout)
         channel_scroll.setWidget(channel_widget)
 
+        # Offsets, %MVC scaling, history and decimation run on the
+        # processing engine's thread; received blocks go straight to it
+        # from the receiver thread.
+        profile = self.daq.profile
+        self.engine = ProcessingEngine(
+            16,
+            profile.aux_rate,
+            profile.history_samples,
+            profile.sample_dtype,
+            profile.sample_scale,
+        )
+        self.engine.set_offsets(self.offsets)
+        self.engine.set_mvc(self.mvc_values)
+        self.engine.start()
+        self.daq.data_received.connect(self.engine.submit, Qt.DirectConnection)
+        # Outages keep the history (and so the plot) in step with the clock
+        self.daq.stream_gap.connect(self.engine.mark_gap, Qt.DirectConnection)
+        self.daq.link_lost.connect(self.on_link_lost)
+        self.daq.reconnected.connect(self.on_reconnected)
+        self.daq.connected.connect(self.on_connected)
+        self.daq.disconnected.connect(self.on_disconnected)
+        self.frame_seq = 0
+
+        # Other local tools (notebooks, a subject display) can follow the
+        # decoded streams through the stream server
+        self.stream_server = None
+        if profile.publish_port:
+            try:
+                server = StreamServer(port=profile.publish_port)
+            except OSError as e:
+                self.link_label.setText(f"Stream server not started: {e}")
+            else:
+                self.stream_server = server.start()
+                direct = Qt.DirectConnection
+                self.daq.connected.connect(self.publish_layout, direct)
+                self.daq.data_received.connect(server.publish, direct)
+                self.daq.emg_received.connect(server.publish_input, direct)
+                self.daq.stream_gap.connect(server.mark_gap, direct)
+                if self.daq.settings is not None:
+                    self.publish_layout()
+
+        self.aux_curves = [None] * 16
         self.channel_checkboxes = []
         for i in range(16):
             cb = QCheckBox(f"AUX Channel {i}")
@@ -133,27 +237,42 @@ class ProtocolWindow(QMainWindow):
         self.animation_timer.timeout.connect(self.update_animation)
         self.current_time = 0.0
         self.time_window = 10.0
+        # Extra history published beyond the visible range (fraction of
+        # the window), so the curve does not end early between frames
+        self.window_margin = 0.1
         self.is_animating = False
         self.points = []
         self.entry_boxes = []
+        self.timeline = None
 
-        # DAQ data handling
-        self.daq.data_received.connect(self.update_aux_data)
-        self.aux_data = [np.array([]) for _ in range(16)]
-        self.aux_curves = []
+        # Plots are refreshed from the engine's latest frame
+        self.plot_timer = QTimer()
+        self.plot_timer.timeout.connect(self.update_aux_plots)
+        self.plot_timer.start(33)
         self.protocol_curve = None
 
-        colors = [pg.intColor(i, 16) for i in range(16)]
-        for i in range(16):
-            curve = self.plot_widget.plot(
-                [], [], pen=pg.mkPen(color=colors[i], width=2), name=f"AUX {i}"
-            )
-            visible = i in self.selected_channels
-            curve.setVisible(visible)
-            self.aux_curves.append(curve)
+        # (input, SpectralWorker) of the input chosen in spectral_box, fed
+        # straight from the receiver thread; replaced as a whole
+        self.spectral = (None, None)
+        if getattr(self.daq, "emg", False):
+            self.daq.emg_received.connect(self.push_emg, Qt.DirectConnection)
+            if self.daq.settings is not None:
+                self.update_spectral_inputs()
+
+        # Curves exist only for channels that are (or have been) selected
+        self.update_channel_visibility()
+        self.update_display_window()
+        self.plot_widget.getPlotItem().getViewBox().sigResized.connect(
+            self.update_display_window
+        )
 
         # default protocol points can be created via add_entry_box if desired
-        self.sample_rate = 500
+        self.sample_rate = self.daq.profile.aux_rate
+
+        # Startup is done: long-lived objects are frozen and collections
+        # during protocols follow the profile's gc_mode
+        self.gc_policy = GcPolicy(profile.gc_mode).start()
+        self.last_trial = -1
 
     def connect_daq(self):
         try:
@@ -173,38 +292,183 @@ class ProtocolWindow(QMainWindow):
         except Exception as e:
             print(f"Failed to stop DAQ: {e}")
 
-    def update_aux_data(self, aux_signals):
-        # aux_signals shape (16, N)
-        for i in range(16):
-            data = aux_signals[i, :].astype(np.float64)
-            # subtract offset if known
-            data = data - self.offsets.get(i, 0.0)
-            mvc = self.mvc_values.get(i, None)
-            if mvc and mvc > 0:
-                percent = (data / mvc) * 100.0
-            else:
-                percent = data  # fallback: raw units
-            self.aux_data[i] = np.append(self.aux_data[i], percent)
-            max_samples = 30000
-            if len(self.aux_data[i]) > max_samples:
-                self.aux_data[i] = self.aux_data[i][-max_samples:]
+    def on_connected(self):
+        self.record_btn.setEnabled(True)
+        if getattr(self.daq, "emg", False):
+            self.update_spectral_inputs()
+
+    def publish_layout(self):
+        # Called on the receiver thread, before the first block
+        self.stream_server.set_layout(
+            self.daq.daq_config, self.daq.profile.sample_scale
+        )
 
-        self.update_aux_plots()
+    def on_link_lost(self, reason):
+        self.link_label.setText(f"Link lost ({reason}), reconnecting...")
+
+    def on_reconnected(self, seconds):
+        self.link_label.setText(f"Reconnected after {seconds:.2f} s")
+
+    def on_disconnected(self):
+        self.connect_daq_btn.setEnabled(True)
+        self.disconnect_daq_btn.setEnabled(False)
+
+    def toggle_recording(self):
+        if self.recorder is None:
+            self.start_recording()
+        else:
+            self.stop_recording()
+
+    def start_recording(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Record", "", "Recordings (*.nvrec)"
+        )
+        if not path:
+            return
+        try:
+            self.recorder = Recorder(path, self.daq.profile, self.daq.settings)
+        except (OSError, ValueError) as e:
+            self.record_label.setText(f"Failed to record: {e}")
+            return
+        self.recorder.start()
+        # Blocks go from the receiver thread to the recorder's thread
+        self.daq.block_received.connect(self.recorder.write_block, Qt.DirectConnection)
+        self.daq.stream_gap.connect(self.recorder.write_gap, Qt.DirectConnection)
+        self.record_btn.setText("Stop Recording")
+        self.record_label.setText(f"Recording to {path}")
+
+    def stop_recording(self):
+        recorder, self.recorder = self.recorder, None
+        self.daq.block_received.disconnect(recorder.write_block)
+        self.daq.stream_gap.disconnect(recorder.write_gap)
+        recorder.close()
+        self.record_btn.setText("Start Recording")
+        self.record_label.setText(
+            f"Recorded {len(recorder.offsets)} blocks, "
+            f"{recorder.ratio:.2f}x compression"
+        )
+
+    def update_spectral_inputs(self):
+        """List the decoded EMG inputs of the current layout."""
+        config = self.daq.daq_config
+        current = self.spectral_box.currentData()
+        self.spectral_box.blockSignals(True)
+        self.spectral_box.clear()
+        for i in range(10):
+            if (
+                config["IN_Active"][i]
+                and not config["HRES"][i]
+                and config["Size_IN"][i]
+            ):
+                self.spectral_box.addItem(f"Input {i + 1}", i)
+        position = self.spectral_box.findData(current)
+        self.spectral_box.setCurrentIndex(max(position, 0))
+        self.spectral_box.blockSignals(False)
+        # The probe (and so the channel count) may differ after a reconnect
+        self.on_spectral_input_changed()
+
+    def on_spectral_input_changed(self):
+        _, worker = self.spectral
+        self.spectral = (None, None)
+        if worker is not None:
+            worker.stop()
+            worker.wait()
+        index = self.spectral_box.currentData()
+        if index is None:
+            self.fatigue_label.setText("No EMG data")
+            return
+        worker = SpectralWorker(
+            self.daq.daq_config["NumChan"][index], self.daq.profile.input_rate(index)
+        )
+        worker.results.connect(self.update_fatigue)
+        worker.start()
+        self.spectral = (index, worker)
+        self.fatigue_label.setText(f"Input {index + 1}: waiting for data")
+
+    def push_emg(self, index, samples):
+        # Receiver thread
+        spectral_input, worker = self.spectral
+        if index == spectral_input:
+            worker.push(samples)
+
+    def show_emg_map(self):
+        # A closed map has let go of the receiver; a new one starts afresh
+        if self.emg_map is None or not self.emg_map.isVisible():
+            from utils.emg_map import EMGMapWindow
+
+            self.emg_map = EMGMapWindow(self.daq)
+        self.emg_map.show()
+        self.emg_map.raise_()
+
+    def update_fatigue(self, times, mdf, mnf):
+        spectral_input, worker = self.spectral
+        if self.sender() is not worker:
+            # Queued before the input was changed
+            return
+        # Latest window, averaged over channels
+        self.fatigue_label.setText(
+            f"Input {spectral_input + 1} at {times[-1]:.1f} s\n"
+            f"MDF {mdf[:, -1].mean():.0f} Hz, MNF {mnf[:, -1].mean():.0f} Hz"
+        )
 
     def update_aux_plots(self):
-        sample_rate = self.sample_rate
-        for i in range(16):
-            if self.channel_checkboxes[i].isChecked() and len(self.aux_data[i]) > 0:
-                time_axis = np.arange(len(self.aux_data[i])) / sample_rate
-                if self.is_animating:
-                    time_axis = time_axis + (
-                        self.current_time - len(self.aux_data[i]) / sample_rate
-                    )
-                self.aux_curves[i].setData(time_axis, self.aux_data[i])
+        frame = self.engine.latest()
+        if frame is None or frame.seq == self.frame_seq or frame.x is None:
+            return
+        self.frame_seq = frame.seq
+        time_axis = frame.x
+        if self.is_animating:
+            time_axis = time_axis + np.float32(self.current_time - frame.span)
+        else:
+            self.plot_widget.setXRange(
+                frame.span - self.time_window, frame.span, padding=0
+            )
+        for row, i in enumerate(frame.channels):
+            self.aux_curve(i).setData(time_axis, frame.y[row])
+        self.fit_y(frame.bounds)
+
+    def update_display_window(self):
+        """
+        Have the engine publish the history inside the visible range (the
+        newest time_window, half of it while animating) plus a margin, at
+        about one min/max pair per pixel.
+        """
+        visible = self.time_window / 2 if self.is_animating else self.time_window
+        seconds = visible + self.window_margin * self.time_window
+        width = self.plot_widget.getPlotItem().getViewBox().width()
+        pixels = width * seconds / self.time_window if width > 0 else 1000
+        self.engine.set_display_window(seconds, 2 * int(pixels))
+
+    def fit_y(self, bounds):
+        """Y range over the published bounds and the target, with hysteresis."""
+        low, high = float(bounds.min()), float(bounds.max())
+        if self.timeline is not None:
+            low = min(low, 0.0, self.timeline.compiled.min_level)
+            high = max(high, self.timeline.compiled.max_level)
+        view = self.y_axis.update(low, high)
+        if view is not None:
+            self.plot_widget.setYRange(*view, padding=0)
+
+    def aux_curve(self, i):
+        if self.aux_curves[i] is None:
+            self.aux_curves[i] = self.plot_widget.plot(
+                [],
+                [],
+                pen=make_pen(pg.intColor(i, 16), 2, self.render_mode),
+                name=f"AUX {i}",
+                **curve_options(self.render_mode),
+            )
+        return self.aux_curves[i]
 
     def update_channel_visibility(self):
+        checked = []
         for i, cb in enumerate(self.channel_checkboxes):
-            self.aux_curves[i].setVisible(cb.isChecked())
+            if cb.isChecked():
+                self.aux_curve(i).setVisible(True)
+                checked.append(i)
+            elif self.aux_curves[i] is not None:
+                self.aux_curves[i].setVisible(False)
+        self.engine.set_display_channels(checked)
 
     def add_entry_box(self):
         # Placeholder implementation to allow adding protocol points if needed.
@@ -212,16 +476,60 @@ class ProtocolWindow(QMainWindow):
         label = QLabel("Protocol point (add ported EntryBox here)")
         self.entries_layout.addWidget(label)
 
+    def load_protocol_file(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Load Protocol", "", "Protocol files (*.json)"
+        )
+        if path:
+            try:
+                self.set_timeline(load_protocol(path))
+            except (OSError, ValueError, KeyError) as e:
+                self.trial_label.setText(f"Failed to load protocol: {e}")
+
+    def set_timeline(self, timeline):
+        """Show a compiled ProtocolTimeline as the target and reset the clock."""
+        self.timeline = timeline
+        if self.protocol_curve is None:
+            self.protocol_curve = self.plot_widget.plot(
+                [], [], pen=make_pen((0, 150, 255), 5, self.render_mode), name="Target"
+            )
+        self.protocol_curve.setData(*timeline.compiled.render())
+        self.current_time = 0.0
+        self.trial_label.setText(
+            f"{len(timeline.trials)} trials, {timeline.duration:.0f} s"
+        )
+
     def start_animation(self):
+        if self.timeline is not None and self.current_time >= self.timeline.duration:
+            self.current_time = 0.0
+            self.last_trial = -1
         self.is_animating = True
+        self.gc_policy.begin_protocol()
         self.start_btn.setEnabled(False)
         self.stop_btn.setEnabled(True)
+        self.update_display_window()
         self.animation_timer.start(50)
 
     def update_animation(self):
         if not self.is_animating:
             return
         self.current_time += 0.05
+        if self.timeline is not None:
+            if self.current_time >= self.timeline.duration:
+                self.stop_animation()
+                self.trial_label.setText("Protocol finished")
+                return
+            trial = self.timeline.trial[self.timeline.index(self.current_time)]
+            if trial < 0 <= self.last_trial:
+                # Collect while the subject rests
+                self.gc_policy.rest()
+                self.gc_label.setText(self.gc_policy.monitor.summary())
+            self.last_trial = trial
+            self.trial_label.setText(
+                f"Trial {trial + 1} / {len(self.timeline.trials)}"
+                if trial >= 0
+                else "Rest"
+            )
         x_start = self.current_time - self.time_window / 2
         x_end = self.current_time + self.time_window / 2
         self.plot_widget.setXRange(x_start, x_end, padding=0)
@@ -229,12 +537,28 @@ class ProtocolWindow(QMainWindow):
     def stop_animation(self):
         self.is_animating = False
         self.animation_timer.stop()
+        self.gc_policy.end_protocol()
+        self.gc_label.setText(self.gc_policy.monitor.summary())
         self.start_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
+        self.update_display_window()
 
     def closeEvent(self, event):
         try:
             self.daq.stop()
         except Exception:
             pass
+        self.plot_timer.stop()
+        if self.recorder is not None:
+            self.stop_recording()
+        self.engine.stop()
+        if self.stream_server is not None:
+            self.stream_server.stop()
+        self.gc_policy.stop()
+        _, worker = self.spectral
+        if worker is not None:
+            worker.stop()
+            worker.wait()
+        if self.emg_map is not None and self.emg_map.isVisible():
+            self.emg_map.close()
         event.accept()
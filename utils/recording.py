@@ -0,0 +1,422 @@
+"""
+Compressed recordings of raw Novecento blocks.
+
+    python -m utils.recording
+
+benchmarks the codecs on simulator blocks and EMG-like blocks (three
+70-channel inputs at 2 kHz).
+"""
+
+import json
+import lzma
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from utils.acquisition_profile import (
+    NUM_AUX,
+    AcquisitionProfile,
+    input_gather_index,
+    stream_indices,
+)
+from utils.block_queue import BlockQueue
+from utils.lod import LodWriter, lod_path
+
+MAGIC = b"NVREC\x00\x01\x00"
+INDEX_MAGIC = b"NVRECIDX"
+BLOCK, GAP = 1, 2
+_RECORD = struct.Struct("<BI")  # kind, payload length
+_GAP = struct.Struct("<Q")  # AUX samples missing
+_TRAILER = struct.Struct("<QQQ8s")  # blocks, gaps, index offset, INDEX_MAGIC
+
+CODECS = ("none", "zlib", "lzma")
+# Default levels, chosen with `python -m utils.recording`: higher levels
+# cost several times the encode time for a few percent of file size
+LEVELS = {"none": 0, "zlib": 1, "lzma": 0}
+
+
+def channel_order(daq_config, columns):
+    """
+    Flat indices that list the samples of a Fortran-ordered block channel
+    by channel, and the (channels, n) shape of each segment: the streams
+    of stream_indices(), then every other block row (accessory rows, HRES
+    inputs) as one channel with a sample per frame.
+    """
+    P = daq_config["PacketSize1Block"]
+    indices = list(stream_indices(daq_config, columns).values())
+    covered = np.zeros(P, dtype=bool)
+    for index in indices:
+        covered[index.ravel() % P] = True
+    rows = np.flatnonzero(~covered)
+    indices.append(rows[:, None] + P * np.arange(columns)[None, :])
+    order = np.concatenate([index.ravel() for index in indices])
+    return order, [index.shape for index in indices]
+
+
+class BlockCodec:
+    """
+    Lossless codec for the raw blocks of one daq_config. Samples are put
+    in channel order, delta-encoded along time per channel, split into a
+    low-byte and a high-byte plane and compressed with zlib or lzma.
+    Neighbouring samples are close, so the high-byte plane is nearly
+    constant and compresses to almost nothing. "none" stores blocks as
+    they are. encode() takes a flat "<i2" block, decode() returns one.
+    """
+
+    def __init__(self, daq_config, codec="zlib", level=None, columns=None):
+        if codec not in CODECS:
+            raise ValueError(f"codec must be one of {CODECS}")
+        self.codec = codec
+        self.level = LEVELS[codec] if level is None else level
+        columns = 500 * daq_config["PlotTime"] if columns is None else columns
+        self.block_samples = daq_config["PacketSize1Block"] * columns
+        self.order, shapes = channel_order(daq_config, columns)
+        # (slice, shape) of each channel segment in the ordered samples
+        self._segments = []
+        start = 0
+        for shape in shapes:
+            stop = start + shape[0] * shape[1]
+            self._segments.append((slice(start, stop), shape))
+            start = stop
+        self._ordered = np.empty(self.block_samples, dtype="<i2")
+        self._delta = np.empty(self.block_samples, dtype="<i2")
+
+    def encode(self, block):
+        block = np.asarray(block).reshape(-1)
+        if block.size != self.block_samples:
+            raise ValueError(
+                f"Block has {block.size} samples, expected {self.block_samples}"
+            )
+        if self.codec == "none":
+            return block.astype("<i2", copy=False).tobytes()
+        ordered = np.take(block, self.order, out=self._ordered)
+        delta = self._delta
+        for span, shape in self._segments:
+            x = ordered[span].reshape(shape)
+            d = delta[span].reshape(shape)
+            d[:, 0] = x[:, 0]
+            np.subtract(x[:, 1:], x[:, :-1], out=d[:, 1:])
+        data = delta.view(np.uint8).reshape(-1, 2).T.tobytes()
+        if self.codec == "zlib":
+            return zlib.compress(data, self.level)
+        return lzma.compress(data, preset=self.level)
+
+    def decode(self, payload):
+        if self.codec == "none":
+            return np.frombuffer(payload, dtype="<i2").copy()
+        if self.codec == "zlib":
+            data = zlib.decompress(payload)
+        else:
+            data = lzma.decompress(payload)
+        planes = np.frombuffer(data, dtype=np.uint8).reshape(2, -1)
+        delta = np.empty(self.block_samples, dtype="<i2")
+        delta.view(np.uint8).reshape(-1, 2)[:] = planes.T
+        for span, shape in self._segments:
+            d = delta[span].reshape(shape)
+            np.cumsum(d, axis=1, dtype=d.dtype, out=d)
+        block = np.empty(self.block_samples, dtype="<i2")
+        block[self.order] = delta
+        return block
+
+
+class Recorder:
+    """
+    Records raw blocks (DAQReceiver.block_received) and stream gaps
+    (DAQReceiver.stream_gap) to a file. write_block() and write_gap() may
+    be called from any thread, e.g. connected to those signals with a
+    direct connection; encoding and writing run on the recorder's own
+    thread. Blocks lost because the writer fell `maxlen` blocks behind are
+    recorded as gaps. close() writes the remaining blocks and the index.
+    With pyramid=True (default) the recorder thread also builds the
+    min/max/mean pyramid of every stream (utils.lod) into lod_path(path),
+    for the review viewer.
+
+    File layout: MAGIC, a uint32 length and a JSON header (profile, the
+    device's settings reply, codec and level), then records of (kind
+    uint8, length uint32, payload): BLOCK payloads are encoded blocks,
+    GAP payloads the AUX samples missing (uint64). The index at the end
+    holds the offset of every block record and the (blocks before, AUX
+    samples) of every gap, followed by _TRAILER.
+    """
+
+    def __init__(
+        self,
+        path,
+        profile,
+        settings=None,
+        codec=None,
+        level=None,
+        maxlen=64,
+        pyramid=True,
+    ):
+        codec = profile.record_codec if codec is None else codec
+        self.daq_config = profile.layout(settings)
+        self.codec = BlockCodec(self.daq_config, codec, level)
+        self.block_aux_samples = self.daq_config["SizeAux"] * profile.columns // NUM_AUX
+        header = json.dumps(
+            {
+                "profile": profile.to_dict(),
+                "settings": list(settings) if settings is not None else None,
+                "codec": codec,
+                "level": self.codec.level,
+            }
+        ).encode()
+        self._file = open(path, "wb")
+        self._file.write(MAGIC + struct.pack("<I", len(header)) + header)
+        self.pyramid = None
+        if pyramid:
+            self.pyramid = LodWriter(lod_path(path), self.daq_config, profile.columns)
+        self.offsets = []
+        self.gaps = []
+        self.raw_bytes = 0
+        self.encoded_bytes = 0
+        self.queue = BlockQueue(maxlen=maxlen)
+        self._last_seq = -1
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def write_block(self, block, wait=False):
+        """
+        Queue a raw block for the writer thread. With `wait` the caller
+        blocks while the writer is `maxlen` blocks behind, instead of the
+        oldest blocks being recorded as a gap; the recorder must be
+        started.
+        """
+        self.queue.put((BLOCK, block), wait)
+        self._wake.set()
+
+    def write_gap(self, samples, skipped_bytes=0):
+        """`samples` AUX samples per channel are missing; see stream_gap."""
+        self.queue.put((GAP, int(samples)))
+        self._wake.set()
+
+    def close(self):
+        self._running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._write_pending()
+        index_offset = self._file.tell()
+        self._file.write(np.asarray(self.offsets, dtype="<u8").tobytes())
+        self._file.write(np.asarray(self.gaps, dtype="<u8").reshape(-1, 2).tobytes())
+        self._file.write(
+            _TRAILER.pack(len(self.offsets), len(self.gaps), index_offset, INDEX_MAGIC)
+        )
+        self._file.close()
+        if self.pyramid is not None:
+            self.pyramid.close()
+
+    @property
+    def ratio(self):
+        """Raw bytes per recorded byte so far."""
+        return self.raw_bytes / self.encoded_bytes if self.encoded_bytes else 0.0
+
+    def _run(self):
+        while self._running:
+            self._wake.wait(0.5)
+            self._wake.clear()
+            self._write_pending()
+
+    def _write_pending(self):
+        for seq, (kind, item) in self.queue.drain():
+            if seq != self._last_seq + 1:
+                self._record_gap((seq - self._last_seq - 1) * self.block_aux_samples)
+            self._last_seq = seq
+            if kind == GAP:
+                self._record_gap(item)
+                continue
+            payload = self.codec.encode(item)
+            self.offsets.append(self._file.tell())
+            self._file.write(_RECORD.pack(BLOCK, len(payload)))
+            self._file.write(payload)
+            self.raw_bytes += 2 * self.codec.block_samples
+            self.encoded_bytes += _RECORD.size + len(payload)
+            if self.pyramid is not None:
+                self.pyramid.append_block(item)
+
+    def _record_gap(self, samples):
+        if samples <= 0:
+            return
+        self.gaps.append((len(self.offsets), samples))
+        self._file.write(_RECORD.pack(GAP, _GAP.size))
+        self._file.write(_GAP.pack(samples))
+        if self.pyramid is not None:
+            self.pyramid.gap(samples)
+
+
+class RecordingReader:
+    """
+    Random access to a recording: block(k) is one seek, one read and a
+    decode. The index is read from the end of the file, or rebuilt with
+    one pass over the records when the recording was not closed.
+    Attributes: profile, settings, daq_config, gaps ((blocks before,
+    AUX samples) per gap).
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        if self._file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a recording")
+        (length,) = struct.unpack("<I", self._file.read(4))
+        header = json.loads(self._file.read(length))
+        self.profile = AcquisitionProfile(**header["profile"])
+        settings = header["settings"]
+        self.settings = bytes(settings) if settings is not None else None
+        self.daq_config = self.profile.layout(self.settings)
+        self.codec = BlockCodec(self.daq_config, header["codec"], header["level"])
+        self._records_start = self._file.tell()
+        if not self._read_index():
+            self._scan()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def block(self, k):
+        """Block k as a flat "<i2" array."""
+        self._file.seek(int(self.offsets[k]))
+        _, length = _RECORD.unpack(self._file.read(_RECORD.size))
+        return self.codec.decode(self._file.read(length))
+
+    def blocks(self):
+        for k in range(len(self)):
+            yield self.block(k)
+
+    def close(self):
+        self._file.close()
+
+    def _read_index(self):
+        self._file.seek(0, 2)
+        end = self._file.tell()
+        if end - self._records_start < _TRAILER.size:
+            return False
+        self._file.seek(end - _TRAILER.size)
+        blocks, gaps, offset, magic = _TRAILER.unpack(self._file.read(_TRAILER.size))
+        if magic != INDEX_MAGIC:
+            return False
+        self._file.seek(offset)
+        self.offsets = np.frombuffer(self._file.read(8 * blocks), dtype="<u8")
+        gap_data = np.frombuffer(self._file.read(16 * gaps), dtype="<u8")
+        self.gaps = [tuple(int(v) for v in gap) for gap in gap_data.reshape(-1, 2)]
+        return True
+
+    def _scan(self):
+        offsets = []
+        self.gaps = []
+        self._file.seek(self._records_start)
+        while True:
+            offset = self._file.tell()
+            head = self._file.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                break
+            kind, length = _RECORD.unpack(head)
+            payload = self._file.read(length)
+            if len(payload) < length:
+                break
+            if kind == BLOCK:
+                offsets.append(offset)
+            elif kind == GAP:
+                self.gaps.append((len(offsets), _GAP.unpack(payload)[0]))
+        self.offsets = np.asarray(offsets, dtype="<u8")
+
+
+def emg_like_blocks(config, blocks, seed=0):
+    """
+    Raw blocks with EMG-like inputs: band-limited noise (about 20-400 Hz)
+    in bursts, 50 Hz hum and per-channel offsets, a slow force on AUX
+    channel 0 and the simulator's frame counter.
+    """
+    from utils.simulator import simulated_frames
+
+    rng = np.random.default_rng(seed)
+    columns = 500 * config["PlotTime"]
+    P = config["PacketSize1Block"]
+
+    def force(t):
+        aux = rng.normal(0.0, 0.002, (NUM_AUX, len(t)))
+        aux[0] += 0.5 + 0.4 * np.sin(2 * np.pi * 0.2 * t)
+        return aux
+
+    result = []
+    for b in range(blocks):
+        frames = simulated_frames(config, b * columns, columns, force)
+        block = np.frombuffer(frames, dtype="<i2").copy()
+        for i in range(10):
+            size = config["Size_IN"][i]
+            if not config["IN_Active"][i] or not size or config["HRES"][i]:
+                continue
+            channels = config["NumChan"][i]
+            index = input_gather_index(config["Ptr_IN"][i], size, channels, P, columns)
+            n = index.shape[1]
+            rate = config["FsampVal"][config["Fsamp"][i]]
+            t = (b * n + np.arange(n)) / rate
+            noise = rng.normal(0.0, 1.0, (channels, n + 64))
+            # Difference of two moving averages: a crude band-pass
+            c = np.cumsum(noise, axis=1)
+            short = (c[:, 4:] - c[:, :-4])[:, -n:] / 4
+            long = (c[:, 64:] - c[:, :-64])[:, -n:] / 64
+            burst = 0.2 + (np.sin(2 * np.pi * 0.5 * t) > 0)
+            emg = 300 * (short - long) * burst
+            emg += 40 * np.sin(2 * np.pi * 50 * t) + rng.normal(0, 500, (channels, 1))
+            block[index] = np.clip(np.round(emg), -32768, 32767).astype(np.int16)
+        result.append(block)
+    return result
+
+
+def benchmark(blocks=5):
+    """
+    (signal, codec, level, ratio, encode MB/s, decode MB/s) for three
+    70-channel EMG inputs at 2 kHz, one-second blocks.
+    """
+    from utils.simulator import simulated_frames
+
+    profile = AcquisitionProfile(probe_types=[5, 5, 5] + [0] * 7)
+    config = profile.layout()
+    columns = profile.columns
+    signals = {
+        "simulator": [
+            np.frombuffer(simulated_frames(config, b * columns, columns), dtype="<i2")
+            for b in range(blocks)
+        ],
+        "EMG-like": emg_like_blocks(config, blocks),
+    }
+    settings = [("none", 0), ("zlib", 1), ("zlib", 6), ("lzma", 0), ("lzma", 6)]
+    results = []
+    for name, data in signals.items():
+        raw = sum(block.nbytes for block in data)
+        for codec, level in settings:
+            c = BlockCodec(config, codec, level)
+            start = time.perf_counter()
+            payloads = [c.encode(block) for block in data]
+            t_encode = time.perf_counter() - start
+            start = time.perf_counter()
+            decoded = [c.decode(payload) for payload in payloads]
+            t_decode = time.perf_counter() - start
+            assert all(np.array_equal(a, b) for a, b in zip(data, decoded))
+            ratio = raw / sum(len(p) for p in payloads)
+            results.append(
+                (name, codec, level, ratio, raw / t_encode / 1e6, raw / t_decode / 1e6)
+            )
+    return results
+
+
+if __name__ == "__main__":
+    print(
+        f"{'signal':>10} {'codec':>6} {'level':>5} {'ratio':>6} "
+        f"{'encode MB/s':>12} {'decode MB/s':>12}"
+    )
+    for name, codec, level, ratio, encode, decode in benchmark():
+        print(
+            f"{name:>10} {codec:>6} {level:>5} {ratio:>6.2f} "
+            f"{encode:>12.1f} {decode:>12.1f}"
+        )
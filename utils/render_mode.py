@@ -0,0 +1,116 @@
+"""
+Plot render modes shared by the GUI windows.
+
+  - "default" : pyqtgraph defaults (raster painting, wide pens)
+  - "fast"    : software rasterization with width-1 cosmetic pens,
+                clip-to-view, automatic peak downsampling and no finite
+                check on data curves
+  - "opengl"  : "fast" drawn through an OpenGL viewport; falls back to
+                "fast" when no OpenGL context can be created
+
+    QT_QPA_PLATFORM=offscreen python -m utils.render_mode
+
+prints the frame time of 16 visible channels in every available mode.
+"""
+
+import time
+
+import numpy as np
+import pyqtgraph as pg
+from PyQt5.QtGui import QOpenGLContext
+
+RENDER_MODES = ("default", "fast", "opengl")
+
+_opengl_available = None
+
+
+def opengl_available():
+    """True if an OpenGL context can be created (needs a QApplication)."""
+    global _opengl_available
+    if _opengl_available is None:
+        _opengl_available = QOpenGLContext().create()
+    return _opengl_available
+
+
+def resolve_render_mode(mode):
+    """
+    The mode to draw with: `mode`, or "fast" for "opengl" without an
+    OpenGL context. Headless runs and the tests use the offscreen
+    platform, which has none, so there "opengl" always falls back.
+    """
+    if mode not in RENDER_MODES:
+        raise ValueError(f"render mode must be one of {RENDER_MODES}")
+    if mode == "opengl" and not opengl_available():
+        return "fast"
+    return mode
+
+
+def make_plot_widget(mode="default", **kwargs):
+    """pg.PlotWidget set up for `mode` (after resolve_render_mode)."""
+    widget = pg.PlotWidget(useOpenGL=mode == "opengl", **kwargs)
+    if mode != "default":
+        item = widget.getPlotItem()
+        item.setClipToView(True)
+        item.setDownsampling(auto=True, mode="peak")
+    return widget
+
+
+def make_pen(color, width=1, mode="default"):
+    if mode == "default":
+        return pg.mkPen(color=color, width=width)
+    pen = pg.mkPen(color=color, width=1)
+    pen.setCosmetic(True)
+    return pen
+
+
+def curve_options(mode="default"):
+    """Extra plot() keywords for curves whose data is always finite."""
+    return {} if mode == "default" else {"skipFiniteCheck": True}
+
+
+def frame_times(mode, channels=16, samples=30000, frames=60, size=(1000, 600)):
+    """
+    Seconds per frame for `channels` visible curves of `samples` points:
+    each frame updates every curve and repaints the widget synchronously.
+    """
+    widget = make_plot_widget(mode)
+    widget.resize(*size)
+    curves = [
+        widget.plot(
+            [],
+            [],
+            pen=make_pen(pg.intColor(i, channels), 2, mode),
+            **curve_options(mode),
+        )
+        for i in range(channels)
+    ]
+    widget.show()
+    pg.QtWidgets.QApplication.processEvents()
+
+    x = np.arange(samples, dtype=np.float32) / np.float32(500)
+    data = np.random.normal(0, 1, (channels, samples + frames)).astype(np.float32)
+    data += np.arange(channels, dtype=np.float32)[:, None] * 4
+    times = []
+    for f in range(frames):
+        start = time.perf_counter()
+        for i, curve in enumerate(curves):
+            curve.setData(x, data[i, f : f + samples])
+        widget.viewport().repaint()
+        times.append(time.perf_counter() - start)
+    widget.close()
+    return times
+
+
+if __name__ == "__main__":
+    app = pg.mkQApp()
+    print(f"OpenGL available: {opengl_available()}")
+    for mode in RENDER_MODES:
+        effective = resolve_render_mode(mode)
+        if effective != mode:
+            print(f"{mode:>8}: not available, falls back to {effective}")
+            continue
+        times = frame_times(mode)
+        print(
+            f"{mode:>8}: median {np.median(times) * 1e3:6.1f} ms/frame, "
+            f"max {np.max(times) * 1e3:6.1f} ms"
+        )
@@ -0,0 +1,340 @@
+"""
+Review viewer for recordings (utils.recording).
+
+    python -m utils.review_window session.nvrec
+    QT_QPA_PLATFORM=offscreen python -m utils.review_window --benchmark
+
+The benchmark records one hour of a 70-channel EMG input at 2 kHz and
+times redraws at zoom levels from the whole hour down to two seconds.
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pyqtgraph as pg
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtWidgets import (
+    QApplication,
+    QComboBox,
+    QFileDialog,
+    QHBoxLayout,
+    QLabel,
+    QListWidget,
+    QListWidgetItem,
+    QMainWindow,
+    QVBoxLayout,
+    QWidget,
+)
+
+from utils.acquisition_profile import stream_indices
+from utils.lod import LodReader, build_lod, choose_level, lod_path
+from utils.recording import RecordingReader
+from utils.render_mode import curve_options, make_pen, make_plot_widget
+
+
+class ReviewWindow(QMainWindow):
+    """
+    Pan and zoom over a whole recording. Only the visible range is drawn,
+    from the pyramid level with about one (min, max) bin per pixel, or
+    from the raw blocks once the view is zoomed in past the pyramid's
+    finest level; a redraw costs about the same at any zoom and recording
+    length. The pyramid is built with build_lod() when the recording has
+    none. Gaps are shaded; over them the pyramid holds the last value.
+    """
+
+    # Blocks decoded for a raw view at most, and kept decoded
+    RAW_BLOCKS = 8
+
+    def __init__(self, path, render_mode="fast", parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"Review - {os.path.basename(path)}")
+        self.setGeometry(100, 100, 1400, 700)
+
+        self.recording = RecordingReader(path)
+        pyramid = lod_path(path)
+        if not os.path.exists(pyramid):
+            build_lod(path, pyramid)
+        self.lod = LodReader(pyramid)
+        self.indices = stream_indices(
+            self.recording.daq_config, self.recording.profile.columns
+        )
+        self.render_mode = render_mode
+        self.stream = 0
+        self.channels = []
+        self.curves = {}
+        self.redraw_time = 0.0
+        self._blocks = OrderedDict()
+        self._redraw_pending = False
+
+        main_widget = QWidget()
+        self.setCentralWidget(main_widget)
+        main_layout = QHBoxLayout()
+        main_widget.setLayout(main_layout)
+
+        self.plot_widget = make_plot_widget(render_mode)
+        self.plot_widget.setBackground("#2b2b2b")
+        self.plot_widget.setLabel(
+            "bottom", "Time (s)", **{"color": "#FFFFFF", "font-size": "12pt"}
+        )
+        self.plot_widget.showGrid(x=True, y=True, alpha=0.3)
+        self.view = self.plot_widget.getPlotItem().getViewBox()
+        self.view.setAutoVisible(y=True)
+        self.view.enableAutoRange(axis="y")
+        main_layout.addWidget(self.plot_widget)
+
+        right_panel = QWidget()
+        right_layout = QVBoxLayout()
+        right_panel.setLayout(right_layout)
+        right_panel.setMaximumWidth(250)
+        self.stream_combo = QComboBox()
+        for stream in sorted(self.lod.streams):
+            self.stream_combo.addItem(
+                "AUX" if stream == 0 else f"Input {stream}", stream
+            )
+        self.stream_combo.currentIndexChanged.connect(self.on_stream_changed)
+        right_layout.addWidget(self.stream_combo)
+        self.channel_list = QListWidget()
+        self.channel_list.itemChanged.connect(self.update_channels)
+        right_layout.addWidget(self.channel_list)
+        self.level_label = QLabel("")
+        self.level_label.setWordWrap(True)
+        right_layout.addWidget(self.level_label)
+        main_layout.addWidget(right_panel)
+
+        # Gap shading, in seconds from the start of the recording
+        aux_starts = self.block_starts(0)
+        aux_rate = self.lod.streams[0]["rate"]
+        for before, samples in self.recording.gaps:
+            end = aux_starts[before] / aux_rate
+            region = pg.LinearRegionItem(
+                (end - samples / aux_rate, end),
+                movable=False,
+                brush=pg.mkBrush(255, 80, 80, 40),
+                pen=pg.mkPen(None),
+            )
+            self.plot_widget.addItem(region)
+
+        self.view.sigXRangeChanged.connect(self.schedule_redraw)
+        self.view.sigResized.connect(self.schedule_redraw)
+        self.on_stream_changed()
+        self.view.setXRange(0, self.duration, padding=0)
+
+    @property
+    def duration(self):
+        """Seconds covered by the recording, gaps included."""
+        return self.block_starts(0)[-1] / self.lod.streams[0]["rate"]
+
+    def block_starts(self, stream):
+        """
+        Sample index of every block of `stream` on the recording's
+        timeline (gaps included), plus the end of the last block.
+        """
+        n = self.indices[stream].shape[1]
+        starts = n * np.arange(len(self.recording) + 1, dtype=np.int64)
+        scale = self.lod.streams[stream]["rate"] / self.lod.streams[0]["rate"]
+        for before, samples in self.recording.gaps:
+            starts[before:] += round(samples * scale)
+        return starts
+
+    def on_stream_changed(self):
+        self.stream = self.stream_combo.currentData()
+        self.starts = self.block_starts(self.stream)
+        info = self.lod.streams[self.stream]
+        self.plot_widget.setLabel(
+            "left",
+            "AUX" if self.stream == 0 else f"Input {self.stream}",
+            **{"color": "#FFFFFF", "font-size": "12pt"},
+        )
+        for curve in self.curves.values():
+            self.plot_widget.removeItem(curve)
+        self.curves = {}
+        self.channel_list.blockSignals(True)
+        self.channel_list.clear()
+        for i in range(info["channels"]):
+            item = QListWidgetItem(f"Channel {i}")
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if i == 0 else Qt.Unchecked)
+            self.channel_list.addItem(item)
+        self.channel_list.blockSignals(False)
+        self.update_channels()
+
+    def update_channels(self):
+        self.channels = [
+            i
+            for i in range(self.channel_list.count())
+            if self.channel_list.item(i).checkState() == Qt.Checked
+        ]
+        count = self.channel_list.count()
+        for i, curve in self.curves.items():
+            curve.setVisible(i in self.channels)
+        for i in self.channels:
+            if i not in self.curves:
+                self.curves[i] = self.plot_widget.plot(
+                    [],
+                    [],
+                    pen=make_pen(pg.intColor(i, count), 1, self.render_mode),
+                    **curve_options(self.render_mode),
+                )
+        self.redraw()
+
+    def schedule_redraw(self):
+        # Range and resize signals arrive in bursts while panning; they
+        # are coalesced into one redraw per event loop pass
+        if not self._redraw_pending:
+            self._redraw_pending = True
+            QTimer.singleShot(0, self.redraw)
+
+    def redraw(self):
+        self._redraw_pending = False
+        if not self.channels:
+            return
+        start = time.perf_counter()
+        rate = self.lod.streams[self.stream]["rate"]
+        total = int(self.starts[-1])
+        x0, x1 = self.view.viewRange()[0]
+        first = min(max(int(x0 * rate), 0), total)
+        last = min(max(math.ceil(x1 * rate) + 1, first + 1), total)
+        pixels = max(int(self.view.width()), 1)
+        level = choose_level(last - first, pixels, self.lod.top)
+        blocks = self.block_range(first, last)
+        if level < self.lod.base and len(blocks) <= self.RAW_BLOCKS:
+            t, y = self.raw(blocks)
+            self.level_label.setText("Raw samples")
+        else:
+            level = max(level, self.lod.base)
+            t, y = self.envelope(level, first, last)
+            self.level_label.setText(f"Level {level}: {1 << level} samples per bin")
+        for row, i in enumerate(self.channels):
+            self.curves[i].setData(t, y[row])
+        self.redraw_time = time.perf_counter() - start
+
+    def block_range(self, first, last):
+        """Blocks holding samples first..last of the current stream."""
+        k0 = max(int(np.searchsorted(self.starts, first, "right")) - 1, 0)
+        k1 = int(np.searchsorted(self.starts, last, "left"))
+        return range(k0, min(k1, len(self.recording)))
+
+    def envelope(self, level, first, last):
+        """Times and interleaved (min, max) values of the bins of a range."""
+        size = 1 << level
+        b0 = first >> level
+        bins = self.lod.range(
+            self.stream, level, b0, ((last - 1) >> level) + 1, self.channels
+        )
+        n = bins.shape[2]
+        y = np.empty((len(self.channels), 2 * n), dtype=np.float32)
+        y[:, 0::2] = bins[0]
+        y[:, 1::2] = bins[1]
+        y *= self.lod.streams[self.stream]["scale"]
+        rate = self.lod.streams[self.stream]["rate"]
+        t = ((b0 + np.arange(n)) * size).repeat(2) / rate
+        return t, y
+
+    def raw(self, blocks):
+        """Times and values of the samples of `blocks`."""
+        index = self.indices[self.stream][self.channels]
+        rate = self.lod.streams[self.stream]["rate"]
+        times, values = [], []
+        for k in blocks:
+            samples = np.take(self.block(k), index)
+            times.append((self.starts[k] + np.arange(samples.shape[1])) / rate)
+            values.append(samples)
+        y = np.concatenate(values, axis=1).astype(np.float32)
+        y *= self.lod.streams[self.stream]["scale"]
+        return np.concatenate(times), y
+
+    def block(self, k):
+        """Decoded block k, from a small LRU cache."""
+        block = self._blocks.pop(k, None)
+        if block is None:
+            block = self.recording.block(k)
+        self._blocks[k] = block
+        while len(self._blocks) > 2 * self.RAW_BLOCKS:
+            self._blocks.popitem(last=False)
+        return block
+
+    def closeEvent(self, event):
+        self.lod.close()
+        self.recording.close()
+        super().closeEvent(event)
+
+
+def record_session(path, seconds, probes):
+    """Record `seconds` of EMG-like blocks, with a 5 s gap halfway, to `path`."""
+    from utils.acquisition_profile import AcquisitionProfile
+    from utils.recording import Recorder, emg_like_blocks
+
+    profile = AcquisitionProfile(probe_types=probes)
+    blocks = emg_like_blocks(profile.layout(), 16)
+    recorder = Recorder(path, profile).start()
+    for k in range(seconds):
+        # Stay within the recorder's queue
+        while k - len(recorder.offsets) >= recorder.queue.maxlen // 2:
+            time.sleep(0.005)
+        recorder.write_block(blocks[k % len(blocks)])
+        if k == seconds // 2:
+            recorder.write_gap(5 * profile.aux_rate)
+    recorder.close()
+
+
+def benchmark(seconds=3600, channels=8, redraws=20, path="/tmp/review.nvrec"):
+    """
+    ms per redraw (range change, setData and a synchronous repaint) of
+    `channels` channels at several zoom levels over `seconds` of one
+    70-channel input at 2 kHz: [(visible s, source, mean ms, max ms)].
+    """
+    record_session(path, seconds, [5] + [0] * 9)
+    window = ReviewWindow(path)
+    window.resize(1500, 800)
+    window.show()
+    window.stream_combo.setCurrentIndex(window.stream_combo.findData(1))
+    for i in range(1, channels):
+        window.channel_list.item(i).setCheckState(Qt.Checked)
+    QApplication.processEvents()
+    rng = np.random.default_rng(0)
+    results = []
+    for visible in (window.duration, 600, 60, 10, 2):
+        if visible > window.duration:
+            continue
+        elapsed = []
+        for _ in range(redraws):
+            x0 = rng.uniform(0, window.duration - visible)
+            start = time.perf_counter()
+            window.view.setXRange(x0, x0 + visible, padding=0)
+            window.redraw()
+            window.plot_widget.repaint()
+            elapsed.append(time.perf_counter() - start)
+        source = window.level_label.text().split(":")[0]
+        results.append((visible, source, np.mean(elapsed) * 1e3, max(elapsed) * 1e3))
+    window.close()
+    os.remove(path)
+    os.remove(lod_path(path))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Review a recording")
+    parser.add_argument("path", nargs="?", help="recording (.nvrec)")
+    parser.add_argument("--benchmark", action="store_true")
+    args = parser.parse_args()
+    app = QApplication(sys.argv)
+    if args.benchmark:
+        print(f"{'visible (s)':>12} {'source':>12} {'mean (ms)':>10} {'max (ms)':>9}")
+        for visible, source, mean, worst in benchmark():
+            print(f"{visible:>12.0f} {source:>12} {mean:>10.1f} {worst:>9.1f}")
+        sys.exit(0)
+    path = args.path
+    if path is None:
+        path, _ = QFileDialog.getOpenFileName(
+            None, "Review", "", "Recordings (*.nvrec)"
+        )
+        if not path:
+            sys.exit(0)
+    window = ReviewWindow(path)
+    window.show()
+    sys.exit(app.exec_())
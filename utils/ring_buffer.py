@@ -0,0 +1,154 @@
+import time
+
+import numpy as np
+
+
+class ChannelRingBuffer:
+    """
+    Fixed-capacity history of (channels, samples) chunks.
+
+    Storage is the capacity plus `slack` samples so the newest samples are
+    always one contiguous view; once the write position reaches the end,
+    the retained samples are moved back to the front (amortised O(1) per
+    sample). With int16 storage the raw counts are kept and `scale` is
+    applied lazily by values().
+    """
+
+    def __init__(self, channels, capacity, dtype=np.float32, scale=1.0, slack=None):
+        self.channels = channels
+        self.capacity = int(capacity)
+        self.dtype = np.dtype(dtype)
+        self.scale = np.float32(scale)
+        if slack is None:
+            slack = max(self.capacity // 2, 1)
+        self._data = np.zeros((channels, self.capacity + slack), dtype=self.dtype)
+        self._end = 0
+        self._count = 0
+        # Samples appended since creation; used to place data on a time axis
+        self.total = 0
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        self._end = 0
+        self._count = 0
+        self.total = 0
+
+    def append(self, chunk):
+        n = chunk.shape[1]
+        if n >= self.capacity:
+            self._data[:, : self.capacity] = chunk[:, -self.capacity :]
+            self._end = self.capacity
+            self._count = self.capacity
+            self.total += n
+            return
+        if self._end + n > self._data.shape[1]:
+            keep = min(self._count, self.capacity - n)
+            self._data[:, :keep] = self._data[:, self._end - keep : self._end]
+            self._end = keep
+            self._count = keep
+        self._data[:, self._end : self._end + n] = chunk
+        self._end += n
+        self._count = min(self._count + n, self.capacity)
+        self.total += n
+
+    def view(self, n=None, channel=None):
+        """
+        Newest `n` samples as a view in storage dtype: shape (channels, n),
+        or (n,) when a single channel is given.
+        """
+        n = self._count if n is None else min(n, self._count)
+        data = self._data if channel is None else self._data[channel]
+        return data[..., self._end - n : self._end]
+
+    def values(self, n=None, channel=None):
+        """Newest `n` samples as float32 in physical units."""
+        data = self.view(n, channel)
+        if self.dtype == np.float32 and self.scale == 1:
+            return data
+        return np.multiply(data, self.scale, dtype=np.float32)
+
+
+class TrailBuffer:
+    """
+    Preallocated (time, channels) trail with O(1) append. view() returns
+    contiguous views suitable for setData; decimated() thins the trail to
+    at most `max_points` samples (always keeping the newest one).
+    """
+
+    def __init__(self, capacity, channels):
+        self.times = ChannelRingBuffer(1, capacity, np.float64)
+        self.data = ChannelRingBuffer(channels, capacity, np.float32)
+
+    def __len__(self):
+        return len(self.times)
+
+    def clear(self):
+        self.times.clear()
+        self.data.clear()
+
+    def append(self, t, values):
+        """Append one sample (scalar t, (channels,) values) or a chunk."""
+        t = np.asarray(t, dtype=np.float64).reshape(1, -1)
+        values = np.asarray(values, dtype=np.float32)
+        self.times.append(t)
+        self.data.append(values.reshape(values.shape[0], -1))
+
+    def view(self):
+        return self.times.view(channel=0), self.data.view()
+
+    def decimated(self, max_points):
+        t, data = self.view()
+        n = len(t)
+        if max_points <= 0 or n <= max_points:
+            return t, data
+        step = -(-n // max_points)
+        start = (n - 1) % step
+        return t[start::step], data[:, start::step]
+
+
+def benchmark_trail(sizes=(1000, 2500, 5000, 10000), channels=16, ticks=200):
+    """
+    Per-tick cost of the old list trail (append, pop(0), np.array) versus
+    TrailBuffer, measured once the trail holds `size` samples.
+    """
+    results = []
+    for size in sizes:
+        values = np.random.rand(channels)
+
+        data_list, time_list = [], []
+        for k in range(size):
+            data_list.append(values)
+            time_list.append(k * 0.05)
+        start = time.perf_counter()
+        for k in range(ticks):
+            data_list.append(values)
+            time_list.append(k * 0.05)
+            if len(data_list) > size:
+                data_list.pop(0)
+                time_list.pop(0)
+            data_array = np.array(data_list)
+            np.array(time_list)
+            for i in range(channels):
+                data_array[:, i]
+        t_list = (time.perf_counter() - start) / ticks
+
+        trail = TrailBuffer(size, channels)
+        for k in range(size):
+            trail.append(k * 0.05, values)
+        start = time.perf_counter()
+        for k in range(ticks):
+            trail.append(k * 0.05, values)
+            t, data = trail.decimated(2000)
+            for i in range(channels):
+                data[i]
+        t_trail = (time.perf_counter() - start) / ticks
+        results.append((size, t_list, t_trail))
+    return results
+
+
+if __name__ == "__main__":
+    print(f"{'trail':>6} {'lists (us/tick)':>16} {'TrailBuffer (us/tick)':>22}")
+    for size, t_list, t_trail in benchmark_trail():
+        print(f"{size:>6} {t_list * 1e6:>16.1f} {t_trail * 1e6:>22.1f}")
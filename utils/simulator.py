@@ -0,0 +1,208 @@
+import socket
+import threading
+import time
+
+import numpy as np
+
+from utils.acquisition_profile import (
+    ACCESSORY_ROWS,
+    AcquisitionProfile,
+    FRAMES_PER_SECOND,
+    aux_gather_index,
+)
+
+# Accessory row carrying the simulated frame counter
+COUNTER_ROW = 0
+
+
+def default_force(t):
+    """
+    Default AUX signals in volts for sample times t (s): channel 0 steps
+    between 0 and 1 V every 2 s, the rest is low-level noise.
+    """
+    aux = np.random.normal(0.0, 0.002, (16, len(t)))
+    aux[0] += (np.floor(t / 2.0) % 2).astype(np.float64)
+    return aux
+
+
+def settings_reply(probes):
+    """The 20-byte settings reply of a device with ChVsType indices `probes`."""
+    return bytes([1] + list(probes) + [0] * 8 + [0])
+
+
+def simulated_frames(config, first_frame, columns, force_fn=default_force):
+    """
+    Raw bytes for `columns` frames of layout `config` starting at
+    `first_frame`, as NovecentoSimulator streams them: AUX rows from
+    `force_fn(t)`, noise on EMG rows and the frame counter. Needs no
+    socket, for generating blocks offline.
+    """
+    P = config["PacketSize1Block"]
+    block = np.zeros((P, columns), dtype="<i2", order="F")
+    flat = block.reshape(-1, order="F")
+
+    # EMG rows: small noise
+    emg_rows = config["Ptr_IN"][10]
+    if emg_rows:
+        block[:emg_rows] = np.random.normal(0, 200, (emg_rows, columns))
+
+    # AUX rows, scattered with the same index plan the decoder gathers with
+    index = aux_gather_index(config["Ptr_IN"][10], P, config["SizeAux"], columns)
+    rate = config["FsampVal"][config["FSelAux"]]
+    n = index.shape[1]
+    t = (first_frame * rate // FRAMES_PER_SECOND + np.arange(n)) / rate
+    counts = np.clip(np.round(force_fn(t) / config["AuxGainFactor"]), -32768, 32767)
+    flat[index] = counts.astype(np.int16)
+
+    # Frame counter in the accessory trailer
+    block[P - ACCESSORY_ROWS + COUNTER_ROW] = (
+        ((first_frame + np.arange(columns)) % 65536).astype(np.uint16).view(np.int16)
+    )
+    return block.tobytes(order="F")
+
+
+class NovecentoSimulator:
+    """
+    Local TCP stand-in for the Novecento. Answers the 2-byte requests
+    (1: settings, 2: firmware, 3: battery) with 20-byte replies, starts
+    streaming on a configuration string with the top bit set and stops on
+    an all-zero one. Frames are sent in real time, `frames_per_packet`
+    columns at a time, with AUX rows from `force_fn(t)` (volts, shape
+    (16, n)), noise on EMG rows and a frame counter in accessory row
+    COUNTER_ROW.
+
+    Attributes after streaming starts:
+      - stream_start : time.monotonic() of frame 0
+    """
+
+    def __init__(
+        self,
+        profile=None,
+        probes=None,
+        host="127.0.0.1",
+        port=0,
+        force_fn=default_force,
+        frames_per_packet=10,
+    ):
+        self.profile = profile if profile is not None else AcquisitionProfile()
+        self.probes = list(probes if probes is not None else self.profile.probe_types)
+        self.force_fn = force_fn
+        self.frames_per_packet = frames_per_packet
+        self.stream_start = None
+        self.frames_sent = 0
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(1)
+        self.host, self.port = self._server.getsockname()
+        self._running = False
+        self._thread = None
+        self._client = None
+
+    def settings_reply(self):
+        return settings_reply(self.probes)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self.drop_client()
+        try:
+            self._server.close()
+        except OSError:
+            pass
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def drop_client(self):
+        """Close the current connection abruptly (simulated link loss)."""
+        client, self._client = self._client, None
+        if client is not None:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            client.close()
+
+    def _serve(self):
+        while self._running:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                break
+            self._client = client
+            try:
+                self._handle(client)
+            except OSError:
+                pass
+            finally:
+                if self._client is client:
+                    self.drop_client()
+
+    def _recv_exact(self, client, n):
+        data = b""
+        while len(data) < n:
+            part = client.recv(n - len(data))
+            if not part:
+                raise OSError("client closed")
+            data += part
+        return data
+
+    def _handle(self, client):
+        streaming = False
+        client.settimeout(0.0)
+        while self._running and self._client is client:
+            try:
+                first = client.recv(1)
+                if not first:
+                    return
+                client.settimeout(1.0)
+                if first[0] in (1, 2, 3):
+                    self._recv_exact(client, 1)
+                    reply = (
+                        self.settings_reply()
+                        if first[0] == 1
+                        else bytes([first[0], 1, 0, 100] + [0] * 16)
+                    )
+                    client.sendall(reply)
+                else:
+                    self._recv_exact(client, 14)
+                    streaming = bool(first[0] & 0x80)
+                    if streaming:
+                        self.stream_start = time.monotonic()
+                        self.frames_sent = 0
+                client.settimeout(0.0)
+            except BlockingIOError:
+                pass
+            if streaming:
+                self._send_due_frames(client)
+            else:
+                time.sleep(0.001)
+
+    def _send_due_frames(self, client):
+        config = self.profile.layout(self.settings_reply())
+        due = int((time.monotonic() - self.stream_start) * FRAMES_PER_SECOND)
+        if due < self.frames_sent + self.frames_per_packet:
+            time.sleep(0.001)
+            return
+        columns = self.frames_per_packet
+        client.sendall(self.frames(config, self.frames_sent, columns))
+        self.frames_sent += columns
+
+    def frames(self, config, first_frame, columns):
+        """Raw bytes for `columns` frames starting at `first_frame`."""
+        return simulated_frames(config, first_frame, columns, self.force_fn)
+
+
+if __name__ == "__main__":
+    sim = NovecentoSimulator(port=23456).start()
+    print(f"Simulating Novecento on {sim.host}:{sim.port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        sim.stop()
@@ -0,0 +1,151 @@
+"""
+Spectral fatigue monitoring: median (MDF) and mean (MNF) power frequency
+per channel over sliding windows.
+
+    python -m utils.spectral
+
+prints the cost per window and channel for several window lengths.
+"""
+
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from utils.block_queue import BlockQueue
+
+
+class SpectralStage:
+    """
+    Batched spectral estimates on a stream of (channels, n) chunks. All
+    complete windows of `window` seconds, `hop` seconds apart, are taken
+    as one strided (channels, windows, nfft) view, detrended, tapered with
+    a Hann window and transformed by a single np.fft.rfft call. process()
+    returns (times, mdf, mnf): window end times in seconds since the first
+    sample, and (channels, windows) frequencies in Hz. Qt-free.
+
+    Cost per window and channel is roughly linear in nfft: about 10 us for
+    0.25 s, 20 us for 0.5 s and 40 us for 1 s windows at 2 kHz
+    (`python -m utils.spectral`), i.e. about 5 ms per second for 64
+    channels with 0.5 s windows and 50% overlap.
+    """
+
+    def __init__(self, channels, sample_rate, window=0.5, hop=0.25):
+        self.channels = channels
+        self.sample_rate = float(sample_rate)
+        self.nfft = int(window * sample_rate)
+        self.hop = max(int(hop * sample_rate), 1)
+        self.taper = np.hanning(self.nfft).astype(np.float32)
+        self.freqs = np.fft.rfftfreq(self.nfft, 1.0 / self.sample_rate).astype(
+            np.float32
+        )
+        self.reset()
+
+    def reset(self):
+        self._pending = np.zeros((self.channels, 0), dtype=np.float32)
+        # Stream index of the first pending sample
+        self._offset = 0
+
+    def process(self, chunk):
+        pending = np.concatenate([self._pending, chunk.astype(np.float32)], axis=1)
+        n = pending.shape[1]
+        if n < self.nfft:
+            self._pending = pending
+            empty = np.zeros((self.channels, 0), dtype=np.float32)
+            return np.zeros(0), empty, empty
+
+        windows = 1 + (n - self.nfft) // self.hop
+        frames = sliding_window_view(pending, self.nfft, axis=1)[
+            :, : (windows - 1) * self.hop + 1 : self.hop
+        ]
+        frames = frames - frames.mean(axis=2, keepdims=True)
+        frames *= self.taper
+        power = np.abs(np.fft.rfft(frames, axis=2)) ** 2
+        power[..., 0] = 0
+
+        total = power.sum(axis=2)
+        total[total == 0] = np.inf
+        mnf = (power @ self.freqs) / total
+        cumulative = np.cumsum(power, axis=2)
+        median_bin = np.argmax(cumulative >= cumulative[..., -1:] / 2, axis=2)
+        mdf = self.freqs[median_bin]
+
+        ends = self._offset + self.nfft + np.arange(windows) * self.hop
+        times = ends / self.sample_rate
+        consumed = windows * self.hop
+        self._pending = pending[:, consumed:].copy()
+        self._offset += consumed
+        return times, mdf, mnf.astype(np.float32)
+
+
+class SpectralWorker(QThread):
+    """
+    Runs a SpectralStage on its own thread. push() may be called from any
+    thread (e.g. connected to DAQReceiver.emg_received with a direct
+    connection); every `interval` seconds the windows completed since the
+    last publish are emitted as results(times, mdf, mnf). Nothing is
+    emitted when no window completed.
+    """
+
+    results = pyqtSignal(np.ndarray, np.ndarray, np.ndarray)
+
+    def __init__(
+        self, channels, sample_rate, window=0.5, hop=0.25, interval=0.5, parent=None
+    ):
+        super().__init__(parent)
+        self.stage = SpectralStage(channels, sample_rate, window, hop)
+        self.interval = interval
+        self.queue = BlockQueue(maxlen=64)
+        self.running = False
+
+    def push(self, samples):
+        self.queue.put(samples)
+
+    def run(self):
+        self.running = True
+        next_publish = time.monotonic() + self.interval
+        while self.running:
+            delay = next_publish - time.monotonic()
+            if delay > 0:
+                time.sleep(min(delay, 0.05))
+                continue
+            next_publish += self.interval
+            times, mdf, mnf = [], [], []
+            for _, samples in self.queue.drain():
+                t, d, m = self.stage.process(samples)
+                if len(t):
+                    times.append(t)
+                    mdf.append(d)
+                    mnf.append(m)
+            if times:
+                self.results.emit(
+                    np.concatenate(times),
+                    np.concatenate(mdf, axis=1),
+                    np.concatenate(mnf, axis=1),
+                )
+
+    def stop(self):
+        self.running = False
+
+
+def benchmark(channels=64, rate=2000, seconds=10.0, windows=(0.25, 0.5, 1.0)):
+    """(window s, nfft, seconds per window and channel) for each window."""
+    data = np.random.normal(0, 1, (channels, int(seconds * rate))).astype(np.float32)
+    results = []
+    for window in windows:
+        stage = SpectralStage(channels, rate, window, window / 2)
+        start = time.perf_counter()
+        times, _, _ = stage.process(data)
+        elapsed = time.perf_counter() - start
+        results.append((window, stage.nfft, elapsed / (len(times) * channels)))
+    return results
+
+
+if __name__ == "__main__":
+    print("64 channels at 2 kHz, 50% overlap:")
+    for window, nfft, cost in benchmark():
+        print(
+            f"  window {window:4.2f} s (nfft {nfft:4d}): "
+            f"{cost * 1e6:6.2f} us per window and channel"
+        )
@@ -0,0 +1,148 @@
+"""
+Stacked multi-channel view: every channel of a (channels, samples) array
+drawn by one PlotCurveItem, channel k shifted up by k * spacing.
+
+    QT_QPA_PLATFORM=offscreen python -m utils.stacked_view
+
+compares separate curves against one StackedCurve per frame for 16, 64
+and 128 channels.
+"""
+
+import time
+
+import numpy as np
+import pyqtgraph as pg
+
+from utils.decimation import decimated_times, decimation_plan, minmax_decimate
+from utils.render_mode import curve_options, make_pen, make_plot_widget
+
+
+class StackedCurve(pg.PlotCurveItem):
+    """
+    One path for all channels. Channels are separated by a NaN break (one
+    extra column after each channel, drawn with connect="finite"), so a
+    single setData and paint pass covers every channel. Inputs longer than
+    `max_points` samples are reduced to per-bin min/max pairs, which keeps
+    peaks visible; by default `max_points` is the pixel width of the view,
+    i.e. one min/max pair per two pixels.
+
+    x and y are preallocated per (channels, samples) shape and reused
+    between frames.
+    """
+
+    def __init__(self, spacing=1.0, max_points=None, pen=None):
+        super().__init__(
+            pen=pen if pen is not None else pg.mkPen(width=1),
+            connect="finite",
+            skipFiniteCheck=True,
+        )
+        self.spacing = float(spacing)
+        self.max_points = max_points
+        self._shape = None
+
+    def _point_budget(self):
+        if self.max_points is not None:
+            return max(int(self.max_points), 2)
+        view = self.getViewBox()
+        width = view.width() if view is not None else 0
+        return max(int(width), 2) if width > 0 else 1000
+
+    def _prepare(self, channels, samples, max_points):
+        step, start = decimation_plan(samples, max_points)
+        points = samples if step == 1 else 2 * ((samples - start) // step)
+        self._shape = (channels, samples, max_points)
+        self._times = None
+        self._x = np.empty((channels, points + 1), dtype=np.float32)
+        self._x[:, -1] = np.nan
+        self._y = np.full((channels, points + 1), np.nan, dtype=np.float32)
+
+    def set_stacked(self, data, x=None, sample_rate=1.0, t0=0.0):
+        """
+        Draw (channels, samples) `data` at the sample times `x` (e.g. a
+        DisplayFrame's x), or at t0 + k / sample_rate when x is None.
+        """
+        channels, samples = data.shape
+        if samples == 0:
+            self.setData([], [])
+            return
+        max_points = self._point_budget()
+        if self._shape != (channels, samples, max_points):
+            self._prepare(channels, samples, max_points)
+        y = self._y[:, :-1]
+        reduced, step, start = minmax_decimate(data, max_points, out=y)
+        if reduced is not y:
+            y[:] = reduced
+        y += (np.arange(channels, dtype=np.float32) * np.float32(self.spacing))[:, None]
+        if x is None:
+            if self._times is None or self._times[0] != sample_rate:
+                t = decimated_times(samples, step, start, sample_rate)
+                self._times = (sample_rate, t)
+            np.add(self._times[1], np.float32(t0), out=self._x[:, :-1])
+        elif step == 1:
+            self._x[:, :-1] = x
+        else:
+            # Each min/max pair is drawn at the time of its bin's first sample
+            end = start + (samples - start) // step * step
+            self._x[:, :-1] = x[start:end:step].repeat(2)
+        self.setData(self._x.ravel(), self._y.ravel())
+
+    def offsets(self, channels):
+        """Vertical offset of each of `channels` stacked channels."""
+        return np.arange(channels) * self.spacing
+
+
+def set_channel_ticks(plot_widget, names, spacing):
+    """Label the left axis with one tick per stacked channel."""
+    ticks = [(k * spacing, name) for k, name in enumerate(names)]
+    plot_widget.getPlotItem().getAxis("left").setTicks([ticks, []])
+
+
+def frame_times(channels=128, samples=4000, frames=60, stacked=True):
+    """Seconds per update + synchronous repaint of `channels` channels."""
+    widget = make_plot_widget("fast")
+    widget.resize(1000, 800)
+    data = np.random.normal(0, 0.2, (channels, samples + frames)).astype(np.float32)
+    if stacked:
+        curve = StackedCurve(spacing=1.0)
+        widget.addItem(curve)
+    else:
+        offsets = np.arange(channels, dtype=np.float32)[:, None]
+        data += offsets
+        curves = [
+            widget.plot(
+                [],
+                [],
+                pen=make_pen(pg.intColor(i, channels), 1, "fast"),
+                **curve_options("fast"),
+            )
+            for i in range(channels)
+        ]
+        x = np.arange(samples, dtype=np.float32) / np.float32(2000)
+    widget.show()
+    pg.QtWidgets.QApplication.processEvents()
+
+    times = []
+    for f in range(frames):
+        start = time.perf_counter()
+        if stacked:
+            curve.set_stacked(data[:, f : f + samples], sample_rate=2000.0)
+        else:
+            for i, c in enumerate(curves):
+                c.setData(x, data[i, f : f + samples])
+        widget.viewport().repaint()
+        times.append(time.perf_counter() - start)
+    widget.close()
+    return times
+
+
+if __name__ == "__main__":
+    app = pg.mkQApp()
+    for channels in (16, 64, 128):
+        for stacked in (False, True):
+            times = frame_times(channels, stacked=stacked)
+            label = "one stacked curve" if stacked else "separate curves"
+            print(
+                f"{channels:4d} channels, {label:>17}: "
+                f"median {np.median(times) * 1e3:6.1f} ms/frame "
+                f"({1 / np.median(times):5.0f} FPS)"
+            )
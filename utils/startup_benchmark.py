@@ -0,0 +1,116 @@
+"""
+Startup-time benchmark for main.py.
+
+    python -m utils.startup_benchmark
+
+Prints the `python -X importtime` breakdown of the top-level imports done
+before the first window is shown, and the time from process launch to the
+first painted frame of MVCWindow. Works headless with
+QT_QPA_PLATFORM=offscreen. Each timed run is a child process started with
+--probe, which wraps main.main() and quits after the first paint, so
+main.py itself carries no benchmark code.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_breakdown(module="main"):
+    """(cumulative_us, name) for each module imported directly by `module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # importtime indents each nesting level by two spaces
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        if level == 1 and cumulative.strip().isdigit():
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)
+
+
+def imports_module(name, module="main"):
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys, {module}; print({name!r} in sys.modules)"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip() == "True"
+
+
+def run_probed():
+    """
+    Run main.main() with an application-wide event filter that prints
+    FIRST_FRAME and quits once the first widget is painted.
+    """
+    from PyQt5.QtCore import QEvent, QObject, QTimer
+
+    import main
+
+    class FirstFrameProbe(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint:
+                app = main.QApplication.instance()
+                app.removeEventFilter(self)
+                print("FIRST_FRAME", flush=True)
+                QTimer.singleShot(0, app.quit)
+            return False
+
+    class ProbedApplication(main.QApplication):
+        def __init__(self, argv):
+            super().__init__(argv)
+            self.probe = FirstFrameProbe()
+            self.installEventFilter(self.probe)
+
+    main.QApplication = ProbedApplication
+    sys.argv = [os.path.join(ROOT, "main.py")]
+    main.main()
+
+
+def time_to_first_frame(repeats=5):
+    """Seconds from launching main.py to its first painted frame."""
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "utils.startup_benchmark", "--probe"],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        for line in proc.stdout:
+            if line.startswith("FIRST_FRAME"):
+                times.append(time.perf_counter() - start)
+                break
+        proc.wait(timeout=30)
+    return times
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--probe"]:
+        run_probed()
+    print("Top-level imports of main.py (cumulative):")
+    for cumulative, name in import_breakdown()[:10]:
+        print(f"  {cumulative / 1e3:8.1f} ms  {name}")
+    print(f"pyqtgraph imported by main.py: {imports_module('pyqtgraph')}")
+    times = time_to_first_frame()
+    print(
+        f"Time to first frame: median {statistics.median(times) * 1e3:.0f} ms "
+        f"(min {min(times) * 1e3:.0f} ms over {len(times)} runs)"
+    )
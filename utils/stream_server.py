@@ -0,0 +1,500 @@
+"""
+Re-publishing of the live sample streams to other local processes.
+
+    python -m utils.stream_server
+
+measures delivery to dozens of localhost subscribers, with one that never
+reads and gets dropped.
+"""
+
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from utils.acquisition_profile import stream_indices, stream_rate
+
+STREAM_MAGIC = b"NV"
+# magic, kind, stream, dtype code, channels, samples (payload bytes for
+# KIND_INFO), index of the first sample in the stream
+_FRAME_HEADER = struct.Struct("<2sBBBxHIQ")
+# Data: (channels, samples) array, C order, little-endian. Gap: `samples`
+# samples were lost, no payload. Info: JSON payload describing the streams.
+KIND_DATA, KIND_GAP, KIND_INFO = 0, 1, 2
+DTYPES = (np.dtype("<i2"), np.dtype("<f4"), np.dtype("<f8"))
+_DTYPE_CODES = {dtype: code for code, dtype in enumerate(DTYPES)}
+# Longest subscription line a client may send
+MAX_SUBSCRIPTION = 65536
+
+
+def encode_frame(stream, seq, samples):
+    """Header and payload of a data frame of (channels, n) samples."""
+    samples = np.ascontiguousarray(samples)
+    code = _DTYPE_CODES[samples.dtype.newbyteorder("<")]
+    channels, n = samples.shape
+    header = _FRAME_HEADER.pack(STREAM_MAGIC, KIND_DATA, stream, code, channels, n, seq)
+    return header + samples.astype(DTYPES[code], copy=False).tobytes()
+
+
+def _encode_gap(stream, seq, lost):
+    return _FRAME_HEADER.pack(STREAM_MAGIC, KIND_GAP, stream, 0, 0, lost, seq)
+
+
+def _encode_info(info):
+    payload = json.dumps(info).encode()
+    header = _FRAME_HEADER.pack(STREAM_MAGIC, KIND_INFO, 0, 0, 0, len(payload), 0)
+    return header + payload
+
+
+class _Subscriber:
+    """
+    One connected client: its stream/channel selection and a queue of
+    encoded frames, sent by the client's own thread. The queue is bounded
+    in bytes; put() returns False once it would overflow.
+    """
+
+    def __init__(self, server, sock):
+        self.server = server
+        self.sock = sock
+        # None: every stream; otherwise {stream: None (all channels) or
+        # tuple of channels}
+        self.streams = None
+        self.sent = 0
+        self._pending = deque()
+        self._pending_bytes = 0
+        self._cond = threading.Condition()
+        self._alive = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def wants(self, stream):
+        return self.streams is None or stream in self.streams
+
+    def channels(self, stream):
+        return None if self.streams is None else self.streams[stream]
+
+    def put(self, frame):
+        with self._cond:
+            if not self._alive:
+                return True
+            if self._pending_bytes + len(frame) > self.server.max_pending:
+                return False
+            self._pending.append(frame)
+            self._pending_bytes += len(frame)
+            self._cond.notify()
+        return True
+
+    def close(self):
+        with self._cond:
+            self._alive = False
+            self._pending.clear()
+            self._cond.notify()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def _subscribe(self):
+        """Read the client's JSON subscription line."""
+        self.sock.settimeout(self.server.handshake_timeout)
+        line = b""
+        while not line.endswith(b"\n"):
+            part = self.sock.recv(MAX_SUBSCRIPTION - len(line))
+            if not part or len(line) + len(part) >= MAX_SUBSCRIPTION:
+                raise OSError("no subscription")
+            line += part
+        request = json.loads(line) or {}
+        streams = request.get("streams")
+        if streams is not None:
+            self.streams = {
+                int(stream): None if channels is None else tuple(map(int, channels))
+                for stream, channels in streams.items()
+            }
+        self.sock.settimeout(None)
+
+    def _run(self):
+        try:
+            self._subscribe()
+        except (OSError, ValueError, TypeError, AttributeError):
+            self.close()
+            return
+        self.server._register(self)
+        while True:
+            with self._cond:
+                while self._alive and not self._pending:
+                    self._cond.wait()
+                if not self._alive:
+                    return
+                # Everything queued goes out in one send
+                frames = list(self._pending)
+                self._pending.clear()
+                self._pending_bytes = 0
+            data = frames[0] if len(frames) == 1 else b"".join(frames)
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.server._drop(self, slow=False)
+                return
+            self.sent += len(data)
+
+
+class StreamServer:
+    """
+    Re-publishes decoded sample streams over TCP (host, port) or, with
+    `path`, a Unix socket, so other processes can follow the acquisition.
+    publish(), publish_input() and mark_gap() match the DAQReceiver's
+    data_received, emg_received and stream_gap signals and are meant to be
+    connected with Qt.DirectConnection; set_layout() announces the streams'
+    channels, rates and scales to the clients.
+
+    A client connects, sends one JSON line, e.g. {"streams": {"0": [0, 1]}}
+    for AUX channels 0 and 1 only ({} for everything), and then receives
+    frames: a _FRAME_HEADER followed by its payload (see StreamClient).
+    Stream 0 is AUX, stream i + 1 EMG input i. Blocks shorter than
+    `batch_samples` are held back and sent together, until they add up or
+    the oldest is `max_delay` s old (checked on every publish). Each frame
+    is encoded once per distinct channel selection and queued for every
+    client; a client whose queue would exceed `max_pending` bytes is
+    disconnected and counted in `dropped_clients`, so a stalled reader
+    never holds up the others or the receiver.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        path=None,
+        batch_samples=256,
+        max_delay=0.05,
+        max_pending=8 * 1024 * 1024,
+        handshake_timeout=2.0,
+    ):
+        self.batch_samples = batch_samples
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.handshake_timeout = handshake_timeout
+        self.path = path
+        if path is not None:
+            if os.path.exists(path):
+                os.unlink(path)
+            self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._server.bind(path)
+            self.address = path
+        else:
+            self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._server.bind((host, port))
+            self.address = self._server.getsockname()
+        self._server.listen(64)
+        self.info = {"streams": {}}
+        self.dropped_clients = 0
+        self._clients = []
+        self._lock = threading.Lock()
+        # stream: [arrays, samples, time.monotonic() of the first]
+        self._batches = {}
+        # stream: samples published so far, gaps included
+        self._counters = {}
+        self._running = False
+        self._thread = None
+
+    @property
+    def clients(self):
+        return len(self._clients)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        try:
+            # Closing alone does not wake the accept() of _serve on Linux
+            self._server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._server.close()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        with self._lock:
+            self._flush_all()
+            clients, self._clients = self._clients, []
+        for client in clients:
+            # Let queued frames go out before the connection is closed
+            deadline = time.monotonic() + 1.0
+            while client._pending and time.monotonic() < deadline:
+                time.sleep(0.005)
+            client.close()
+        if self.path is not None and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def set_layout(self, daq_config, sample_scale=1.0):
+        """
+        Describe the streams of a block layout to current and future
+        clients. `sample_scale` converts published AUX samples to volts
+        (the profile's sample_scale); EMG samples are published scaled.
+        """
+        streams = {}
+        for stream, index in stream_indices(daq_config, 1).items():
+            streams[str(stream)] = {
+                "channels": int(index.shape[0]),
+                "rate": stream_rate(daq_config, stream),
+                "scale": sample_scale if stream == 0 else 1.0,
+            }
+        frame = _encode_info({"streams": streams})
+        with self._lock:
+            self.info = {"streams": streams}
+            self._broadcast(frame, None)
+
+    def publish(self, samples):
+        self.publish_stream(0, samples)
+
+    def publish_input(self, index, samples):
+        self.publish_stream(index + 1, samples)
+
+    def publish_stream(self, stream, samples):
+        """Queue (channels, n) samples of a stream for the clients."""
+        now = time.monotonic()
+        with self._lock:
+            batch = self._batches.get(stream)
+            if batch is not None and (
+                batch[0][0].shape[0] != samples.shape[0]
+                or batch[0][0].dtype != samples.dtype
+            ):
+                self._flush(stream)
+                batch = None
+            if batch is None:
+                batch = self._batches[stream] = [[], 0, now]
+            batch[0].append(samples)
+            batch[1] += samples.shape[1]
+            if batch[1] >= self.batch_samples:
+                self._flush(stream)
+            for other, (_, _, started) in list(self._batches.items()):
+                if now - started >= self.max_delay:
+                    self._flush(other)
+
+    def mark_gap(self, lost_samples, skipped_bytes=0):
+        """
+        Tell the clients that `lost_samples` AUX samples (and as long a
+        stretch of every EMG stream) were lost.
+        """
+        if lost_samples <= 0:
+            return
+        streams = self.info["streams"]
+        aux_rate = streams.get("0", {}).get("rate")
+        with self._lock:
+            self._flush_all()
+            for stream in self._counters:
+                if stream == 0:
+                    lost = lost_samples
+                elif aux_rate and str(stream) in streams:
+                    lost = round(lost_samples * streams[str(stream)]["rate"] / aux_rate)
+                else:
+                    continue
+                seq = self._counters[stream]
+                self._counters[stream] = seq + lost
+                self._broadcast(_encode_gap(stream, seq, lost), stream)
+
+    def flush(self):
+        with self._lock:
+            self._flush_all()
+
+    def _flush_all(self):
+        for stream in list(self._batches):
+            self._flush(stream)
+
+    def _flush(self, stream):
+        arrays, n, _ = self._batches.pop(stream)
+        samples = arrays[0] if len(arrays) == 1 else np.concatenate(arrays, axis=1)
+        seq = self._counters.get(stream, 0)
+        self._counters[stream] = seq + n
+        frames = {}
+        for client in list(self._clients):
+            if not client.wants(stream):
+                continue
+            channels = client.channels(stream)
+            if channels is not None:
+                channels = tuple(c for c in channels if c < samples.shape[0])
+            frame = frames.get(channels)
+            if frame is None:
+                selected = samples if channels is None else samples[list(channels)]
+                frame = frames[channels] = encode_frame(stream, seq, selected)
+            if not client.put(frame):
+                self._drop(client, slow=True, locked=True)
+
+    def _broadcast(self, frame, stream):
+        for client in list(self._clients):
+            if (stream is None or client.wants(stream)) and not client.put(frame):
+                self._drop(client, slow=True, locked=True)
+
+    def _register(self, client):
+        frame = _encode_info(self.info)
+        with self._lock:
+            if not self._running:
+                client.close()
+                return
+            client.put(frame)
+            self._clients.append(client)
+
+    def _drop(self, client, slow, locked=False):
+        if not locked:
+            with self._lock:
+                return self._drop(client, slow, locked=True)
+        if client in self._clients:
+            self._clients.remove(client)
+            if slow:
+                self.dropped_clients += 1
+        client.close()
+
+    def _serve(self):
+        while self._running:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                break
+            if sock.family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            _Subscriber(self, sock).thread.start()
+
+
+class StreamClient:
+    """
+    Subscriber of a StreamServer. `address` is (host, port) or a Unix
+    socket path; `streams` selects streams and channels as in the
+    subscription line ({stream: None or [channels]}, None for all). read()
+    returns the next frame as (kind, stream, seq, value): a (channels, n)
+    array for KIND_DATA, the lost sample count for KIND_GAP and the stream
+    description for KIND_INFO, which is also kept in `info`.
+    """
+
+    def __init__(self, address, streams=None, timeout=5.0):
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        request = {}
+        if streams is not None:
+            request["streams"] = {
+                str(stream): None if channels is None else list(channels)
+                for stream, channels in streams.items()
+            }
+        self.sock.sendall(json.dumps(request).encode() + b"\n")
+        self.info = {}
+        self._header = bytearray(_FRAME_HEADER.size)
+
+    def read(self):
+        self._recv_into(memoryview(self._header))
+        magic, kind, stream, code, channels, samples, seq = _FRAME_HEADER.unpack(
+            self._header
+        )
+        if magic != STREAM_MAGIC:
+            raise OSError("stream out of sync")
+        if kind == KIND_GAP:
+            return kind, stream, seq, samples
+        if kind == KIND_INFO:
+            payload = bytearray(samples)
+            self._recv_into(memoryview(payload))
+            self.info = json.loads(payload)
+            return kind, stream, seq, self.info
+        data = np.empty((channels, samples), dtype=DTYPES[code])
+        self._recv_into(memoryview(data.reshape(-1).view(np.uint8)))
+        return kind, stream, seq, data
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.read()
+            except OSError:
+                return
+
+    def close(self):
+        self.sock.close()
+
+    def _recv_into(self, view):
+        while len(view):
+            n = self.sock.recv_into(view)
+            if not n:
+                raise OSError("server closed")
+            view = view[n:]
+
+
+def benchmark(subscribers=32, seconds=3.0, block=(16, 100), rate=500):
+    """
+    Publish (16, 100) float32 blocks at `rate` blocks/s for `seconds` to
+    `subscribers` TCP clients reading every stream, plus one that connects
+    and never reads. Returns (samples published per channel, per-client
+    samples received, median and max s from publishing a frame's first
+    block to its receipt, dropped clients).
+    """
+    server = StreamServer(max_pending=2 * 1024 * 1024).start()
+    sent_at = {}
+    received = [0] * subscribers
+    latencies = []
+    lock = threading.Lock()
+
+    def follow(k, client):
+        for kind, _, seq, data in client:
+            if kind != KIND_DATA:
+                continue
+            now = time.perf_counter()
+            received[k] += data.shape[1]
+            if k == 0:
+                with lock:
+                    latencies.append(now - sent_at[seq])
+
+    clients = [StreamClient(server.address) for _ in range(subscribers)]
+    stalled = StreamClient(server.address)
+    stalled.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    threads = [
+        threading.Thread(target=follow, args=(k, c), daemon=True)
+        for k, c in enumerate(clients)
+    ]
+    for t in threads:
+        t.start()
+    while server.clients < subscribers + 1:
+        time.sleep(0.01)
+
+    data = np.random.default_rng(0).normal(size=block).astype(np.float32)
+    total = 0
+    start = time.perf_counter()
+    for k in range(int(seconds * rate)):
+        due = start + k / rate
+        while time.perf_counter() < due:
+            time.sleep(0.0002)
+        with lock:
+            # Frames are numbered by their first sample
+            sent_at[total] = time.perf_counter()
+        server.publish(data)
+        total += block[1]
+    server.flush()
+    time.sleep(0.5)
+    server.stop()
+    for t in threads:
+        t.join(timeout=2)
+    for client in clients + [stalled]:
+        client.close()
+    latencies.sort()
+    return (
+        total,
+        received,
+        latencies[len(latencies) // 2],
+        latencies[-1],
+        server.dropped_clients,
+    )
+
+
+if __name__ == "__main__":
+    subscribers = 32
+    total, received, median, worst, dropped = benchmark(subscribers)
+    print(f"{subscribers} subscribers + 1 stalled, {total} samples x 16 channels")
+    print(
+        f"received per subscriber: {min(received)}..{max(received)} samples; "
+        f"latency median {median * 1e3:.2f} ms, max {worst * 1e3:.2f} ms; "
+        f"dropped clients: {dropped}"
+    )